@@ -2,11 +2,13 @@
 cd ../devops/docker-compose && \
 #SET TEST_MODE to YES
 sleep 6s && export TEST_MODE=YES && \
-#start auth-server
-docker-compose up -d auth-server
+#start db-worker (creates and migrates the tables) and auth-server
+docker-compose up -d db-worker auth-server
+#wait the db-worker migration (the worker is ready after create_tables)
+for i in $(seq 1 30); do docker-compose logs db-worker | grep -q ' ready\.' && break; sleep 2s; done
 
-#Run TEST
-docker exec -it auth-fastapi-2_auth-server_1 pytest tests
+#Run TEST (the query plans tests use the compose database)
+docker exec -it auth-fastapi-2_auth-server_1 sh -c 'TEST_DATABASE_URI=$DATABASE_URI pytest tests'
 
 #Stop and delete container
 docker-compose down
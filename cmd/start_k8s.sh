@@ -17,5 +17,6 @@ minikube image load auth-fastapi-2_db-worker && \
 cd ../../devops/kubernetes && \
 kubectl create namespace auth-namespace && \
 helm install -n auth-namespace db-worker base-app --values values_db-worker.yaml && \
+helm install -n auth-namespace db-worker-beat base-app --values values_db-worker-beat.yaml && \
 helm install -n auth-namespace email-worker base-app --values values_email-worker.yaml && \
 helm install -n auth-namespace auth-server base-app --values values_auth-server.yaml
\ No newline at end of file
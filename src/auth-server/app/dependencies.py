@@ -1,28 +1,30 @@
-import aioredis
 from fastapi import Request, Depends, HTTPException
 #adapters
-from app.internal.adapter.cache import CACHE_URI
-from app.internal.adapter.database import SessionLocal, TransactionProcessor
+from app.internal.adapter.cache import (CACHE_URI, SessionCache, GroupPermissionsCache, get_cache_client, 
+	get_cache_pool_stats, get_group_permissions_cache_stats)
+from app.internal.adapter.database import (SessionLocal, ReadSession, TransactionProcessor, get_transaction_publisher_stats,
+	get_audit_log_publisher_stats, get_database_pool_stats)
 from app.internal.adapter.cruds import (UserCRUD, RandomCRUD, GroupCRUD, 
 	PermissionCRUD, UserPermissionCRUD, UserGroupCRUD, GroupPermissionCRUD, LogCRUD,
 	SessionCRUD)
-from app.internal.adapter.auth import EmailSender, TokenGenerator, PasswordHasher
+from app.internal.adapter.auth import (EmailSender, TokenGenerator, PasswordHasher,
+	get_password_hasher_stats, get_token_cache_stats)
 #managers
 from app.internal.domain.managers import (UserManager, RandomManager, PermissionManager,
 	GroupManager, UserPermissionManager, UserGroupManager, GroupPermissionManager, LogManager,
 	SessionManager)
 #services
-from app.internal.application.authorization import CheckAuthorizationService
+from app.internal.application.authorization import CheckAuthorizationService, CheckAuthorizationBatchService
 from app.internal.application.services import (SignupService, CompleteSignupService, 
 	AuthenticationService, RefreshTokenService, RegenerateSignupRandomService, 
 	RegeneratePasswordRandomService, ForgetPasswordService, RestaurePasswordService, 
 	SetPasswordService, SetEmailService, CompleteSetEmailService, RegenerateEmailRandomService,
 	LogoutService, GetUserDataService, SetUsernameService)
 from app.internal.application.admin import(UserCRUDService, PermissionCRUDService, 
-	GroupCRUDService, PermissionGrantService, GroupGrantService, SessionManagementService)
+	GroupCRUDService, PermissionGrantService, GroupGrantService, SessionManagementService, ExportService)
 #others
 from app.internal import warnings as war
-from app.internal.settings import RANDOM_EXP, TEST_MODE
+from app.internal.settings import RANDOM_EXP, TEST_MODE, PASSWORD_HASHER
 # Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
@@ -42,22 +44,56 @@ async def _get_db_session():
 			async with asession.begin():
 				yield asession
 
+def _get_read_db_session():
+	#the auth services only read, the writes are published to the db-worker
+	if TEST_MODE: return None
+	return ReadSession()
+
+
+def _get_cache_session():
+	#all requests share the same connection pool
+	if TEST_MODE or CACHE_URI is None: return None
+	return get_cache_client()
+
+
+#_____________________TOKEN_GENERATOR__________________________________#
+
+#the token generator is stateless and the keys are parsed once, so all requests share it
+_token_generator = TokenGenerator()
 
-async def _get_cache_session():
-	if TEST_MODE: yield None
-	else:
-		redis = aioredis.Redis.from_url(CACHE_URI)
-		async with redis.client() as asession:
-			yield asession
+
+#_____________________CACHES___________________________________________#
+
+def _get_session_cache(cache_session):
+	#without CACHE_URI, the sessions are only saved on database
+	if cache_session is None and not TEST_MODE: return None
+	return SessionCache(cache_session)
+
+def _get_group_permissions_cache(cache_session):
+	#the cache is on memory, the redis session is used to publish the invalidations
+	return GroupPermissionsCache(cache_session)
 
 
 #_____________________INTRA_SERVICE___________________________________#
 
+#_______METRICS_________#
+#async, the database pool queue belongs to the event loop
+async def get_metrics():
+	return {'password_hasher': get_password_hasher_stats(), 'cache_pool': get_cache_pool_stats(),
+		'token_cache': get_token_cache_stats(), 'group_permissions_cache': get_group_permissions_cache_stats(),
+		'transaction_publisher': get_transaction_publisher_stats(), 'audit_log_publisher': get_audit_log_publisher_stats(),
+		'database_pool': get_database_pool_stats()}
+
+
 #_______CHECK_AUTHORIZATION_SERVICE_________#
 def get_check_authorization_service():
-	token_generator = TokenGenerator()
+	token_generator = _token_generator
 	return CheckAuthorizationService(token_generator)
 
+def get_check_authorization_batch_service():
+	token_generator = _token_generator
+	return CheckAuthorizationBatchService(token_generator)
+
 def _check_authorization(access_token: str, permissions:list, groups:list):
 	service = get_check_authorization_service()
 	return service.start_service({'access_token':access_token, 'permissions':permissions, 'groups':groups})
@@ -140,35 +176,35 @@ def _check_read_own_user_data_permission(token:str =Depends(_get_token_from_head
 #__________________________SERVICES_DEPENDENCES______________________________#
 
 #________AUTHENTICATION_SERVICE__________#
-def get_authentication_service(asession=Depends(_get_db_session)):
+def get_authentication_service(asession=Depends(_get_read_db_session), cache_session=Depends(_get_cache_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
 	transaction_processor = TransactionProcessor(asession)
 	user_manager = UserManager(log_manager, UserCRUD(asession), password_hasher)
 	user_permission_manager = UserPermissionManager(log_manager, UserPermissionCRUD(asession))
-	user_group_manager = UserGroupManager(log_manager, UserGroupCRUD(asession))
-	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession))
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
-	token_generator = TokenGenerator()
+	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession),
+		_get_group_permissions_cache(cache_session))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
+	token_generator = _token_generator
 
 	return AuthenticationService(transaction_processor, user_manager, user_permission_manager, 
-		user_group_manager, group_permission_manager, session_manager, token_generator, password_hasher)
+		group_permission_manager, session_manager, token_generator, password_hasher)
 
 
 #_________REFRESH_TOKEN_SERVICE_________#
-def get_refresh_token_service(asession=Depends(_get_db_session)):
+def get_refresh_token_service(asession=Depends(_get_read_db_session), cache_session=Depends(_get_cache_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
-	token_generator = TokenGenerator()
+	token_generator = _token_generator
 	transaction_processor = TransactionProcessor(asession)
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
 
 	return RefreshTokenService(transaction_processor, session_manager, token_generator)
 
 
 #________SIGNUP_SERVICE_________________#
-def get_signup_service(asession=Depends(_get_db_session)):
+def get_signup_service(asession=Depends(_get_read_db_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
@@ -183,7 +219,7 @@ def get_signup_service(asession=Depends(_get_db_session)):
 
 
 #________COMPLETE_SIGNUP_SERVICE________#
-def get_complete_signup_service(asession=Depends(_get_db_session)):
+def get_complete_signup_service(asession=Depends(_get_read_db_session), cache_session=Depends(_get_cache_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 	
 	password_hasher = PasswordHasher()
@@ -191,17 +227,17 @@ def get_complete_signup_service(asession=Depends(_get_db_session)):
 	user_manager = UserManager(log_manager, UserCRUD(asession), password_hasher)
 	random_manager = RandomManager(log_manager, RandomCRUD(asession), RANDOM_EXP)
 	user_permission_manager = UserPermissionManager(log_manager, UserPermissionCRUD(asession))
-	user_group_manager = UserGroupManager(log_manager, UserGroupCRUD(asession))
-	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession))
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
-	token_generator = TokenGenerator()
+	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession),
+		_get_group_permissions_cache(cache_session))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
+	token_generator = _token_generator
 
 	return CompleteSignupService(transaction_processor, user_manager, random_manager, user_permission_manager,
-		user_group_manager, group_permission_manager, session_manager, token_generator, password_hasher)
+		group_permission_manager, session_manager, token_generator, password_hasher)
 
 
 #________REGENERATE_SIGNUP_RANDOM_SERVICE__________#
-def get_regenerate_signup_random_service(asession=Depends(_get_db_session)):
+def get_regenerate_signup_random_service(asession=Depends(_get_read_db_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
@@ -215,7 +251,7 @@ def get_regenerate_signup_random_service(asession=Depends(_get_db_session)):
 
 
 #________REGENERATE_PASSWORD_RANDOM_SERVICE__________#
-def get_regenerate_password_random_service(asession=Depends(_get_db_session)):
+def get_regenerate_password_random_service(asession=Depends(_get_read_db_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
@@ -229,7 +265,7 @@ def get_regenerate_password_random_service(asession=Depends(_get_db_session)):
 
 
 #________FORGET_PASSWORD_SERVICE__________#
-def get_forget_password_service(asession=Depends(_get_db_session)):
+def get_forget_password_service(asession=Depends(_get_read_db_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
@@ -243,7 +279,7 @@ def get_forget_password_service(asession=Depends(_get_db_session)):
 
 
 #_______RESTAURE_PASSWORD_SERVICE__________#
-def get_restaure_password_service(asession=Depends(_get_db_session)):
+def get_restaure_password_service(asession=Depends(_get_read_db_session)):
 	log_manager = LogManager(None, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
@@ -255,7 +291,7 @@ def get_restaure_password_service(asession=Depends(_get_db_session)):
 
 
 #_______SET_PASSWORD_SERVICE__________#
-def get_set_password_service(auth:dict = Depends(_check_set_password_permission), asession=Depends(_get_db_session)):
+def get_set_password_service(auth:dict = Depends(_check_set_password_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 
@@ -267,7 +303,7 @@ def get_set_password_service(auth:dict = Depends(_check_set_password_permission)
 
 
 #_______SET_EMAIL_SERVICE_____________#
-def get_set_email_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_db_session)):
+def get_set_email_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 
@@ -282,7 +318,7 @@ def get_set_email_service(auth:dict = Depends(_check_set_email_permission), ases
 
 
 #_______COMPLETE_SET_EMAIL_SERVICE_____________#
-def get_complete_set_email_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_db_session)):
+def get_complete_set_email_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 
@@ -296,7 +332,7 @@ def get_complete_set_email_service(auth:dict = Depends(_check_set_email_permissi
 
 
 #________REGENERATE_EMAIL_RANDOM_SERVICE__________#
-def get_regenerate_email_random_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_db_session)):
+def get_regenerate_email_random_service(auth:dict = Depends(_check_set_email_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 
@@ -311,7 +347,8 @@ def get_regenerate_email_random_service(auth:dict = Depends(_check_set_email_per
 
 
 #____________LOGOUT_SERVICE________________#
-def get_logout_service(auth:dict = Depends(_check_logout_permission), asession=Depends(_get_db_session)):
+def get_logout_service(auth:dict = Depends(_check_logout_permission), asession=Depends(_get_read_db_session),
+	cache_session=Depends(_get_cache_session)):
 	user_id = auth['user_id']
 	session_id = auth['session_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
@@ -319,14 +356,14 @@ def get_logout_service(auth:dict = Depends(_check_logout_permission), asession=D
 	password_hasher = PasswordHasher()
 	transaction_processor = TransactionProcessor(asession)
 	user_manager = UserManager(log_manager, UserCRUD(asession), password_hasher)
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
 
 	return LogoutService(user_id, session_id, transaction_processor, 
 		user_manager, session_manager)
 
 
 #____________GET_USER_DATA_SERVICE________________#
-def get_user_data_service(auth:dict = Depends(_check_read_own_user_data_permission), asession=Depends(_get_db_session)):
+def get_user_data_service(auth:dict = Depends(_check_read_own_user_data_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
@@ -342,7 +379,7 @@ def get_user_data_service(auth:dict = Depends(_check_read_own_user_data_permissi
 
 
 #____________SET_USERNAME_SERVICE________________#
-def get_set_username_service(auth:dict = Depends(_check_set_username_permission), asession=Depends(_get_db_session)):
+def get_set_username_service(auth:dict = Depends(_check_set_username_permission), asession=Depends(_get_read_db_session)):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
@@ -358,7 +395,7 @@ def get_set_username_service(auth:dict = Depends(_check_set_username_permission)
 
 #___________USER_CRUD_SERVICE___________#
 
-def _get_user_crud_service(auth:dict, asession):
+def _get_user_crud_service(auth:dict, asession, cache_session=None):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
@@ -368,11 +405,14 @@ def _get_user_crud_service(auth:dict, asession):
 	random_manager = RandomManager(log_manager, RandomCRUD(asession), RANDOM_EXP)
 	user_permission_manager = UserPermissionManager(log_manager, UserPermissionCRUD(asession))
 	user_group_manager = UserGroupManager(log_manager, UserGroupCRUD(asession))
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
 	email_sender = EmailSender()
 
+	#the bulk creates use only half of the password hasher, the others requests use the rest
+	bulk_hash_concurrency = max(1, PASSWORD_HASHER['MAX_CONCURRENCY']//2)
+
 	return UserCRUDService(user_id, transaction_processor, user_manager, random_manager, 
-		user_permission_manager, user_group_manager, session_manager, email_sender)
+		user_permission_manager, user_group_manager, session_manager, email_sender, bulk_hash_concurrency)
 
 def get_create_user_service(auth:dict = Depends(_check_create_user_permission), asession=Depends(_get_db_session)):
 	return _get_user_crud_service(auth, asession)
@@ -383,60 +423,69 @@ def get_read_user_service(auth:dict = Depends(_check_read_user_permission), ases
 def get_update_user_service(auth:dict = Depends(_check_update_user_permission), asession=Depends(_get_db_session)):
 	return _get_user_crud_service(auth, asession)
 
-def get_delete_user_service(auth:dict = Depends(_check_delete_user_permission), asession=Depends(_get_db_session)):
-	return _get_user_crud_service(auth, asession)
+def get_delete_user_service(auth:dict = Depends(_check_delete_user_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_user_crud_service(auth, asession, cache_session)
 
 
 #__________PERMISSION_CRUD_SERVICE____________#
-def _get_permission_crud_service(auth:dict, asession):
+def _get_permission_crud_service(auth:dict, asession, cache_session):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
 	transaction_processor = TransactionProcessor(asession)
 	permission_manager = PermissionManager(log_manager, PermissionCRUD(asession))
 	user_permission_manager = UserPermissionManager(log_manager, UserPermissionCRUD(asession))
-	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession))
+	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession),
+		_get_group_permissions_cache(cache_session))
 
 	return PermissionCRUDService(user_id, transaction_processor, permission_manager, 
 		user_permission_manager, group_permission_manager)
 
-def get_create_permission_service(auth:dict = Depends(_check_create_permission_permission), asession=Depends(_get_db_session)):
-	return _get_permission_crud_service(auth, asession)
+def get_create_permission_service(auth:dict = Depends(_check_create_permission_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_permission_crud_service(auth, asession, cache_session)
 
-def get_read_permission_service(auth:dict = Depends(_check_read_permission_permission), asession=Depends(_get_db_session)):
-	return _get_permission_crud_service(auth, asession)
+def get_read_permission_service(auth:dict = Depends(_check_read_permission_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_permission_crud_service(auth, asession, cache_session)
 
-def get_delete_permission_service(auth:dict = Depends(_check_delete_permission_permission), asession=Depends(_get_db_session)):
-	return _get_permission_crud_service(auth, asession)
+def get_delete_permission_service(auth:dict = Depends(_check_delete_permission_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_permission_crud_service(auth, asession, cache_session)
 
 
 #________GROUP_CRUD_SERVICE________#
-def _get_group_crud_service(auth:dict, asession):
+def _get_group_crud_service(auth:dict, asession, cache_session):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
 	transaction_processor = TransactionProcessor(asession)
 	group_manager = GroupManager(log_manager, GroupCRUD(asession))
 	user_group_manager = UserGroupManager(log_manager, UserGroupCRUD(asession))
-	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession))
+	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession),
+		_get_group_permissions_cache(cache_session))
 
 	return GroupCRUDService(user_id, transaction_processor, group_manager, 
 		user_group_manager, group_permission_manager)
 
-def get_create_group_service(auth:dict = Depends(_check_create_group_permission), asession=Depends(_get_db_session)):
-	return _get_group_crud_service(auth, asession)
+def get_create_group_service(auth:dict = Depends(_check_create_group_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_group_crud_service(auth, asession, cache_session)
 
-def get_read_group_service(auth:dict = Depends(_check_read_group_permission), asession=Depends(_get_db_session)):
-	return _get_group_crud_service(auth, asession)
+def get_read_group_service(auth:dict = Depends(_check_read_group_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_group_crud_service(auth, asession, cache_session)
 
-def get_delete_group_service(auth:dict = Depends(_check_delete_group_permission), asession=Depends(_get_db_session)):
-	return _get_group_crud_service(auth, asession)
+def get_delete_group_service(auth:dict = Depends(_check_delete_group_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_group_crud_service(auth, asession, cache_session)
 
 
 #________________________OTHERS_ADMIN_SERVICES_DEPENDENCES______________________________#
 
 #________PERMISSION_GRANT_SERVICE________#
-def _get_permission_grant_service(auth:dict, asession):
+def _get_permission_grant_service(auth:dict, asession, cache_session):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 	
@@ -446,16 +495,19 @@ def _get_permission_grant_service(auth:dict, asession):
 	group_manager = GroupManager(log_manager, GroupCRUD(asession))
 	user_manager = UserManager(log_manager, UserCRUD(asession), password_hasher)
 	user_permission_manager = UserPermissionManager(log_manager, UserPermissionCRUD(asession))
-	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession))
+	group_permission_manager = GroupPermissionManager(log_manager, GroupPermissionCRUD(asession),
+		_get_group_permissions_cache(cache_session))
 
 	return PermissionGrantService(user_id, transaction_processor, permission_manager, 
 		group_manager, user_manager, user_permission_manager, group_permission_manager)
 
-def get_grant_permission_service(auth:dict = Depends(_check_grant_permission_to_permission), asession=Depends(_get_db_session)):
-	return _get_permission_grant_service(auth, asession)
+def get_grant_permission_service(auth:dict = Depends(_check_grant_permission_to_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_permission_grant_service(auth, asession, cache_session)
 
-def get_remove_permission_service(auth:dict = Depends(_check_remove_permission_from_permission), asession=Depends(_get_db_session)):
-	return _get_permission_grant_service(auth, asession)
+def get_remove_permission_service(auth:dict = Depends(_check_remove_permission_from_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_permission_grant_service(auth, asession, cache_session)
 
 
 #________GROUP_GRANT_SERVICE________#
@@ -480,17 +532,34 @@ def get_remove_user_from_group_service(auth:dict = Depends(_check_remove_user_fr
 
 
 #____________SESSION_MANAGEMENT_SERVICE________________#
-def _get_session_management_service(auth:dict, asession):
+def _get_session_management_service(auth:dict, asession, cache_session):
 	user_id = auth['user_id']
 	log_manager = LogManager(user_id, LogCRUD(asession))
 
 	password_hasher = PasswordHasher()
 	transaction_processor = TransactionProcessor(asession)
 	user_manager = UserManager(log_manager, UserCRUD(asession), password_hasher)
-	session_manager = SessionManager(log_manager, SessionCRUD(asession))
+	session_manager = SessionManager(log_manager, SessionCRUD(asession), _get_session_cache(cache_session))
 
 	return SessionManagementService(user_id, transaction_processor, user_manager, 
 		session_manager)
 
-def get_delete_session_service(auth:dict = Depends(_check_delete_session_permission), asession=Depends(_get_db_session)):
-	return _get_session_management_service(auth, asession)
\ No newline at end of file
+def get_delete_session_service(auth:dict = Depends(_check_delete_session_permission), asession=Depends(_get_db_session),
+	cache_session=Depends(_get_cache_session)):
+	return _get_session_management_service(auth, asession, cache_session)
+
+
+#____________________EXPORT_SERVICES________________________#
+#the exports don't return the users passwords and salts
+_EXPORT_USER_FIELDS = ('id', 'email', 'username', 'is_complete', 'created', 'updated')
+_EXPORT_SESSION_FIELDS = ('session_id', 'user_id', 'expirated', 'created', 'updated')
+_EXPORT_LOG_FIELDS = ('id', 'user_id', 'object_type', 'object_id', 'action', 'message', 'created')
+
+def get_export_users_service(auth:dict = Depends(_check_read_user_permission), asession=Depends(_get_db_session)):
+	return ExportService(UserManager(None, UserCRUD(asession), None), _EXPORT_USER_FIELDS)
+
+def get_export_sessions_service(auth:dict = Depends(_check_admin_permission), asession=Depends(_get_db_session)):
+	return ExportService(SessionManager(None, SessionCRUD(asession)), _EXPORT_SESSION_FIELDS)
+
+def get_export_logs_service(auth:dict = Depends(_check_admin_permission), asession=Depends(_get_db_session)):
+	return ExportService(LogManager(None, LogCRUD(asession)), _EXPORT_LOG_FIELDS)
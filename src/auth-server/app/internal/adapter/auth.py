@@ -1,7 +1,14 @@
+import abc
 import uuid
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 #jwt
-from jose import jwt, JWTError
-from jose.exceptions import ExpiredSignatureError
+from jose import jwt, jwk, JWTError
+from jose.exceptions import ExpiredSignatureError, JWKError
 #password hash
 from passlib.context import CryptContext
 from passlib.exc import UnknownHashError
@@ -9,14 +16,16 @@ from datetime import datetime, timedelta
 #Adapters Interfaces
 from .interfaces import EmailSenderInterface, PasswordHasherInterface, TokenGeneratorInterface
 #celery
-from .tasks_celery import send_signup_email, send_password_forget_email, send_set_email
+from .tasks_celery import send_signup_email, send_signup_emails, send_password_forget_email, send_set_email
 #others
-from app.internal.settings import AUTH, TEST_MODE
+from app.internal.settings import AUTH, PASSWORD_HASHER, TEST_MODE
 from app.internal import warnings as war
 from app.internal.validators import ToEncodeValidator, DecodedValidator
 from app.internal.exceptions import AuthServerException, HTTPExceptionGenerator
 #AES
 from Crypto.Cipher import AES
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 from base64 import b64encode, b64decode
@@ -32,8 +41,11 @@ _SECRET_KEY = AUTH['SECRET_KEY']
 
 _ACCESS_TOKEN_EXP = int(AUTH['ACCESS_TOKEN_EXP'])
 _REFRESH_TOKEN_EXP = int(AUTH['REFRESH_TOKEN_EXP'])
+_TOKEN_CACHE_SIZE = int(AUTH['TOKEN_CACHE_SIZE'])
+_JWT_BACKEND = AUTH['JWT_BACKEND']
+_TOKEN_ENVELOPE = AUTH['TOKEN_ENVELOPE']
 
-#AES_CBC
+#AES
 _SECRET_KEY_encoded = _SECRET_KEY.encode()
 
 
@@ -72,28 +84,235 @@ def _hash_password(password:str):
     return _pwd_context.hash(password)
 
 
+class _HashWorkerPool():
+	"""
+	Runs the bcrypt operations on a thread or process pool, to not block the event loop.
+	Only max_concurrency operations are submitted at the same time, the others wait on queue.
+	"""
+	def __init__(self, pool_type:str, max_workers:int, max_concurrency:int):
+		self._pool_type = pool_type
+		self._max_workers = max_workers
+		self._max_concurrency = max_concurrency
+		self._executor = None
+		self._semaphore = None
+		self._loop = None
+		#metrics
+		self._waiting = 0
+		self._running = 0
+		self._completed = 0
+
+	def _get_executor(self):
+		if self._executor is None:
+			if self._pool_type == 'process':
+				self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+			else: self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+				thread_name_prefix='password_hasher')
+		return self._executor
+
+	def _get_semaphore(self, loop):
+		#the semaphore is bound to the loop that created it
+		if self._semaphore is None or self._loop is not loop:
+			self._semaphore = asyncio.Semaphore(self._max_concurrency)
+			self._loop = loop
+		return self._semaphore
+
+	async def run(self, function, *args):
+		loop = asyncio.get_running_loop()
+		semaphore = self._get_semaphore(loop)
+
+		self._waiting+=1
+		try: await semaphore.acquire()
+		finally: self._waiting-=1
+
+		self._running+=1
+		try: return await loop.run_in_executor(self._get_executor(), function, *args)
+		finally:
+			self._running-=1
+			self._completed+=1
+			semaphore.release()
+
+	def get_stats(self):
+		return {'pool_type':self._pool_type, 'max_workers':self._max_workers,
+			'max_concurrency':self._max_concurrency, 'waiting':self._waiting,
+			'running':self._running, 'completed':self._completed}
+
+	def shutdown(self):
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+			self._executor = None
+
+
+_hash_worker_pool = _HashWorkerPool(PASSWORD_HASHER['POOL_TYPE'],
+	PASSWORD_HASHER['MAX_WORKERS'], PASSWORD_HASHER['MAX_CONCURRENCY'])
+
+def get_password_hasher_stats():
+	return _hash_worker_pool.get_stats()
+
+def shutdown_password_hasher():
+	_hash_worker_pool.shutdown()
+
+
 #_________________________AES_ENCRYPTION________________________________#
 
-def _encrypt_AES(plaintext:str, is_access_token:bool, key_bytes=_SECRET_KEY_encoded):
+"""
+Envelopes:
+	cbc (old): base64(iv[16] + AES_CBC(pkcs7(jwt)))
+	gcm (v1): 'v1.' + base64(nonce[12] + AES_GCM(jwt) + tag[16])
+The base64 alphabet has no '.', so the version prefix never matches a cbc token.
+The cbc tokens are still accepted, to not invalidate the tokens created before the migration.
+"""
+_GCM_PREFIX = 'v1.'
+_GCM_NONCE_SIZE = 12
+_GCM_TAG_SIZE = 16
+
+
+def _token_decrypt_exception(is_access_token:bool):
+	if is_access_token: return _token_invalid_exception('access_token')
+	return _token_invalid_exception('refresh_token')
+
+
+#____CBC____#
+
+def _encrypt_AES_CBC(plaintext:str, key_bytes=_SECRET_KEY_encoded):
 	iv= get_random_bytes(16) #generate
 	cipher = AES.new(key_bytes, AES.MODE_CBC, iv)
 	return b64encode(iv+cipher.encrypt(pad(plaintext.encode(),16))).decode()
 
-def _decrypt_AES(ciphertext:str, is_access_token:bool, key_bytes=_SECRET_KEY_encoded):
+def _decrypt_AES_CBC(ciphertext:str, key_bytes=_SECRET_KEY_encoded):
+	cipherbytes = b64decode(ciphertext.encode())
+	iv = cipherbytes[0:16]
+	cipherbytes = cipherbytes[16:]
+	cipher = AES.new(key_bytes, AES.MODE_CBC, iv)
+	return unpad(cipher.decrypt(cipherbytes),16).decode()
+
+
+#____GCM____#
+
+#uses cryptography (OpenSSL, AES-NI), the key schedule is created once
+_aes_gcm = AESGCM(_SECRET_KEY_encoded)
+
+def _encrypt_AES_GCM(plaintext:str, aes_gcm:AESGCM=_aes_gcm):
+	nonce = get_random_bytes(_GCM_NONCE_SIZE)
+	#the returned ciphertext ends with the tag
+	return _GCM_PREFIX+b64encode(nonce+aes_gcm.encrypt(nonce, plaintext.encode(), None)).decode()
+
+def _decrypt_AES_GCM(ciphertext:str, aes_gcm:AESGCM=_aes_gcm):
+	#memoryview slices, the nonce and ciphertext are not copied
+	envelope = memoryview(b64decode(ciphertext[len(_GCM_PREFIX):]))
+	if len(envelope) <= _GCM_NONCE_SIZE+_GCM_TAG_SIZE: raise ValueError('envelope too short')
+	#authenticate and decrypt on one pass
+	try: return aes_gcm.decrypt(envelope[:_GCM_NONCE_SIZE], envelope[_GCM_NONCE_SIZE:], None).decode()
+	except InvalidTag: raise ValueError('invalid tag')
+
+
+def _encrypt_AES(plaintext:str, is_access_token:bool, envelope:str=_TOKEN_ENVELOPE):
+	if envelope == 'gcm': return _encrypt_AES_GCM(plaintext)
+	return _encrypt_AES_CBC(plaintext)
+
+def _decrypt_AES(ciphertext:str, is_access_token:bool):
 	try:
-		cipherbytes = b64decode(ciphertext.encode())
-		iv = cipherbytes[0:16]
-		cipherbytes = cipherbytes[16:]
-		cipher = AES.new(key_bytes, AES.MODE_CBC, iv)
-		return unpad(cipher.decrypt(cipherbytes),16).decode()
-	except:
-		if is_access_token: raise _token_invalid_exception('access_token')
-		else: raise _token_invalid_exception('refresh_token')
+		if ciphertext.startswith(_GCM_PREFIX): return _decrypt_AES_GCM(ciphertext)
+		return _decrypt_AES_CBC(ciphertext)
+	#binascii.Error (base64), MAC check, padding and utf-8 errors are ValueError
+	except ValueError: raise _token_decrypt_exception(is_access_token)
 
 
 
 #______________________________JWT______________________________________#
 
+#____BACKENDS____#
+
+class _ExpiredTokenError(Exception):
+	pass
+
+class _InvalidTokenError(Exception):
+	pass
+
+
+class _JWTBackend(abc.ABC):
+	"""
+	Signs and verifies the JWTs. The keys are parsed once on init, so the key
+	string (PEM for RS256) is not parsed on every call.
+	"""
+	name=None
+
+	def __init__(self, algorithm:str, private_key:str, public_key:str):
+		self._algorithm = algorithm
+		self._signing_key = self._prepare_key(private_key, 'PRIVATE_KEY')
+		self._verifying_key = self._prepare_key(public_key, 'PUBLIC_KEY')
+
+	@abc.abstractmethod
+	def _prepare_key(self, key:str, env_name:str):
+		#raise ValueError if the key is invalid
+		pass
+
+	@abc.abstractmethod
+	def encode(self, claims:dict):
+		pass
+
+	@abc.abstractmethod
+	def decode(self, token:str):
+		#raise _ExpiredTokenError or _InvalidTokenError
+		pass
+
+
+class _JoseBackend(_JWTBackend):
+	"""
+	Signs and verifies with python-jose, jose reuses the parsed Key object.
+	"""
+	name='jose'
+
+	def _prepare_key(self, key:str, env_name:str):
+		try: return jwk.construct(key, self._algorithm)
+		except JWKError: raise ValueError('The ENV '+env_name+' value is invalid')
+
+	def encode(self, claims:dict):
+		return jwt.encode(claims, self._signing_key, algorithm=self._algorithm)
+
+	def decode(self, token:str):
+		try: return jwt.decode(token, self._verifying_key, algorithms=[self._algorithm])
+		except ExpiredSignatureError: raise _ExpiredTokenError()
+		except JWTError: raise _InvalidTokenError()
+
+
+class _PyJWTBackend(_JWTBackend):
+	"""
+	Signs and verifies with PyJWT (cryptography backend), the claims are encoded
+	the same way of python-jose (exp as timestamp), so the tokens are compatible.
+	"""
+	name='pyjwt'
+
+	def __init__(self, algorithm:str, private_key:str, public_key:str):
+		#only imported if selected
+		import jwt as pyjwt
+		from jwt.algorithms import get_default_algorithms
+		self._pyjwt = pyjwt
+		self._algorithm_object = get_default_algorithms()[algorithm]
+		super().__init__(algorithm, private_key, public_key)
+
+	def _prepare_key(self, key:str, env_name:str):
+		try: return self._algorithm_object.prepare_key(key)
+		except (ValueError, TypeError, self._pyjwt.InvalidKeyError): 
+			raise ValueError('The ENV '+env_name+' value is invalid')
+
+	def encode(self, claims:dict):
+		return self._pyjwt.encode(claims, self._signing_key, algorithm=self._algorithm)
+
+	def decode(self, token:str):
+		try: return self._pyjwt.decode(token, self._verifying_key, algorithms=[self._algorithm])
+		except self._pyjwt.ExpiredSignatureError: raise _ExpiredTokenError()
+		except self._pyjwt.InvalidTokenError: raise _InvalidTokenError()
+
+
+_JWT_BACKENDS = {'jose':_JoseBackend, 'pyjwt':_PyJWTBackend}
+
+def _get_jwt_backend(name:str, algorithm:str = _ALGORITHM, private_key:str = _PRIVATE_KEY,
+	public_key:str = _PUBLIC_KEY):
+	return _JWT_BACKENDS[name](algorithm, private_key, public_key)
+
+_jwt_backend = _get_jwt_backend(_JWT_BACKEND)
+
+
 #____VALIDATION____#
 
 def __validate(validator_class, data:dict, validate_access_token:bool):
@@ -112,8 +331,7 @@ def _validate_to_encode(to_encode: dict, validate_access_token:bool=True):
 #____OPERATIONS____#
 
 def _create_tokens(to_encode:dict, access_token_exp:int = _ACCESS_TOKEN_EXP,
-	refresh_token_exp:int = _REFRESH_TOKEN_EXP, private_key:str = _PRIVATE_KEY, 
-	algorithm:str = _ALGORITHM):
+	refresh_token_exp:int = _REFRESH_TOKEN_EXP, backend:_JWTBackend = _jwt_backend):
 	"""
 	This function is used to create tokens (access_token and refresh_token)
 	"""
@@ -125,7 +343,7 @@ def _create_tokens(to_encode:dict, access_token_exp:int = _ACCESS_TOKEN_EXP,
 		raise AuthServerException('To encode access dictionary invalid!')
 	
 	#creating access token
-	access_token = jwt.encode(to_encode, private_key, algorithm=algorithm)
+	access_token = backend.encode(to_encode)
 		
 	#setting the expiration time of refresh token
 	to_encode['exp']= datetime.utcnow() + timedelta(minutes=refresh_token_exp)
@@ -135,29 +353,29 @@ def _create_tokens(to_encode:dict, access_token_exp:int = _ACCESS_TOKEN_EXP,
 		raise AuthServerException('To encode refresh dictionary invalid!')
 	
 	#creating refresh token
-	refresh_token = jwt.encode(to_encode, private_key, algorithm=algorithm)
+	refresh_token = backend.encode(to_encode)
 
 	return {'access_token':access_token, 'token_type':'bearer', 'refresh_token':refresh_token}
 	
 
 
-def _decode_token(token:str, is_access:bool=True, public_key:str = _PUBLIC_KEY, algorithm:str = _ALGORITHM):
+def _decode_token(token:str, is_access:bool=True, backend:_JWTBackend = _jwt_backend):
 	token_name='access_token'
 	if not is_access: token_name = 'refresh_token'
 	try:
-		decoded_token = jwt.decode(token, public_key, algorithms=[algorithm])
+		decoded_token = backend.decode(token)
 		
 		#validate the decoded data
 		if not _validate_decoded(decoded_token, is_access):
 			raise _token_invalid_exception(token_name, 'forbidden')
 		return decoded_token
 	
-	except ExpiredSignatureError: raise _token_expired_exception(token_name)
-	except JWTError: raise _token_invalid_exception(token_name)
+	except _ExpiredTokenError: raise _token_expired_exception(token_name)
+	except _InvalidTokenError: raise _token_invalid_exception(token_name)
 
 
-def _create_access_token(decoded_refresh_token:dict, private_key:str = _PRIVATE_KEY,
-	access_token_exp:int = _ACCESS_TOKEN_EXP, algorithm:str = _ALGORITHM):
+def _create_access_token(decoded_refresh_token:dict, backend:_JWTBackend = _jwt_backend,
+	access_token_exp:int = _ACCESS_TOKEN_EXP):
 
 	#validate the decoded data
 	if not _validate_decoded(decoded_refresh_token,False):
@@ -172,18 +390,90 @@ def _create_access_token(decoded_refresh_token:dict, private_key:str = _PRIVATE_
 		raise AuthServerException('To encode access dictionary invalid!')
 
 	#creating new access_token
-	access_token = jwt.encode(to_encode, private_key, algorithm=algorithm)
+	access_token = backend.encode(to_encode)
 	return {'access_token':access_token, 'token_type':'bearer'}
 
 
 
+#____AUTHORIZATION_CLAIMS____#
+
+def _compile_claims(decoded:dict):
+	"""
+	Turns the permissions and groups lists into frozensets, so each authorization
+	check is a set lookup. It is done once per token, the result is cached.
+	"""
+	decoded['permissions'] = frozenset(decoded['permissions'])
+	decoded['groups'] = frozenset(decoded['groups'])
+	return decoded
+
+
+#____DECODED_CACHE____#
+
+class _DecodedTokenCache():
+	"""
+	LRU cache of the verified access tokens, the key is the token sha256 and the value
+	is the decoded token. The decoded token is kept until the token expiration (exp).
+	The routes that check authorization are sync (run on threads), so it uses a lock.
+	"""
+	def __init__(self, max_size:int):
+		self._max_size = max_size
+		self._items = OrderedDict()
+		self._lock = threading.Lock()
+		#metrics
+		self._hits = 0
+		self._misses = 0
+
+	def _get_key(self, token:str):
+		return hashlib.sha256(token.encode()).digest()
+
+	def get(self, token:str):
+		if self._max_size==0: return None
+		key = self._get_key(token)
+		with self._lock:
+			item = self._items.get(key)
+			if item is None or item['exp'] <= time.time():
+				if item is not None: del self._items[key]
+				self._misses+=1
+				return None
+			self._items.move_to_end(key)
+			self._hits+=1
+			return item
+
+	def set(self, token:str, decoded:dict):
+		if self._max_size==0: return
+		key = self._get_key(token)
+		with self._lock:
+			self._items[key] = decoded
+			self._items.move_to_end(key)
+			if len(self._items) > self._max_size: self._items.popitem(last=False)
+
+	def get_stats(self):
+		return {'max_size':self._max_size, 'size':len(self._items), 
+			'hits':self._hits, 'misses':self._misses}
+
+
+_decoded_token_cache = _DecodedTokenCache(_TOKEN_CACHE_SIZE)
+
+def get_token_cache_stats():
+	return _decoded_token_cache.get_stats()
+
+
+
 #______________________ADAPTERS_______________________________________#
 
 class EmailSender(EmailSenderInterface):
+	#max emails on the same email-worker message
+	emails_batch_size = 100
 
 	def send_signup_email(self, to:str, random_key:str, data:dict=None):
 		if not TEST_MODE: send_signup_email.delay(to, random_key, data)
 
+	def send_signup_emails(self, emails:list):
+		#emails = [(to, random_key), ...]
+		if TEST_MODE: return
+		for i in range(0, len(emails), self.emails_batch_size):
+			send_signup_emails.delay([list(email) for email in emails[i:i+self.emails_batch_size]])
+
 	def send_password_forget_email(self, to:str, random_key:str, data:dict=None):
 		if not TEST_MODE: send_password_forget_email.delay(to, random_key, data)
 
@@ -192,6 +482,11 @@ class EmailSender(EmailSenderInterface):
 
 
 class TokenGenerator(TokenGeneratorInterface):
+	"""
+	The JWT backend (python-jose or PyJWT) is selected by the JWT_BACKEND setting
+	"""
+	def __init__(self, backend:_JWTBackend = _jwt_backend):
+		self._backend = backend
 
 	#_______AES____________#
 	def _decode_AES(self, token:str, is_access_token:bool):
@@ -204,13 +499,13 @@ class TokenGenerator(TokenGeneratorInterface):
 	#_______CREATE___________#
 
 	def create_tokens(self, user_infos: dict):
-		token_dict = _create_tokens(user_infos)
+		token_dict = _create_tokens(user_infos, backend=self._backend)
 		token_dict['access_token'] = self._encode_AES(token_dict['access_token'], True)
 		token_dict['refresh_token'] = self._encode_AES(token_dict['refresh_token'], False)
 		return token_dict
 	
 	def create_access_token(self, decoded_refresh_token:dict):
-		access_token_dict = _create_access_token(decoded_refresh_token)
+		access_token_dict = _create_access_token(decoded_refresh_token, self._backend)
 		access_token_dict['access_token'] = self._encode_AES(access_token_dict['access_token'], True)
 		return access_token_dict
 
@@ -218,11 +513,17 @@ class TokenGenerator(TokenGeneratorInterface):
 
 	def decode_refresh_token(self, refresh_token: str):
 		refresh_token = self._decode_AES(refresh_token, False)
-		return _decode_token(refresh_token,False)
+		return _decode_token(refresh_token, False, self._backend)
 	
 	def decode_access_token(self, access_token:str):
-		access_token = self._decode_AES(access_token, True)
-		return _decode_token(access_token)
+		#the verified tokens are cached until expire
+		#permissions and groups are returned as frozensets
+		decoded = _decoded_token_cache.get(access_token)
+		if decoded is not None: return decoded.copy()
+
+		decoded = _compile_claims(_decode_token(self._decode_AES(access_token, True), True, self._backend))
+		_decoded_token_cache.set(access_token, decoded.copy())
+		return decoded
 	
 	def get_next_expirated(self):
 		exp = _REFRESH_TOKEN_EXP + _ACCESS_TOKEN_EXP
@@ -231,8 +532,11 @@ class TokenGenerator(TokenGeneratorInterface):
 
 class PasswordHasher(PasswordHasherInterface):
 
-	def hash_password(self, password: str):
-		return _hash_password(password)
+	def __init__(self, worker_pool:_HashWorkerPool = _hash_worker_pool):
+		self._worker_pool = worker_pool
+
+	async def hash_password(self, password: str):
+		return await self._worker_pool.run(_hash_password, password)
 
-	def compare_passwords(self, password:str, hashed_password:str):
-		return _verify_password(password, hashed_password)
\ No newline at end of file
+	async def compare_passwords(self, password:str, hashed_password:str):
+		return await self._worker_pool.run(_verify_password, password, hashed_password)
\ No newline at end of file
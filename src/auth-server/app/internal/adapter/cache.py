@@ -1,12 +1,99 @@
 import json
-from datetime import timedelta
-from app.internal.settings import CACHE, AUTH
-from app.internal.adapter.interfaces import CacheRepositoryInterface
+import time
+import asyncio
+import logging
+import threading
+import aioredis
+from datetime import datetime, timedelta
+from app.internal.settings import CACHE, AUTH, TEST_MODE
+from app.internal.adapter.interfaces import (CacheRepositoryInterface, RelationalCacheRepositoryInterface,
+	SessionCacheRepositoryInterface, GroupPermissionsCacheInterface)
+
+#FOR_TEST_MODE
+from .test_cache import (test_cache_set, test_cache_get, test_cache_delete,
+	test_cache_add_to_set, test_cache_get_set)
 
 
 _PREFIX = CACHE['PREFIX']
-_SESSION_EXP = AUTH['ACCESS_TOKEN_EXP'] + AUTH['REFRESH_TOKEN_EXP']
+_SESSION_EXP = int(AUTH['ACCESS_TOKEN_EXP']) + int(AUTH['REFRESH_TOKEN_EXP'])
 CACHE_URI = CACHE['CACHE_URI']
+_GROUP_PERMISSIONS_EXP = CACHE['GROUP_PERMISSIONS_EXP']
+_GROUP_PERMISSIONS_SETTLE = CACHE['GROUP_PERMISSIONS_SETTLE']
+_GROUP_PERMISSIONS_CHANNEL = _PREFIX+':group_permissions:invalidate'
+#published by the db-worker after it commits the group permissions changes
+_GROUP_PERMISSIONS_COMMITTED_CHANNEL = _PREFIX+':group_permissions:committed'
+
+_logger = logging.getLogger(__name__)
+
+
+#_________SHARED_CONNECTION_POOL________________#
+
+class _CacheConnectionPool(aioredis.BlockingConnectionPool):
+	"""
+	Redis connection pool shared by all requests. When all connections are in use,
+	the requests wait (until timeout) for a free connection.
+	"""
+	def __init__(self, **kwargs):
+		super().__init__(**kwargs)
+		self._checked_out = set()
+		#metrics
+		self._waits = 0
+		self._wait_time_total = 0.0
+		self._wait_time_max = 0.0
+		self._errors = 0
+
+	async def get_connection(self, command_name, *keys, **options):
+		start = time.perf_counter()
+		try: connection = await super().get_connection(command_name, *keys, **options)
+		except aioredis.ConnectionError:
+			self._errors+=1
+			raise
+		wait_time = time.perf_counter() - start
+		self._waits+=1
+		self._wait_time_total+=wait_time
+		self._wait_time_max = max(self._wait_time_max, wait_time)
+		self._checked_out.add(connection)
+		return connection
+
+	async def release(self, connection):
+		self._checked_out.discard(connection)
+		await super().release(connection)
+
+	def get_stats(self):
+		in_use = len(self._checked_out)
+		wait_time_avg = 0.0
+		if self._waits>0: wait_time_avg = self._wait_time_total/self._waits
+		return {'max_connections':self.max_connections, 'created':len(self._connections),
+			'in_use':in_use, 'idle':len(self._connections)-in_use, 'waits':self._waits,
+			'wait_time_avg':wait_time_avg, 'wait_time_max':self._wait_time_max,
+			'errors':self._errors}
+
+
+_cache_pool = None
+_cache_client = None
+
+def open_cache_pool():
+	global _cache_pool, _cache_client
+	if TEST_MODE or CACHE_URI is None or _cache_pool is not None: return
+	_cache_pool = _CacheConnectionPool.from_url(CACHE_URI, max_connections=CACHE['MAX_CONNECTIONS'],
+		timeout=CACHE['POOL_TIMEOUT'], health_check_interval=CACHE['HEALTH_CHECK_INTERVAL'])
+	_cache_client = aioredis.Redis(connection_pool=_cache_pool)
+
+async def close_cache_pool():
+	global _cache_pool, _cache_client
+	if _cache_pool is None: return
+	await _cache_pool.disconnect()
+	_cache_pool = None
+	_cache_client = None
+
+def get_cache_client():
+	#the pool is opened on startup, this is only a fallback
+	if _cache_client is None: open_cache_pool()
+	return _cache_client
+
+def get_cache_pool_stats():
+	if _cache_pool is None: return None
+	return _cache_pool.get_stats()
 
 #_________BASE_REDIS_CACHE_CRUD_________________#
 
@@ -25,7 +112,8 @@ class BaseAsyncRedisCache(CacheRepositoryInterface):
 		#value, must be a object that json can serialize
 		keyP = self._add_prefix(key)
 		if expire==0: expire = self.element_expire
-		await self._redis.setex(keyP,timedelta(minutes=expire),value=json.dumps(value))
+		if TEST_MODE: test_cache_set(keyP, json.dumps(value), timedelta(minutes=expire))
+		else: await self._redis.setex(keyP,timedelta(minutes=expire),value=json.dumps(value))
 
 	def _serializer_result(self, result:str):
 		if result is not None: return json.loads(result)
@@ -33,15 +121,253 @@ class BaseAsyncRedisCache(CacheRepositoryInterface):
 
 	async def get(self, key:str):
 		keyP = self._add_prefix(key)
+		if TEST_MODE: return self._serializer_result(test_cache_get(keyP))
 		return self._serializer_result(await self._redis.get(keyP))
 
 	async def delete(self, key:str):
 		keyP = self._add_prefix(key)
-		await self._redis.delete(keyP)
+		if TEST_MODE: test_cache_delete(keyP)
+		else: await self._redis.delete(keyP)
+
+
+class BaseAsyncRelationalRedisCache(BaseAsyncRedisCache, RelationalCacheRepositoryInterface):
+	"""
+	Keeps a redis set (index) with the keys of the elements that have the same
+	index_field value, so the elements can be deleted together
+	"""
+	key_field=None
+	index_prefix=None
+	index_field=None
+
+	def _add_index_prefix(self, index_value:str):
+		return self._root_prefix+':'+self.index_prefix+':'+index_value
+
+	async def set(self, key:str, value, expire:float=0):
+		#value, must be a dict with the index_field
+		await super().set(key, value, expire)
+		indexP = self._add_index_prefix(str(value[self.index_field]))
+		#the index lives as long as the newest element
+		index_expire = timedelta(minutes=max(expire, self.element_expire))
+
+		if TEST_MODE: test_cache_add_to_set(indexP, key, index_expire)
+		else:
+			async with self._redis.pipeline(transaction=True) as pipe:
+				await pipe.sadd(indexP, key).expire(indexP, index_expire).execute()
+
+	async def delete_many_by(self, repeated_data:dict):
+		#repeated_data.keys() = [index_field] or [key_field]
+		if self.index_field not in repeated_data:
+			return await self.delete(str(repeated_data[self.key_field]))
+
+		indexP = self._add_index_prefix(str(repeated_data[self.index_field]))
+		if TEST_MODE:
+			for key in test_cache_get_set(indexP): test_cache_delete(self._add_prefix(key))
+			test_cache_delete(indexP)
+		else:
+			keys = [self._add_prefix(key.decode()) for key in await self._redis.smembers(indexP)]
+			keys.append(indexP)
+			await self._redis.delete(*keys)
 
 
 #_________________IMPLEMENTATIONS____________________________#
 
-class SessionCache(BaseAsyncRedisCache):
+class SessionCache(BaseAsyncRelationalRedisCache, SessionCacheRepositoryInterface):
+	"""
+	The database deletes are applied later by the db-worker, so the revoked sessions are
+	kept as tombstones (until the longest session expire), a cache miss must not read them
+	back from the database
+	"""
 	element_prefix='session'
-	element_expire= _SESSION_EXP
\ No newline at end of file
+	element_expire= _SESSION_EXP
+	key_field='session_id'
+	index_prefix='user_sessions'
+	index_field='user_id'
+	revoked_prefix='revoked_user_sessions'
+
+	def _add_revoked_prefix(self, user_id:str):
+		return self._root_prefix+':'+self.revoked_prefix+':'+user_id
+
+	async def revoke(self, session_id:str, user_id:str):
+		await self.set(session_id, {'session_id':session_id, 'user_id':user_id, 'revoked':True})
+
+	async def revoke_many_by(self, repeated_data:dict):
+		#repeated_data.keys() = ['user_id'] or ['session_id']
+		if self.index_field not in repeated_data:
+			return await self.revoke(str(repeated_data[self.key_field]), None)
+
+		await self.delete_many_by(repeated_data)
+		#the sessions of the user created until now are revoked
+		revokedP = self._add_revoked_prefix(str(repeated_data[self.index_field]))
+		value = json.dumps(datetime.now().isoformat())
+		if TEST_MODE: test_cache_set(revokedP, value, timedelta(minutes=self.element_expire))
+		else: await self._redis.setex(revokedP, timedelta(minutes=self.element_expire), value=value)
+
+	async def get_revoked_since(self, user_id:str):
+		#return the isoformat date of the last revoke of all the user sessions, or None
+		revokedP = self._add_revoked_prefix(user_id)
+		if TEST_MODE: return self._serializer_result(test_cache_get(revokedP))
+		return self._serializer_result(await self._redis.get(revokedP))
+
+
+#_________GROUP_PERMISSIONS_LOCAL_CACHE_________________#
+
+class _GroupPermissionsLocalCache():
+	"""
+	Process-wide map group_id -> frozenset(permission_id), kept in memory for expire seconds.
+	The version changes on every invalidation, so a load that started before an
+	invalidation is not saved (it can have old permissions).
+	The invalidation is sent when the change is published, before the db-worker commits it,
+	so the invalidated groups are not saved for settle seconds (they are read from database).
+	The db-worker (with CACHE_URI) invalidates the groups again after the commit, a commit
+	received after the settle window is counted on late_commits (the old permissions could
+	have been cached until then).
+	"""
+	def __init__(self, expire:int, settle:int=0):
+		self._expire = expire
+		self._settle = settle
+		self._items = {}
+		self._version = 0
+		#group_id -> time of the last invalidation (None key, all the groups)
+		self._invalidated = {}
+		self._lock = threading.Lock()
+		#metrics
+		self._hits = 0
+		self._misses = 0
+		self._invalidations = 0
+		self._committed_invalidations = 0
+		self._late_commits = 0
+
+	def get_many(self, group_ids:list):
+		#return ({group_id: frozenset}, missing_group_ids)
+		found = {}
+		missing = []
+		now = time.monotonic()
+		with self._lock:
+			for group_id in group_ids:
+				item = self._items.get(group_id)
+				if item is None or item[1] <= now: missing.append(group_id)
+				else: found[group_id] = item[0]
+			self._hits+=len(found)
+			self._misses+=len(missing)
+		return found, missing
+
+	def _is_settling(self, group_id, now:float):
+		settle_from = now - self._settle
+		return (self._invalidated.get(group_id, settle_from) > settle_from 
+			or self._invalidated.get(None, settle_from) > settle_from)
+
+	def set_many(self, group_permissions:dict, version:int):
+		if self._expire==0: return
+		now = time.monotonic()
+		expire = now + self._expire
+		with self._lock:
+			if version != self._version: return
+			for group_id, permissions in group_permissions.items():
+				if self._is_settling(group_id, now): continue
+				self._items[group_id] = (frozenset(permissions), expire)
+
+	def get_version(self):
+		return self._version
+
+	def _is_late_commit(self, group_ids:list, now:float):
+		#the commit of a change whose settle window has already ended
+		if group_ids is None:
+			return all(value <= now-self._settle for value in self._invalidated.values())
+		return any(not self._is_settling(group_id, now) for group_id in group_ids)
+
+	def invalidate(self, group_ids:list=None, committed:bool=False):
+		#group_ids None, invalidate all groups
+		#committed, sent by the db-worker after the commit (the groups are not read again from database)
+		with self._lock:
+			self._version+=1
+			now = time.monotonic()
+			if committed:
+				self._committed_invalidations+=1
+				if self._is_late_commit(group_ids, now): self._late_commits+=1
+				if group_ids is None: self._items.clear()
+				else:
+					for group_id in group_ids: self._items.pop(group_id, None)
+				return
+			self._invalidations+=1
+			#the settled invalidations are not needed anymore
+			self._invalidated = {key:value for key, value in self._invalidated.items() if value > now-self._settle}
+			if group_ids is None: 
+				self._items.clear()
+				self._invalidated[None] = now
+			else:
+				for group_id in group_ids: 
+					self._items.pop(group_id, None)
+					self._invalidated[group_id] = now
+
+	def get_stats(self):
+		return {'expire':self._expire, 'settle':self._settle, 'size':len(self._items), 'hits':self._hits,
+			'misses':self._misses, 'invalidations':self._invalidations, 
+			'committed_invalidations':self._committed_invalidations, 'late_commits':self._late_commits}
+
+
+_group_permissions_cache = _GroupPermissionsLocalCache(_GROUP_PERMISSIONS_EXP, _GROUP_PERMISSIONS_SETTLE)
+
+def get_group_permissions_cache_stats():
+	return _group_permissions_cache.get_stats()
+
+
+class GroupPermissionsCache(GroupPermissionsCacheInterface):
+	"""
+	Uses the process-wide local cache, the invalidations are published on redis
+	so the other auth-server replicas invalidate their local cache too.
+	"""
+	def __init__(self, session=None, local_cache:_GroupPermissionsLocalCache=_group_permissions_cache):
+		self._redis = session
+		self._local_cache = local_cache
+
+	def get_many(self, group_ids:list):
+		return self._local_cache.get_many(group_ids)
+
+	def set_many(self, group_permissions:dict, version:int):
+		self._local_cache.set_many(group_permissions, version)
+
+	def get_version(self):
+		return self._local_cache.get_version()
+
+	async def invalidate(self, group_ids:list=None):
+		self._local_cache.invalidate(group_ids)
+		if self._redis is not None:
+			await self._redis.publish(_GROUP_PERMISSIONS_CHANNEL, json.dumps(group_ids))
+
+
+#_________INVALIDATION_LISTENER_________________#
+
+_listener_task = None
+
+async def _listen_invalidations(client):
+	while True:
+		pubsub = client.pubsub(ignore_subscribe_messages=True)
+		try:
+			await pubsub.subscribe(_GROUP_PERMISSIONS_CHANNEL, _GROUP_PERMISSIONS_COMMITTED_CHANNEL)
+			#the messages lost while reconnecting are unknown, so invalidate all
+			_group_permissions_cache.invalidate()
+			while True:
+				message = await pubsub.get_message(timeout=1.0)
+				if message is None: continue
+				channel = message['channel']
+				if isinstance(channel, bytes): channel = channel.decode()
+				_group_permissions_cache.invalidate(json.loads(message['data']), 
+					committed=channel==_GROUP_PERMISSIONS_COMMITTED_CHANNEL)
+		except asyncio.CancelledError: raise
+		except Exception as ex:
+			_logger.warning('group permissions invalidation listener error: %s', ex)
+			await asyncio.sleep(1)
+		finally: await pubsub.close()
+
+def start_cache_listeners():
+	global _listener_task
+	if _cache_client is None or _listener_task is not None: return
+	_listener_task = asyncio.get_event_loop().create_task(_listen_invalidations(_cache_client))
+
+async def stop_cache_listeners():
+	global _listener_task
+	if _listener_task is None: return
+	_listener_task.cancel()
+	try: await _listener_task
+	except asyncio.CancelledError: pass
+	_listener_task = None
@@ -4,7 +4,15 @@ from .database import (
     #Postgres models
     UserTable, RandomTable, PermissionTable, GroupTable, UserPermissionTable,
     UserGroupTable, GroupPermissionTable, SessionTable, LogTable)
-from sqlalchemy import and_
+from sqlalchemy import and_, any_, bindparam, lambda_stmt, literal_column, union, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.future import select
+from app.internal.settings import TEST_MODE
+from .interfaces import (UserRepositoryInterface, UserPermissionRepositoryInterface, 
+    GroupPermissionRepositoryInterface)
+#FOR_TEST_MODE
+from .test_database import (test_find_permissions_and_groups, test_find_permissions_by_groups,
+    test_find_existing_emails)
 #Entities
 from app.internal.domain.entities import (Random, User, Permission, Group, 
     UserPermission, UserGroup, GroupPermission, Log, Session)
@@ -18,7 +26,7 @@ class LogCRUD(AsyncPostgresCRUD):
 
 
 #________________USER__________________#
-class UserCRUD(AsyncPostgresCRUD):
+class UserCRUD(AsyncPostgresCRUD, UserRepositoryInterface):
     model_class=UserTable
     entity_class=User
     tablename= UserTable.__tablename__
@@ -28,6 +36,22 @@ class UserCRUD(AsyncPostgresCRUD):
             return self.model_class.email == unique_data['email']
         else: return self.model_class.id == unique_data['id']
 
+    #hot lookups (authentication and signup)
+    def _get_find_statement(self, unique_data:dict):
+        if 'email' in unique_data:
+            email = unique_data['email']
+            return lambda_stmt(lambda: select(UserTable).where(UserTable.email==email))
+        user_id = unique_data['id']
+        return lambda_stmt(lambda: select(UserTable).where(UserTable.id==user_id))
+
+    async def find_existing_emails(self, emails:list):
+        #return the set of emails used by a user, using only one query with one parameter (= ANY(array))
+        if TEST_MODE: return test_find_existing_emails(emails)
+
+        query = select(UserTable.email).where(UserTable.email==any_(bindparam('emails', emails, type_=ARRAY(String))))
+        result = await self.session.execute(query)
+        return set(result.scalars().all())
+
 
 #___________________Random________________#
 class RandomCRUD(AsyncRelationalPostgresCRUD):
@@ -74,8 +98,22 @@ class SessionCRUD(AsyncRelationalPostgresCRUD):
             return self.model_class.user_id==repeated_data['user_id']
         else: return self.model_class.session_id==repeated_data['session_id']
 
+    #hot lookups (refresh and logout)
+    def _get_find_statement(self, unique_data:dict):
+        user_id = unique_data['user_id']
+        session_id = unique_data['session_id']
+        return lambda_stmt(lambda: select(SessionTable).where(SessionTable.user_id==user_id, 
+            SessionTable.session_id==session_id))
+
+    def _get_find_many_by_statement(self, repeated_data:dict):
+        if 'user_id' in repeated_data:
+            user_id = repeated_data['user_id']
+            return lambda_stmt(lambda: select(SessionTable).where(SessionTable.user_id==user_id))
+        session_id = repeated_data['session_id']
+        return lambda_stmt(lambda: select(SessionTable).where(SessionTable.session_id==session_id))
+
 #___________________UserPermission_______________#
-class UserPermissionCRUD(AsyncRelationalPostgresCRUD):
+class UserPermissionCRUD(AsyncRelationalPostgresCRUD, UserPermissionRepositoryInterface):
     model_class=UserPermissionTable
     entity_class=UserPermission
     tablename=UserPermissionTable.__tablename__
@@ -89,6 +127,31 @@ class UserPermissionCRUD(AsyncRelationalPostgresCRUD):
             return self.model_class.user_id==repeated_data['user_id']
         else: return self.model_class.permission_id==repeated_data['permission_id']
 
+    def _get_permissions_and_groups_query(self, user_id):
+        #UNION remove the repeated (kind, name) rows, built and compiled once (lambda_stmt)
+        return lambda_stmt(lambda: union(
+            #user permissions
+            select(literal_column("'permission'").label('kind'), UserPermissionTable.permission_id.label('name'))
+                .where(UserPermissionTable.user_id==user_id),
+            #user groups
+            select(literal_column("'group'").label('kind'), UserGroupTable.group_id.label('name'))
+                .where(UserGroupTable.user_id==user_id)))
+
+    async def find_permissions_and_groups(self, user_id):
+        """
+        Return the user own permissions and groups names, using only one query.
+        The groups permissions are not included
+        """
+        if TEST_MODE: return test_find_permissions_and_groups(user_id)
+
+        result = await self.session.execute(self._get_permissions_and_groups_query(user_id))
+        permission_names = []
+        group_names = []
+        for kind, name in result.all():
+            if kind=='permission': permission_names.append(name)
+            else: group_names.append(name)
+        return permission_names, group_names
+
 
 #___________________UserGroup_______________#
 class UserGroupCRUD(AsyncRelationalPostgresCRUD):
@@ -107,7 +170,7 @@ class UserGroupCRUD(AsyncRelationalPostgresCRUD):
 
 
 #___________________GroupPermission________________#
-class GroupPermissionCRUD(AsyncRelationalPostgresCRUD):
+class GroupPermissionCRUD(AsyncRelationalPostgresCRUD, GroupPermissionRepositoryInterface):
     model_class=GroupPermissionTable
     entity_class=GroupPermission
     tablename= GroupPermissionTable.__tablename__
@@ -119,4 +182,17 @@ class GroupPermissionCRUD(AsyncRelationalPostgresCRUD):
     def _get_query_by(self, repeated_data:dict):
         if 'group_id' in repeated_data: 
             return self.model_class.group_id==repeated_data['group_id']
-        else: return self.model_class.permission_id==repeated_data['permission_id']
\ No newline at end of file
+        else: return self.model_class.permission_id==repeated_data['permission_id']
+
+    async def find_permissions_by_groups(self, group_ids:list):
+        #return {group_id: [permission_id, ...]}, using only one query
+        if TEST_MODE: return test_find_permissions_by_groups(group_ids)
+
+        group_permissions = {group_id:[] for group_id in group_ids}
+        if len(group_ids)==0: return group_permissions
+        query = lambda_stmt(lambda: select(GroupPermissionTable.group_id, GroupPermissionTable.permission_id).where(
+            GroupPermissionTable.group_id.in_(group_ids)))
+        result = await self.session.execute(query)
+        for group_id, permission_id in result.all():
+            group_permissions[group_id].append(permission_id)
+        return group_permissions
\ No newline at end of file
@@ -1,35 +1,108 @@
 import abc
 import asyncio
+import logging
+import time
 import uuid
 from datetime import datetime
 from sqlalchemy.ext import asyncio as asyncio_ext
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import Boolean, Column, String, Integer, DateTime, inspect, delete, insert, update
+from sqlalchemy import Boolean, Column, String, Integer, DateTime, Index, inspect, delete, insert, update, tuple_
+from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base, as_declarative
 #others
-from app.internal.settings import DATABASE_URI, TEST_MODE
+from app.internal.settings import DATABASE_URI, DATABASE_POOL, TEST_MODE, DB_TRANSACTIONS_BATCH, AUDIT_LOGS_BATCH
 #CELERY
-from .tasks_celery import process_transactions
+from .tasks_celery import process_transactions, process_transactions_batch, append_logs
 #Adapters Interfaces
 from .interfaces import RepositoryInterface, RelationalRepositoryInterface, TransactionProcessorInterface
 #Entities
 from app.internal.domain.entities import Entity
 
 #FOR_TEST_MODE
-from .test_database import (test_find, test_find_many, test_find_many_by, test_save, 
-    test_update, test_delete, test_delete_many_by)
+from .test_database import (test_find, test_find_many, test_find_many_after, test_find_many_by, 
+    test_stream, test_save, test_update, test_delete, test_delete_many_by)
 
 
 
 #___________________________DATABASE__________________________#
+class _DatabaseConnectionPool(AsyncAdaptedQueuePool):
+    """
+    Engine connection pool with metrics, the wait time includes the connection
+    creation (and the pre ping) when the pool has not idle connections.
+    """
+    #wait time histogram buckets, seconds
+    _WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        #metrics
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._wait_time_buckets = [0]*(len(self._WAIT_BUCKETS)+1)
+        self._timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try: connection = super().connect()
+        except sqlalchemy_exc.TimeoutError:
+            self._timeouts+=1
+            raise
+        wait_time = time.perf_counter() - start
+        self._waits+=1
+        self._wait_time_total+=wait_time
+        self._wait_time_max = max(self._wait_time_max, wait_time)
+        index = 0
+        while index<len(self._WAIT_BUCKETS) and wait_time>self._WAIT_BUCKETS[index]: index+=1
+        self._wait_time_buckets[index]+=1
+        return connection
+
+    def get_stats(self):
+        wait_time_avg = 0.0
+        if self._waits>0: wait_time_avg = self._wait_time_total/self._waits
+        histogram = {'<='+str(bucket)+'s': value for bucket, value in zip(self._WAIT_BUCKETS, self._wait_time_buckets)}
+        histogram['>'+str(self._WAIT_BUCKETS[-1])+'s'] = self._wait_time_buckets[-1]
+        return {'size':self.size(), 'max_overflow':self._max_overflow, 'checked_out':self.checkedout(),
+            'idle':self.checkedin(), 'overflow':max(self.overflow(), 0), 'waits':self._waits,
+            'wait_time_avg':wait_time_avg, 'wait_time_max':self._wait_time_max,
+            'wait_time_histogram':histogram, 'timeouts':self._timeouts}
+
+
 SQLALCHEMY_DATABASE_URL='postgresql+asyncpg://'+DATABASE_URI
-engine = asyncio_ext.create_async_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_DATABASE_URL+='?prepared_statement_cache_size='+str(DATABASE_POOL['STATEMENT_CACHE_SIZE'])
+engine = asyncio_ext.create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=_DatabaseConnectionPool,
+    pool_size=DATABASE_POOL['SIZE'], max_overflow=DATABASE_POOL['MAX_OVERFLOW'], pool_timeout=DATABASE_POOL['TIMEOUT'],
+    pool_recycle=DATABASE_POOL['RECYCLE'] or -1, pool_pre_ping=DATABASE_POOL['PRE_PING'])
+
+def get_database_pool_stats():
+    return engine.sync_engine.pool.get_stats()
+
 
 #The future session
 SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=asyncio_ext.AsyncSession)
+#autocommit, without BEGIN/COMMIT
+ReadSessionLocal = sessionmaker(engine.execution_options(isolation_level='AUTOCOMMIT'), 
+    expire_on_commit=False, class_=asyncio_ext.AsyncSession)
+
+
+class ReadSession():
+    """
+    Session for the services that only read (the writes are done by the db-worker).
+    A connection is checked out only when a query runs, and returned as soon as
+    the rows are fetched, so a request doesn't hold it while it is not querying.
+    """
+    def __init__(self, session_factory=ReadSessionLocal):
+        self._session_factory = session_factory
+
+    async def execute(self, statement, *args, **kwargs):
+        async with self._session_factory() as asession:
+            result = await asession.execute(statement, *args, **kwargs)
+            #fetch the rows before the connection is returned
+            return result.freeze()()
 #Base = declarative_base()#Used to create database models
 
 
@@ -49,6 +122,8 @@ class Base:
 
 class UserTable(Base):
     __tablename__ = 'users'
+    #keyset pagination
+    __table_args__ = (Index('ix_users_created_id', 'created', 'id'),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True)
     salt = Column(String, default=str(uuid.uuid4))
@@ -59,6 +134,8 @@ class UserTable(Base):
 
 class RandomTable(Base):
     __tablename__ = 'randoms'
+    #the reaper deletes the expired randoms, the primary key does not index flow alone
+    __table_args__ = (Index('ix_randoms_updated', 'updated'), Index('ix_randoms_flow', 'flow'))
     id = Column(UUID(as_uuid=True), primary_key=True)
     flow = Column(String, primary_key=True)
     key = Column(String)
@@ -67,30 +144,40 @@ class RandomTable(Base):
 
 class PermissionTable(Base):
     __tablename__ = 'permissions'
+    #keyset pagination
+    __table_args__ = (Index('ix_permissions_created_id', 'created', 'id'),)
     id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
 
 
 class GroupTable(Base):
     __tablename__ = 'groups'
+    #keyset pagination
+    __table_args__ = (Index('ix_groups_created_id', 'created', 'id'),)
     id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
 
 
 class UserPermissionTable(Base):
     __tablename__ = 'user_permissions'
+    #delete_many_by permission_id (the primary key starts with user_id)
+    __table_args__ = (Index('ix_user_permissions_permission_id', 'permission_id'),)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     permission_id = Column(String, primary_key=True)
 
 
 class UserGroupTable(Base):
     __tablename__ = 'user_groups'
+    #delete_many_by group_id (the primary key starts with user_id)
+    __table_args__ = (Index('ix_user_groups_group_id', 'group_id'),)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     group_id = Column(String, primary_key=True)
 
 
 class GroupPermissionTable(Base):
     __tablename__ = 'group_permissions'
+    #delete_many_by permission_id (the primary key starts with group_id)
+    __table_args__ = (Index('ix_group_permissions_permission_id', 'permission_id'),)
     group_id = Column(String, primary_key=True)
     permission_id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
@@ -98,6 +185,9 @@ class GroupPermissionTable(Base):
 
 class SessionTable(Base):
     __tablename__ = 'sessions'
+    #the reaper deletes the expired sessions, find_many_by and delete_many_by user_id
+    #(the primary key starts with session_id)
+    __table_args__ = (Index('ix_sessions_expirated', 'expirated'), Index('ix_sessions_user_id', 'user_id'))
     session_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     expirated = Column(DateTime)
@@ -105,7 +195,14 @@ class SessionTable(Base):
 
 class LogTable(Base):
     __tablename__ = 'logs'
+    #monthly range partitions (created by the db-worker)
+    __table_args__ = (
+        Index('ix_logs_created', 'created'),
+        Index('ix_logs_user_id_created', 'user_id', 'created'),
+        Index('ix_logs_object_type_created', 'object_type', 'created'),
+        {'postgresql_partition_by': 'RANGE (created)'})
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    created = Column(DateTime, primary_key=True, default=datetime.now)
     user_id = Column(UUID(as_uuid=True))
     object_type = Column(String)
     object_id = Column(String)
@@ -128,6 +225,11 @@ class AsyncPostgresCRUD(RepositoryInterface):
     def _get_query(self, unique_data:dict):
         return self.model_class.id == unique_data['id']
 
+    #you can change this methods when extend, to return a lambda_stmt on the hot lookups
+    #(the statement is built and compiled once, then only the parameters change)
+    def _get_find_statement(self, unique_data:dict):
+        return select(self.model_class).where(self._get_query(unique_data))
+
     def _format(self, model_object):
         if model_object is None: return None
         if type(model_object) is dict: return self.entity_class(**model_object)
@@ -146,7 +248,7 @@ class AsyncPostgresCRUD(RepositoryInterface):
         result=None
         if TEST_MODE: result = test_find(self.tablename, unique_data)
         else:
-            result = await self.session.execute(select(self.model_class).where(self._get_query(unique_data)))
+            result = await self.session.execute(self._get_find_statement(unique_data))
             result = result.scalars().first()
         return self._format(result)
 
@@ -160,6 +262,36 @@ class AsyncPostgresCRUD(RepositoryInterface):
             result = result.scalars().all()
         return self._format_many(result)
 
+    async def find_many_after(self, after:tuple=None, limit:int=100):
+        """
+        Keyset pagination, after is the (created, id) of the last object of the previous page
+        (None, the first page). Uses the (created, id) index, so all pages have the same cost
+        """
+        result=None
+        if TEST_MODE: result = test_find_many_after(self.tablename, after, limit)
+        else:
+            query = select(self.model_class).order_by(self.model_class.created, self.model_class.id).limit(limit)
+            if after is not None:
+                query = query.where(tuple_(self.model_class.created, self.model_class.id) > tuple_(*after))
+            result = await self.session.execute(query)
+            result = result.scalars().all()
+        return self._format_many(result)
+
+    async def stream(self, fields:tuple, since:datetime=None):
+        """
+        Yield all the rows (dicts with the fields) created since, using a server-side cursor,
+        so the rows are fetched in batches and the memory don't grow with the table.
+        The session must be on a transaction
+        """
+        if TEST_MODE:
+            for row in test_stream(self.tablename, fields, since): yield row
+            return
+
+        query = select(*[getattr(self.model_class, field) for field in fields])
+        if since is not None: query = query.where(self.model_class.created>=since)
+        result = await self.session.stream(query)
+        async for row in result.mappings(): yield dict(row)
+
 
 
 class AsyncRelationalPostgresCRUD(AsyncPostgresCRUD, RelationalRepositoryInterface):
@@ -168,20 +300,152 @@ class AsyncRelationalPostgresCRUD(AsyncPostgresCRUD, RelationalRepositoryInterfa
     def _get_query_by(self, repeated_data:dict):
         pass
 
+    def _get_find_many_by_statement(self, repeated_data:dict):
+        return select(self.model_class).where(self._get_query_by(repeated_data))
+
     async def find_many_by(self, repeated_data: dict):
         result=None
         if TEST_MODE: result = test_find_many_by(self.tablename, repeated_data)
         else:
-            result = await self.session.execute(select(self.model_class).where(self._get_query_by(repeated_data)))
+            result = await self.session.execute(self._get_find_many_by_statement(repeated_data))
             result= result.scalars().all()
         return self._format_many(result)
 
 
+#____________TRANSACTION_PUBLISHER_______________________________#
+
+_logger = logging.getLogger(__name__)
+
+class _PublisherFullError(Exception):
+    pass
+
+
+class _TransactionPublisher():
+    """
+    Coalesces the transactions lists of many requests on one db-worker message.
+    A list waits at most max_delay seconds, and the buffer is published when it
+    has max_size lists. The lists keep the arrival order and the db-worker applies
+    each list on its own database transaction.
+    With wait, publish returns when the broker accepted the message of the list (the
+    broker errors are raised to the request). Without wait, publish returns at once and
+    the failed lists are kept to publish again, until max_pending (then publish fails).
+    """
+    def __init__(self, max_size:int, max_delay:float, task=process_transactions_batch, 
+        single_task=process_transactions, wait:bool=True):
+        self._max_size = max_size
+        self._max_delay = max_delay
+        #lists kept while the broker fails (without wait), the new lists are refused
+        self._max_pending = max_size*20
+        self._task = task
+        #without batching, a message per list (None, the task gets a batch of one)
+        self._single_task = single_task
+        self._wait = wait
+        self._buffer = []
+        #the futures of the lists on the buffer (with wait)
+        self._futures = []
+        self._timer = None
+        #metrics
+        self._messages = 0
+        self._lists = 0
+        self._errors = 0
+        self._refused = 0
+
+    def _is_disabled(self):
+        return self._max_size==1 or self._max_delay==0
+
+    async def publish(self, transactions_list:list):
+        if self._is_disabled():
+            #one message per request, like the db-workers without batch task
+            if self._single_task is None: self._task.delay([transactions_list])
+            else: self._single_task.delay(transactions_list)
+            self._messages+=1
+            self._lists+=1
+            return
+
+        if not self._wait and len(self._buffer)>=self._max_pending:
+            self._refused+=1
+            raise _PublisherFullError('transactions lists not published, the broker is not available')
+        future = None
+        if self._wait: 
+            future = asyncio.get_running_loop().create_future()
+            self._futures.append(future)
+        self._buffer.append(transactions_list)
+        if len(self._buffer)>=self._max_size: self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._max_delay, self.flush)
+        if future is not None: await future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if len(self._buffer)==0: return
+
+        batch = self._buffer
+        futures = self._futures
+        self._buffer = []
+        self._futures = []
+        try: self._task.delay(batch)
+        except Exception as ex:
+            self._errors+=1
+            _logger.exception('error publishing %d transactions lists', len(batch))
+            if self._wait: self._set_futures(futures, ex)
+            else: self._requeue(batch)
+            return
+        self._messages+=1
+        self._lists+=len(batch)
+        self._set_futures(futures)
+
+    def _set_futures(self, futures:list, exception:Exception=None):
+        #the requests cancelled (client disconnected) have not waiting
+        for future in futures:
+            if future.done(): continue
+            if exception is None: future.set_result(None)
+            else: future.set_exception(exception)
+
+    def _requeue(self, batch:list):
+        #the failed lists go back to the buffer head, so the order is kept
+        self._buffer = batch + self._buffer
+        #try again later (if there is a running loop, on shutdown there is not)
+        try: self._timer = asyncio.get_running_loop().call_later(max(self._max_delay, 1), self.flush)
+        except RuntimeError: pass
+
+    def get_stats(self):
+        return {'max_size':self._max_size, 'max_delay':self._max_delay, 'wait':self._wait, 
+            'pending':len(self._buffer), 'messages':self._messages, 'lists':self._lists, 
+            'errors':self._errors, 'refused':self._refused}
+
+
+_transaction_publisher = _TransactionPublisher(DB_TRANSACTIONS_BATCH['MAX_SIZE'], 
+    DB_TRANSACTIONS_BATCH['MAX_DELAY']/1000)
+
+def flush_transaction_publisher():
+    _transaction_publisher.flush()
+
+def get_transaction_publisher_stats():
+    return _transaction_publisher.get_stats()
+
+
+#the audit logs are written behind the business transactions, on their own queue
+#the requests do not wait the audit logs, they are published again while the broker fails
+_audit_log_publisher = _TransactionPublisher(AUDIT_LOGS_BATCH['MAX_SIZE'], 
+    AUDIT_LOGS_BATCH['MAX_DELAY']/1000, task=append_logs, single_task=None, wait=False)
+
+def flush_audit_log_publisher():
+    _audit_log_publisher.flush()
+
+def get_audit_log_publisher_stats():
+    return _audit_log_publisher.get_stats()
+
+
 #____________TRANSACTION_PROCESSOR_______________________________#
 
 class TransactionProcessor(TransactionProcessorInterface):
-    def __init__(self, db_session):
+    def __init__(self, db_session, publisher:_TransactionPublisher = _transaction_publisher,
+        audit_log_publisher:_TransactionPublisher = _audit_log_publisher):
         self._db_session = db_session
+        self._publisher = publisher
+        self._audit_log_publisher = audit_log_publisher
     
     def test_process_transactions(self, transactions_list:list):
         for transaction in transactions_list:
@@ -197,7 +461,11 @@ class TransactionProcessor(TransactionProcessorInterface):
     async def process(self, transactions_list:list):
         if TEST_MODE: self.test_process_transactions(transactions_list)
         else:
+            #the log creates go to the audit logs queue, the rest to the db-worker
             list_dict = []
             for transaction in transactions_list:
-                list_dict.append(transaction.dict())
-            process_transactions.delay(list_dict)
\ No newline at end of file
+                if transaction.type == 'create' and transaction.tablename == LogTable.__tablename__:
+                    await self._audit_log_publisher.publish(transaction.data)
+                else: list_dict.append(transaction.dict())
+            #returns when the broker has the transactions
+            if len(list_dict)>0: await self._publisher.publish(list_dict)
\ No newline at end of file
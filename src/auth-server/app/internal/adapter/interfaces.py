@@ -1,4 +1,5 @@
 import abc
+from datetime import datetime
 
 #internal
 from app.internal.domain.entities import Entity
@@ -14,6 +15,14 @@ class RepositoryInterface(abc.ABC):
 	@abc.abstractmethod
 	def find_many(self, skip:int=0, limit:int=100):
 		pass
+
+	@abc.abstractmethod
+	def find_many_after(self, after:tuple=None, limit:int=100):
+		pass
+
+	@abc.abstractmethod
+	def stream(self, fields:tuple, since:datetime=None):
+		pass
 	
 	@abc.abstractmethod
 	def get_tablename(self):
@@ -27,6 +36,27 @@ class RelationalRepositoryInterface(RepositoryInterface):
 		pass
 
 
+class UserRepositoryInterface(RepositoryInterface):
+
+	@abc.abstractmethod
+	def find_existing_emails(self, emails: list):
+		pass
+
+
+class UserPermissionRepositoryInterface(RelationalRepositoryInterface):
+
+	@abc.abstractmethod
+	def find_permissions_and_groups(self, user_id):
+		pass
+
+
+class GroupPermissionRepositoryInterface(RelationalRepositoryInterface):
+
+	@abc.abstractmethod
+	def find_permissions_by_groups(self, group_ids: list):
+		pass
+
+
 class CacheRepositoryInterface(abc.ABC):
 
 	@abc.abstractmethod
@@ -41,6 +71,47 @@ class CacheRepositoryInterface(abc.ABC):
 	def delete(self, key: str):
 		pass
 
+
+class RelationalCacheRepositoryInterface(CacheRepositoryInterface):
+
+	@abc.abstractmethod
+	def delete_many_by(self, repeated_data: dict):
+		pass
+
+
+class SessionCacheRepositoryInterface(RelationalCacheRepositoryInterface):
+
+	@abc.abstractmethod
+	def revoke(self, session_id: str, user_id: str):
+		pass
+
+	@abc.abstractmethod
+	def revoke_many_by(self, repeated_data: dict):
+		pass
+
+	@abc.abstractmethod
+	def get_revoked_since(self, user_id: str):
+		pass
+
+
+class GroupPermissionsCacheInterface(abc.ABC):
+
+	@abc.abstractmethod
+	def get_many(self, group_ids: list):
+		pass
+
+	@abc.abstractmethod
+	def set_many(self, group_permissions: dict, version:int):
+		pass
+
+	@abc.abstractmethod
+	def get_version(self):
+		pass
+
+	@abc.abstractmethod
+	def invalidate(self, group_ids: list=None):
+		pass
+
 #______________TRANSACTIONS_PROCESSOR_INTEFACES_____________#
 
 class TransactionProcessorInterface(abc.ABC):
@@ -88,6 +159,10 @@ class EmailSenderInterface(abc.ABC):
 	def send_signup_email(self, to:str, random_key:str, data:dict):
 		pass
 
+	@abc.abstractmethod
+	def send_signup_emails(self, emails:list):
+		pass
+
 	@abc.abstractmethod
 	def send_password_forget_email(self, to:str, random_key:str, data:dict):
 		pass
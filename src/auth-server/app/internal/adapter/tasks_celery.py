@@ -9,6 +9,9 @@ class EmailTask(Task):
 class DatabaseTask(Task):
 	queue=RABBITMQ_QUEUES['DB_TRANSACTIONS']
 
+class AuditLogTask(Task):
+	queue=RABBITMQ_QUEUES['AUDIT_LOGS']
+
 
 celery_auth = Celery('auth_server', broker=broker_auth)
 
@@ -22,6 +25,11 @@ def send_email(to, subject, message):
 def send_signup_email(to, random_code, data_dict):
 	return _send_signup_email(to, random_code)
 
+@celery_auth.task(base=EmailTask, name='send_signup_emails')
+def send_signup_emails(emails):
+	#emails = [[to, random_code], ...]
+	return _send_signup_emails(emails)
+
 @celery_auth.task(base=EmailTask, name='send_password_forget_email')
 def send_password_forget_email(to, random_code, data_dict):
 	return _send_password_forget_email(to, random_code)
@@ -34,4 +42,15 @@ def send_set_email(to, random_code, data_dict):
 #____________________________DATABASE_TASKS____________________________#
 @celery_auth.task(base=DatabaseTask, name='process_transactions')
 def process_transactions(transactions_list):
-	return _process_transactions(transactions_list)
\ No newline at end of file
+	return _process_transactions(transactions_list)
+
+@celery_auth.task(base=DatabaseTask, name='process_transactions_batch')
+def process_transactions_batch(transactions_lists):
+	return _process_transactions_batch(transactions_lists)
+
+
+#____________________________AUDIT_LOG_TASKS____________________________#
+@celery_auth.task(base=AuditLogTask, name='append_logs')
+def append_logs(logs):
+	#logs = [log_data, ...]
+	return _append_logs(logs)
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+"""
+Cache equema
+{
+    'key': (value, expire_datetime),
+    'key2': (value, expire_datetime),
+    ...
+}
+"""
+
+_cache={}
+
+
+def _is_expired(key:str):
+    item = _cache.get(key)
+    if item is None: return True
+    if item[1] < datetime.now():
+        del _cache[key]
+        return True
+    return False
+
+#___________METHODS__________________________________________#
+
+def test_cache_set(key:str, value, expire:timedelta):
+    _cache[key] = (value, datetime.now()+expire)
+
+def test_cache_get(key:str):
+    if _is_expired(key): return None
+    return _cache[key][0]
+
+def test_cache_delete(key:str):
+    if key in _cache: del _cache[key]
+
+def test_cache_add_to_set(key:str, member:str, expire:timedelta):
+    members = test_cache_get(key)
+    if members is None: members = set()
+    members.add(member)
+    test_cache_set(key, members, expire)
+
+def test_cache_get_set(key:str):
+    members = test_cache_get(key)
+    if members is None: return set()
+    return members
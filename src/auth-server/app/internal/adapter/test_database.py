@@ -91,6 +91,18 @@ def test_find_many(tablename:str, skip:int=0, limit:int=100):
     if len(list_data)>limit: return list_data[skip:limit]
     else: return list_data
 
+def test_find_many_after(tablename:str, after:tuple=None, limit:int=100):
+    list_data = sorted(_database.get(tablename, []), key=lambda data: (data['created'], str(data['id'])))
+    if after is not None:
+        after = (after[0], str(after[1]))
+        list_data = [data for data in list_data if (data['created'], str(data['id']))>after]
+    return list_data[:limit]
+
+def test_stream(tablename:str, fields:tuple, since:datetime=None):
+    for data in _database.get(tablename, []):
+        if since is None or data['created']>=since:
+            yield {field: data.get(field) for field in fields}
+
 def test_find_many_by(tablename:str, repeated_data:dict):
     list_data = _database.get(tablename)
     list_return_data=[]
@@ -100,6 +112,29 @@ def test_find_many_by(tablename:str, repeated_data:dict):
             list_return_data.append(data)
     return list_return_data
 
+def test_find_permissions_and_groups(user_id):
+    #user own permissions and groups, without repeated
+    permission_names = []
+    group_names = []
+    for user_permission in test_find_many_by('user_permissions', {'user_id':user_id}):
+        if user_permission['permission_id'] not in permission_names:
+            permission_names.append(user_permission['permission_id'])
+    for user_group in test_find_many_by('user_groups', {'user_id':user_id}):
+        if user_group['group_id'] not in group_names:
+            group_names.append(user_group['group_id'])
+    return permission_names, group_names
+
+def test_find_permissions_by_groups(group_ids:list):
+    group_permissions = {group_id:[] for group_id in group_ids}
+    for group_permission in _database.get('group_permissions', []):
+        if group_permission['group_id'] in group_permissions:
+            group_permissions[group_permission['group_id']].append(group_permission['permission_id'])
+    return group_permissions
+
+def test_find_existing_emails(emails:list):
+    emails = set(emails)
+    return {user['email'] for user in _database.get('users', []) if user['email'] in emails}
+
 def test_save(tablename:str, data:dict):
     list_data = _database.get(tablename)
     if list_data is None: _database[tablename] = [data]
@@ -2,18 +2,20 @@ import abc
 import uuid
 import asyncio
 import json
+import base64
 from datetime import datetime
 
 #interfaces
-from app.internal.domain.interfaces import ManagerInterface, RandomManagerInterface, RelationalManagerInterface
-from .interfaces import (AdminCRUDServiceInterface, AdminPermissionServiceInterface, AdminGroupServiceInterface,
-    AdminSessionServiceInterface)
+from app.internal.domain.interfaces import (ManagerInterface, RandomManagerInterface, RelationalManagerInterface,
+    GroupPermissionManagerInterface, UserManagerInterface)
+from .interfaces import (AdminCRUDServiceInterface, AdminUserCRUDServiceInterface, AdminPermissionServiceInterface, 
+    AdminGroupServiceInterface, AdminSessionServiceInterface, AdminExportServiceInterface)
 from app.internal.adapter.interfaces import EmailSenderInterface, TransactionProcessorInterface
 
 #others
 from app.internal.exceptions import HTTPExceptionGenerator, DictValidatorException
 from app.internal import warnings as war
-from app.internal.validators import (CreateUserAdminValidator, SetUserAdminValidator,
+from app.internal.validators import (CreateUserAdminValidator, CreateUsersBulkAdminValidator, SetUserAdminValidator,
     GetUserAdminValidator, CreatePermissionAdminValidator, GetPermissionAdminValidator,
     CreateGroupAdminValidator, GetGroupAdminValidator, BaseDictValidator,
     GrantPermissionToUserValidator, GrantPermissionToGroupValidator, RemoveUserPermissionValidator,
@@ -64,6 +66,32 @@ class BaseAdminService():
                     error_type='range', msg=war.incorrect_msg('range')))
 
 
+    #______KEYSET_PAGINATION______#
+
+    def _encode_cursor(self, object):
+        #opaque cursor with the (created, id) of the last object of the page
+        cursor = json.dumps([object.created.isoformat(), str(object.id)])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def _decode_cursor(self, cursor:str, id_class=str):
+        try:
+            created, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(created), id_class(id)
+        except Exception:
+            raise HTTPExceptionGenerator(status_code=400,
+                detail=HTTPExceptionGenerator.generate_detail(fields=['cursor'], 
+                    error_type='invalid', msg=war.invalid_msg('cursor')))
+
+    async def _get_page(self, manager:ManagerInterface, cursor:str, limit:int, id_class=str):
+        #empty cursor, the first page. next_cursor is None on the last page
+        self._validate_skip_limit(0, limit)
+        after = None
+        if cursor!='': after = self._decode_cursor(cursor, id_class)
+        objects = await manager.get_many_after(after, limit)
+        next_cursor = None
+        if len(objects)==limit: next_cursor = self._encode_cursor(objects[-1])
+        return {'items':objects, 'next_cursor':next_cursor}
+
     def _check_is_original(self, is_original:bool, name:str):
         if is_original:
             raise HTTPExceptionGenerator(status_code=403,
@@ -76,12 +104,13 @@ class BaseAdminService():
 
 #________________________USER_CRUD_SERVICE_______________________________________#
 
-class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
+class UserCRUDService(BaseAdminService, AdminUserCRUDServiceInterface):
 
     def __init__(self, user_id, transaction_processor: TransactionProcessorInterface,
-        user_manager: ManagerInterface, random_manager: RandomManagerInterface,    
+        user_manager: UserManagerInterface, random_manager: RandomManagerInterface,    
         user_permission_manager: RelationalManagerInterface, user_group_manager: RelationalManagerInterface,
-        session_manager: RelationalManagerInterface, email_sender: EmailSenderInterface):
+        session_manager: RelationalManagerInterface, email_sender: EmailSenderInterface,
+        bulk_hash_concurrency:int=1):
 
         self._transaction_processor = transaction_processor
         self._user_id = user_id
@@ -91,6 +120,7 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
         self._user_group_manager = user_group_manager
         self._session_manager = session_manager
         self._email_sender = email_sender
+        self._bulk_hash_concurrency = bulk_hash_concurrency
 
     
     async def create(self, data: dict):
@@ -104,7 +134,7 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
         transactions_list = []
 
         #create the user
-        user, tran = self._user_manager.create(data)
+        user, tran = await self._user_manager.create(data)
         transactions_list.extend(tran)
 
         #check if the user have signup completed
@@ -125,6 +155,45 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
         return {'id':user.id}
 
+    def _check_emails(self, emails:list, existing_emails:set):
+        #the emails can't exist or be repeated on the request
+        errors = []
+        received = set()
+        for index, email in enumerate(emails):
+            if email in existing_emails or email in received:
+                errors.extend(HTTPExceptionGenerator.generate_detail(fields=['users', index, 'email'], 
+                    error_type='exist', msg=war.exist_msg('email')))
+            received.add(email)
+        if len(errors)>0: raise HTTPExceptionGenerator(status_code=400, detail=errors)
+
+    async def create_many(self, data: dict):
+        #data.keys() = ['users'], users = [{'email', 'username', 'password', 'is_complete'}, ...]
+        self._validate_received_data(CreateUsersBulkAdminValidator, data)
+        users_data = data['users']
+
+        #check all the emails using only one query
+        emails = [user_data['email'] for user_data in users_data]
+        self._check_emails(emails, await self._user_manager.get_existing_emails(emails))
+
+        #create the users (hash the passwords in parallel)
+        users, transactions_list = await self._user_manager.create_many(users_data, self._bulk_hash_concurrency)
+
+        #create the randoms of the users without signup completed
+        signup_emails = []
+        for user in users:
+            if user.is_complete: continue
+            random, tran = self._random_manager.create({'id':user.id, 'flow':'signup'})
+            transactions_list.extend(tran)
+            signup_emails.append((user.email, random.key))
+
+        #send signup emails (in batches)
+        self._email_sender.send_signup_emails(signup_emails)
+
+        #process all transactions together
+        await self._transaction_processor.process(transactions_list)
+
+        return {'ids':[user.id for user in users]}
+
     async def get(self, data:dict):
         #data.keys() = ['id']
         self._validate_received_data(GetUserAdminValidator, data)
@@ -157,7 +226,8 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
         return user
 
-    async def get_many(self, skip:int, limit:int):
+    async def get_many(self, skip:int, limit:int, cursor:str=None):
+        if cursor is not None: return await self._get_page(self._user_manager, cursor, limit, uuid.UUID)
         self._validate_skip_limit(skip, limit)
         return await self._user_manager.get_many(skip,limit)
 
@@ -174,7 +244,7 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
         transactions_list = []
 
         #set the user
-        tran = self._user_manager.update({'id':user.id}, data)
+        tran = await self._user_manager.update({'id':user.id}, data)
         transactions_list.extend(tran)
 
         #check is_complete to delete random
@@ -207,7 +277,7 @@ class UserCRUDService(BaseAdminService, AdminCRUDServiceInterface):
         transactions_list.extend(tran)
 
         #delete all sessions
-        tran = self._session_manager.delete_many_by({'user_id':user.id})
+        tran = await self._session_manager.delete_many_by({'user_id':user.id})
         transactions_list.extend(tran)
 
         #delete all randoms
@@ -231,7 +301,7 @@ class PermissionCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
     def __init__(self, user_id, transaction_processor: TransactionProcessorInterface, 
         permission_manager: ManagerInterface, user_permission_manager: RelationalManagerInterface,
-        group_permission_manager: RelationalManagerInterface):
+        group_permission_manager: GroupPermissionManagerInterface):
 
         self._transaction_processor = transaction_processor
         self._user_id = user_id
@@ -273,7 +343,8 @@ class PermissionCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
         return permission
     
-    async def get_many(self, skip:int, limit:int):
+    async def get_many(self, skip:int, limit:int, cursor:str=None):
+        if cursor is not None: return await self._get_page(self._permission_manager, cursor, limit)
         self._validate_skip_limit(skip, limit)
         return await self._permission_manager.get_many(skip,limit)
 
@@ -306,6 +377,9 @@ class PermissionCRUDService(BaseAdminService, AdminCRUDServiceInterface):
         #process transactions
         await self._transaction_processor.process(transactions_list)
 
+        #the permission can be on any group
+        await self._group_permission_manager.invalidate_cache()
+
         return {'detail':'permission deleted'}
 
 
@@ -316,7 +390,7 @@ class GroupCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
     def __init__(self, user_id, transaction_processor: TransactionProcessorInterface,
         group_manager: ManagerInterface, user_group_manager: RelationalManagerInterface,
-        group_permission_manager: RelationalManagerInterface):
+        group_permission_manager: GroupPermissionManagerInterface):
         
         self._transaction_processor = transaction_processor
         self._user_id = user_id
@@ -357,7 +431,8 @@ class GroupCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
         return group
     
-    async def get_many(self, skip:int, limit:int):
+    async def get_many(self, skip:int, limit:int, cursor:str=None):
+        if cursor is not None: return await self._get_page(self._group_manager, cursor, limit)
         self._validate_skip_limit(skip, limit)
         return await self._group_manager.get_many(skip,limit)
 
@@ -389,6 +464,7 @@ class GroupCRUDService(BaseAdminService, AdminCRUDServiceInterface):
 
         #process transactions
         await self._transaction_processor.process(transactions_list)
+        await self._group_permission_manager.invalidate_cache([group.id])
 
         return {'detail':'group deleted'}
 
@@ -403,7 +479,7 @@ class PermissionGrantService(BaseAdminService, AdminPermissionServiceInterface):
     def __init__(self, user_id, transaction_processor: TransactionProcessorInterface,
         permission_manager: ManagerInterface, group_manager: ManagerInterface,
         user_manager: ManagerInterface, user_permission_manager: RelationalManagerInterface,
-        group_permission_manager: RelationalManagerInterface):
+        group_permission_manager: GroupPermissionManagerInterface):
 
         self._transaction_processor = transaction_processor
         self._user_id = user_id
@@ -472,6 +548,7 @@ class PermissionGrantService(BaseAdminService, AdminPermissionServiceInterface):
         
         #process transactions
         await self._transaction_processor.process(tran)
+        await self._group_permission_manager.invalidate_cache([data['group_id']])
 
         return {'detail':'permission granted'}
 
@@ -506,11 +583,12 @@ class PermissionGrantService(BaseAdminService, AdminPermissionServiceInterface):
         #check if the group_permission is not original
         self._check_is_original(group_permission.is_original, 'group_permission')
 
-        #create group_permission
+        #delete group_permission
         tran = self._group_permission_manager.delete(data)
 
         #process transactions
         await self._transaction_processor.process(tran)
+        await self._group_permission_manager.invalidate_cache([data['group_id']])
 
         return {'detail':'permission removed'}
 
@@ -602,7 +680,7 @@ class SessionManagementService(BaseAdminService, AdminSessionServiceInterface):
         session = self._check_not_found(result[1], 'session')
         
         #delete
-        return self._session_manager.delete({'user_id':data['user_id'], 'session_id':data['session_id']})
+        return await self._session_manager.delete({'user_id':data['user_id'], 'session_id':data['session_id']})
     
     async def _remove_many_sessions(self, data:dict):
         #check if the user exist
@@ -610,7 +688,7 @@ class SessionManagementService(BaseAdminService, AdminSessionServiceInterface):
             await self._user_manager.get({'id':data['user_id']}),'user_id')
         
         #delete all sessions
-        return self._session_manager.delete_many_by({'user_id':user.id})
+        return await self._session_manager.delete_many_by({'user_id':user.id})
         
     async def remove_session(self, data: dict):
         #data.keys() = ['user_id'] or ['user_id', 'session_id']
@@ -625,4 +703,31 @@ class SessionManagementService(BaseAdminService, AdminSessionServiceInterface):
         #process transactions
         await self._transaction_processor.process(tran)
         
-        return {'detail':'Session removed'}
\ No newline at end of file
+        return {'detail':'Session removed'}
+
+
+
+#____________________________EXPORT_SERVICE__________________________________________#
+
+def _json_default(value):
+    if isinstance(value, datetime): return value.isoformat()
+    return str(value)
+
+class ExportService(BaseAdminService, AdminExportServiceInterface):
+    """
+    Export all the objects of a manager as NDJSON (one json object per line),
+    the rows are streamed from the database and sent in chunks of chunk_size lines
+    """
+    def __init__(self, manager:ManagerInterface, fields:tuple, chunk_size:int=500):
+        self._manager = manager
+        self._fields = fields
+        self._chunk_size = chunk_size
+
+    async def export(self, since:datetime=None):
+        lines = []
+        async for row in self._manager.stream(self._fields, since):
+            lines.append(json.dumps(row, default=_json_default))
+            if len(lines)==self._chunk_size:
+                yield '\n'.join(lines)+'\n'
+                lines = []
+        if len(lines)>0: yield '\n'.join(lines)+'\n'
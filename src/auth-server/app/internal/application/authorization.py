@@ -1,8 +1,9 @@
 import json
+from fastapi import HTTPException
 from app.internal.adapter.interfaces import TokenGeneratorInterface
 from .interfaces import IntraServiceInterface
 
-from app.internal.validators import CheckAuthorizationValidator
+from app.internal.validators import CheckAuthorizationValidator, CheckAuthorizationBatchValidator
 from app.internal.exceptions import HTTPExceptionGenerator
 from app.internal import warnings as war
 
@@ -19,44 +20,90 @@ class CheckAuthorizationService(IntraServiceInterface):
 		try: self.validator_class.validate(data)
 		except Exception as ex: raise HTTPExceptionGenerator(status_code=400, detail=json.loads(ex.json()))
 	
-	def _have_permission(self, decoded_access:dict, permission_name:str):
-		for name in decoded_access['permissions']:
-			if name == permission_name or name == 'admin': return True
-		return False
+	def _as_set(self, names):
+		if isinstance(names, frozenset): return names
+		return frozenset(names)
+
+	def _have_permissions(self, decoded_access:dict, permission_names:list):
+		permissions = self._as_set(decoded_access['permissions'])
+		#admin have all permissions
+		if 'admin' in permissions: return True
+		return permissions.issuperset(permission_names)
 	
-	def _have_group(self, decoded_access:dict, group_name:str):
-		for name in decoded_access['groups']:
-			if name == group_name: return True
-		return False
+	def _have_groups(self, decoded_access:dict, group_names:list):
+		return self._as_set(decoded_access['groups']).issuperset(group_names)
 	
 	def _unauthorized_exception(self):
 		return HTTPExceptionGenerator(status_code=401,
 			detail=HTTPExceptionGenerator.generate_detail(fields=['access_token'],
 				error_type='unauthorized', msg=war.unauthorized_msg()))
 	
-	def start_service(self, data: dict):
-		#validate data
-		self._validate_received_data(data)
-		access_token = data['access_token']
-
-		#check bearer
+	def _remove_bearer(self, access_token:str):
 		bearer = 'Bearer '
 		posi = access_token.find(bearer)
 		if posi>-1: access_token = access_token[len(bearer)+posi:]
+		return access_token
 
-		#decode access token
-		decoded_access = self._token_generator.decode_access_token(access_token)
-
+	def _check_authorization(self, decoded_access:dict, data:dict):
 		#check groups
 		if data.get('groups') is not None:
-			for name in data['groups']:
-				if not self._have_group(decoded_access, name): 
-					raise self._unauthorized_exception()
+			if not self._have_groups(decoded_access, data['groups']):
+				raise self._unauthorized_exception()
 		
 		#check permissions
 		if data.get('permissions') is not None:
-			for name in data['permissions']:
-				if not self._have_permission(decoded_access, name): 
-					raise self._unauthorized_exception()
+			if not self._have_permissions(decoded_access, data['permissions']):
+				raise self._unauthorized_exception()
+
+		return {'user_id':decoded_access['user_id'], 'session_id':decoded_access['sub']}
+	
+	def start_service(self, data: dict):
+		#validate data
+		self._validate_received_data(data)
+
+		#check bearer
+		access_token = self._remove_bearer(data['access_token'])
+
+		#decode access token
+		decoded_access = self._token_generator.decode_access_token(access_token)
+
+		return self._check_authorization(decoded_access, data)
+
+
+class CheckAuthorizationBatchService(CheckAuthorizationService):
+	"""
+	Checks many items (access_token, permissions and groups) on one call, each item have
+	your own result. The repeated access tokens are decoded only once.
+	"""
+	validator_class=CheckAuthorizationBatchValidator
+
+	def _decode(self, access_token:str):
+		#return (decoded_access, None) or (None, exception)
+		try: return self._token_generator.decode_access_token(access_token), None
+		except HTTPException as ex: return None, ex
+
+	def _error_result(self, ex:HTTPException):
+		return {'authorized':False, 'status_code':ex.status_code, 'detail':ex.detail}
+
+	def start_service(self, data: dict):
+		#validate data
+		self._validate_received_data(data)
+
+		decoded_tokens = {}
+		results = []
+		for item in data['items']:
+			access_token = self._remove_bearer(item['access_token'])
+			if access_token not in decoded_tokens: decoded_tokens[access_token] = self._decode(access_token)
+			decoded_access, ex = decoded_tokens[access_token]
+
+			if ex is not None:
+				results.append(self._error_result(ex))
+				continue
+			try: result = self._check_authorization(decoded_access, item)
+			except HTTPException as ex:
+				results.append(self._error_result(ex))
+				continue
+			result['authorized'] = True
+			results.append(result)
 
-		return {'user_id':decoded_access['user_id'], 'session_id':decoded_access['sub']}
\ No newline at end of file
+		return {'results':results}
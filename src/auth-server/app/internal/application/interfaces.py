@@ -1,4 +1,5 @@
 import abc
+from datetime import datetime
 
 #___________________________SERVICES_INTEFACES_______________________________#
 
@@ -43,7 +44,7 @@ class AdminCRUDServiceInterface(abc.ABC):
 		pass
 
 	@abc.abstractmethod
-	def get_many(self, skip:int=0, limit:int=100):
+	def get_many(self, skip:int=0, limit:int=100, cursor:str=None):
 		pass
 	
 	@abc.abstractmethod
@@ -55,6 +56,13 @@ class AdminCRUDServiceInterface(abc.ABC):
 		pass
 
 
+class AdminUserCRUDServiceInterface(AdminCRUDServiceInterface):
+
+	@abc.abstractmethod
+	def create_many(self, data: dict):
+		pass
+
+
 class AdminPermissionServiceInterface(abc.ABC):
 
 	@abc.abstractmethod
@@ -89,4 +97,11 @@ class AdminSessionServiceInterface(abc.ABC):
 
 	@abc.abstractmethod
 	def remove_session(self, data: dict):
-		pass
\ No newline at end of file
+		pass
+
+
+class AdminExportServiceInterface(abc.ABC):
+
+	@abc.abstractmethod
+	def export(self, since:datetime=None):
+		pass
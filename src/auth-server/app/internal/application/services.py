@@ -5,7 +5,8 @@ import json
 from datetime import datetime
 
 #interfaces
-from app.internal.domain.interfaces import ManagerInterface, RandomManagerInterface, RelationalManagerInterface
+from app.internal.domain.interfaces import (ManagerInterface, RandomManagerInterface, RelationalManagerInterface,
+	UserPermissionManagerInterface, GroupPermissionManagerInterface)
 from .interfaces import AuthServiceInterface, NoAuthServiceInterface
 from app.internal.adapter.interfaces import (TransactionProcessorInterface, EmailSenderInterface, 
 	TokenGeneratorInterface, PasswordHasherInterface)
@@ -75,11 +76,11 @@ class BaseService():
 
 class BaseAuthService(BaseService):
 
-	def _auth_user(self, user, plain_password:str, is_complete:bool, 
+	async def _auth_user(self, user, plain_password:str, is_complete:bool, 
 		password_hasher: PasswordHasherInterface):
 
 		#compare user passwords
-		if not password_hasher.compare_passwords(plain_password+user.salt, user.password):
+		if not await password_hasher.compare_passwords(plain_password+user.salt, user.password):
 			raise HTTPExceptionGenerator(status_code=400,
 				detail=HTTPExceptionGenerator.generate_detail(fields=['password'], 
 					error_type='incorrect', msg=war.incorrect_password_msg()))
@@ -101,45 +102,19 @@ class BaseAuthService(BaseService):
 					error_type='incorrect', msg=war.incorrect_msg('random')))
 
 
-	async def _get_user_permissions_and_groups(self, user_id,
-		user_permission_manager: RelationalManagerInterface,
-		user_group_manager: RelationalManagerInterface,
-		group_permission_manager: RelationalManagerInterface):
-
-		#result[0] => user_permissions | result[1] => user_groups
-		result = await asyncio.gather(*[
-			user_permission_manager.get_many_by({'user_id':user_id}),
-			user_group_manager.get_many_by({'user_id':user_id})])
-		
-		permission_names = []
-		group_names = []
-
-		for user_permission in result[0]:
-			permission_names.append(user_permission.permission_id)
-
-		courotine2 = []
-		for user_group in result[1]:
-			group_names.append(user_group.group_id)
-			courotine2.append(group_permission_manager.get_many_by({'group_id':user_group.group_id}))
-
-		if len(group_names)==0: return permission_names, group_names
-
-		#result2 => group_permissions
-		result2 = await asyncio.gather(*courotine2)
-		for group_permissions in result2:
-			for group_permission in group_permissions:
-				permission_names.append(group_permission.permission_id)
-
-		return permission_names, group_names
-
-
 	async def _get_user_infos(self, user_id, username:str,
-		user_permission_manager: RelationalManagerInterface,
-		user_group_manager: RelationalManagerInterface,
-		group_permission_manager: RelationalManagerInterface):
-		
-		permissions, groups = await self._get_user_permissions_and_groups(user_id, 
-			user_permission_manager, user_group_manager, group_permission_manager)
+		user_permission_manager: UserPermissionManagerInterface,
+		group_permission_manager: GroupPermissionManagerInterface):
+		
+		#own permissions and groups on one query, the groups permissions are cached
+		permissions, groups = await user_permission_manager.get_permissions_and_groups(user_id)
+		if len(groups)>0:
+			permission_names = set(permissions)
+			for group_permissions in (await group_permission_manager.get_permissions_of_groups(groups)).values():
+				for name in group_permissions:
+					if name not in permission_names:
+						permission_names.add(name)
+						permissions.append(name)
 		
 		user_infos = {'user_id': str(user_id), 
 			'permissions': permissions, 'groups': groups}
@@ -175,7 +150,7 @@ class SignupService(BaseService, NoAuthServiceInterface):
 		transactions_list = []
 
 		#create the user
-		user, tran = self._user_manager.create(data)
+		user, tran = await self._user_manager.create(data)
 		transactions_list.extend(tran)
 
 		#create random
@@ -203,15 +178,14 @@ class CompleteSignupService(BaseAuthService, NoAuthServiceInterface):
 
 	def __init__(self, transaction_processor: TransactionProcessorInterface,
 		user_manager: ManagerInterface, random_manager: RandomManagerInterface,
-		user_permission_manager: RelationalManagerInterface, user_group_manager: RelationalManagerInterface, 
-		group_permission_manager: RelationalManagerInterface, session_manager: RelationalManagerInterface,
-		token_generator: TokenGeneratorInterface, password_hasher: PasswordHasherInterface):
+		user_permission_manager: UserPermissionManagerInterface, group_permission_manager: GroupPermissionManagerInterface,
+		session_manager: RelationalManagerInterface, token_generator: TokenGeneratorInterface, 
+		password_hasher: PasswordHasherInterface):
 
 		self._transaction_processor= transaction_processor
 		self._user_manager = user_manager
 		self._random_manager = random_manager
 		self._user_permission_manager = user_permission_manager
-		self._user_group_manager = user_group_manager
 		self._group_permission_manager = group_permission_manager
 		self._session_manager = session_manager
 		self._token_generator = token_generator
@@ -237,10 +211,10 @@ class CompleteSignupService(BaseAuthService, NoAuthServiceInterface):
 		self._validate_random(random, data['random'], self._random_manager)
 
 		#compare passwords and check complete signup
-		self._auth_user(user, data['password'], False, self._password_hasher)
+		await self._auth_user(user, data['password'], False, self._password_hasher)
 
 		#set is_complete to true
-		tran=self._user_manager.update({'id':user.id}, {'is_complete':True})
+		tran=await self._user_manager.update({'id':user.id}, {'is_complete':True})
 		transactions_list.extend(tran)
 
 		#delete random
@@ -248,13 +222,13 @@ class CompleteSignupService(BaseAuthService, NoAuthServiceInterface):
 		transactions_list.extend(tran)
 
 		#create session
-		session, tran = self._session_manager.create({'user_id':user.id, 
+		session, tran = await self._session_manager.create({'user_id':user.id, 
 			'expirated':self._token_generator.get_next_expirated()})
 		transactions_list.extend(tran)
 
 		#get user infos (permissions and groups)
-		user_infos = await self._get_user_infos(user.id, user.username,
-			self._user_permission_manager, self._user_group_manager, self._group_permission_manager)
+		user_infos = await self._get_user_infos(user.id, user.username, 
+			self._user_permission_manager, self._group_permission_manager)
 		user_infos['sub'] = str(session.session_id)
 
 		#process transactions
@@ -322,15 +296,13 @@ class AuthenticationService(BaseAuthService, NoAuthServiceInterface):
 	validator_class= AuthenticationValidator
 
 	def __init__(self, transaction_processor: TransactionProcessorInterface,
-		user_manager: ManagerInterface, user_permission_manager: RelationalManagerInterface,
-		user_group_manager: RelationalManagerInterface, group_permission_manager: RelationalManagerInterface,
-		session_manager: RelationalManagerInterface, token_generator: TokenGeneratorInterface, 
-		password_hasher: PasswordHasherInterface):
+		user_manager: ManagerInterface, user_permission_manager: UserPermissionManagerInterface,
+		group_permission_manager: GroupPermissionManagerInterface, session_manager: RelationalManagerInterface,
+		token_generator: TokenGeneratorInterface, password_hasher: PasswordHasherInterface):
 
 		self._transaction_processor = transaction_processor
 		self._user_manager = user_manager
 		self._user_permission_manager = user_permission_manager
-		self._user_group_manager = user_group_manager
 		self._group_permission_manager = group_permission_manager
 		self._session_manager = session_manager
 		self._token_generator = token_generator
@@ -348,18 +320,18 @@ class AuthenticationService(BaseAuthService, NoAuthServiceInterface):
 			await self._user_manager.get({'email':data['email']}),'email')
 		
 		#compare passwords and check complete signup
-		self._auth_user(user, data['password'], True, self._password_hasher)
+		await self._auth_user(user, data['password'], True, self._password_hasher)
 		
 		transactions_list = []
 
 		#create session
-		session, tran = self._session_manager.create({'user_id':user.id, 
+		session, tran = await self._session_manager.create({'user_id':user.id, 
 			'expirated':self._token_generator.get_next_expirated()})
 		transactions_list.extend(tran)
 		
 		#get user infos (permissions and groups)
-		user_infos = await self._get_user_infos(user.id, user.username,
-			self._user_permission_manager, self._user_group_manager, self._group_permission_manager)
+		user_infos = await self._get_user_infos(user.id, user.username, 
+			self._user_permission_manager, self._group_permission_manager)
 		user_infos['sub'] = str(session.session_id)
 		
 		#process transactions
@@ -476,7 +448,7 @@ class RestaurePasswordService(BaseAuthService, NoAuthServiceInterface):
 		transactions_list = []
 
 		#set user password
-		tran = self._user_manager.update({'id':user.id}, {'password': data['new_password']})
+		tran = await self._user_manager.update({'id':user.id}, {'password': data['new_password']})
 		transactions_list.extend(tran)
 
 		#delete random
@@ -577,12 +549,12 @@ class SetPasswordService(BaseAuthService, AuthServiceInterface):
 			await self._user_manager.get({'id':self._user_id}),'user')
 		
 		#compare passwords and check complete signup
-		self._auth_user(user, data['password'], True, self._password_hasher)
+		await self._auth_user(user, data['password'], True, self._password_hasher)
 
 		transactions_list = []
 
 		#set user password
-		tran = self._user_manager.update({'id':user.id}, {'password': data['new_password']})
+		tran = await self._user_manager.update({'id':user.id}, {'password': data['new_password']})
 		transactions_list.extend(tran)
 
 		#process transactions
@@ -622,7 +594,7 @@ class SetEmailService(BaseAuthService, AuthServiceInterface):
 		user = self._check_not_found(result[0],'user')
 
 		#compare passwords and check complete signup
-		self._auth_user(user, data['password'], True, self._password_hasher)
+		await self._auth_user(user, data['password'], True, self._password_hasher)
 
 		#check if random exist
 		self._check_found(result[1],'random')
@@ -679,7 +651,7 @@ class CompleteSetEmailService(BaseAuthService, AuthServiceInterface):
 		transactions_list = []
 
 		#set user email
-		tran = self._user_manager.update({'id':user.id}, {'email': random.value})
+		tran = await self._user_manager.update({'id':user.id}, {'email': random.value})
 		transactions_list.extend(tran)
 
 		#delete random
@@ -775,7 +747,7 @@ class LogoutService(BaseService, AuthServiceInterface):
 		transactions_list = []
 		
 		#delete session
-		tran = self._session_manager.delete({'user_id':self._user_id, 'session_id':self._session_id})
+		tran = await self._session_manager.delete({'user_id':self._user_id, 'session_id':self._session_id})
 		transactions_list.extend(tran)
 
 		#process transactions
@@ -852,12 +824,12 @@ class SetUsernameService(BaseAuthService, AuthServiceInterface):
 		user = self._check_not_found(await self._user_manager.get({'id': self._user_id}), 'user')
 		
 		#compare passwords and check complete signup
-		self._auth_user(user, data['password'], True, self._password_hasher)
+		await self._auth_user(user, data['password'], True, self._password_hasher)
 
 		if user.username == data['new_username']: return {'detail':'username setted'}
 		
 		#set username
-		tran = self._user_manager.update({'id':user.id}, {'username':data['new_username']})
+		tran = await self._user_manager.update({'id':user.id}, {'username':data['new_username']})
 		#process transactions
 		await self._transaction_processor.process(tran)
 
@@ -19,6 +19,14 @@ class ManagerInterface(abc.ABC):
 	def get_many(self, skip:int=0, limit:int=100):
 		pass
 
+	@abc.abstractmethod
+	def get_many_after(self, after:tuple=None, limit:int=100):
+		pass
+
+	@abc.abstractmethod
+	def stream(self, fields:tuple, since:datetime=None):
+		pass
+
 	@abc.abstractmethod
 	def update(self, unique_data: dict, new_data: dict):
 		pass
@@ -38,6 +46,32 @@ class RelationalManagerInterface(ManagerInterface):
 		pass
 
 
+class UserManagerInterface(ManagerInterface):
+	@abc.abstractmethod
+	def get_existing_emails(self, emails:list):
+		pass
+
+	@abc.abstractmethod
+	def create_many(self, datas:list, max_concurrency:int=1):
+		pass
+
+
+class UserPermissionManagerInterface(RelationalManagerInterface):
+	@abc.abstractmethod
+	def get_permissions_and_groups(self, user_id):
+		pass
+
+
+class GroupPermissionManagerInterface(RelationalManagerInterface):
+	@abc.abstractmethod
+	def get_permissions_of_groups(self, group_ids:list):
+		pass
+
+	@abc.abstractmethod
+	def invalidate_cache(self, group_ids:list=None):
+		pass
+
+
 class RandomManagerInterface(RelationalManagerInterface):
 	@abc.abstractmethod
 	def is_expired(self, updated:datetime):
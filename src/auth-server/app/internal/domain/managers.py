@@ -1,4 +1,5 @@
 import abc
+import asyncio
 import json
 import uuid
 import random
@@ -6,11 +7,13 @@ from datetime import datetime
 
 #interfaces
 from app.internal.adapter.interfaces import (RepositoryInterface, RelationalRepositoryInterface, 
-	PasswordHasherInterface)
+	PasswordHasherInterface, SessionCacheRepositoryInterface, UserRepositoryInterface,
+	UserPermissionRepositoryInterface, GroupPermissionRepositoryInterface, GroupPermissionsCacheInterface)
 from .entities import (User, Random, Permission, Group, UserPermission, UserGroup, 
 	GroupPermission, Log, Session)
 from .transactions import Create, Update, Delete, DeleteManyBy
-from .interfaces import ManagerInterface, RandomManagerInterface, RelationalManagerInterface
+from .interfaces import (ManagerInterface, RandomManagerInterface, RelationalManagerInterface,
+	UserManagerInterface, UserPermissionManagerInterface, GroupPermissionManagerInterface)
 
 #others
 from app.internal.exceptions import AuthServerException
@@ -51,6 +54,13 @@ class BaseManager(ManagerInterface):
 	async def get_many(self, skip:int=0, limit:int=100):
 		return await self._repository.find_many(skip,limit)
 
+	async def get_many_after(self, after:tuple=None, limit:int=100):
+		return await self._repository.find_many_after(after,limit)
+
+	def stream(self, fields:tuple, since:datetime=None):
+		#async generator of dicts, without entities
+		return self._repository.stream(fields, since)
+
 	def update(self, unique_data:dict, new_data:dict):
 		new_data['updated'] = datetime.now()
 
@@ -149,12 +159,12 @@ class BaseLoggedRelationalManager(BaseLoggedManager, RelationalManagerInterface)
 
 #_________________________USER_MANAGER___________________________________#
 
-class UserManager(BaseLoggedManager):
+class UserManager(BaseLoggedManager, UserManagerInterface):
 	entity_class = User
 	validator_create_class = CreateUserValidator
 	validator_update_class = UpdateUserValidator
 
-	def __init__(self, log_manager: LogManager, repository: RepositoryInterface, 
+	def __init__(self, log_manager: LogManager, repository: UserRepositoryInterface, 
 		password_hasher: PasswordHasherInterface):
 		
 		super().__init__(log_manager,repository)
@@ -163,32 +173,51 @@ class UserManager(BaseLoggedManager):
 	def _generate_password_salt(self):
 		return str(uuid.uuid4())
 
-	def _hash_password(self, password:str):
-		return self._password_hasher.hash_password(password)
+	async def _hash_password(self, password:str):
+		return await self._password_hasher.hash_password(password)
 
-	def create(self, data:dict):
+	async def create(self, data:dict):
 		#data.keys() = ['email', 'username', 'password'] and ['is_complete']
 		data_create = data.copy()
 		salt = self._generate_password_salt()
 		data_create['salt'] = salt
-		data_create['password'] = self._hash_password(data['password']+salt)
+		data_create['password'] = await self._hash_password(data['password']+salt)
 		data_create['id'] = uuid.uuid4()
 		return super().create(data_create)
 
+	async def create_many(self, datas:list, max_concurrency:int=1):
+		"""
+		Return (users, transactions). The passwords are hashed in parallel, but only
+		max_concurrency at the same time, so the others requests still can use the password hasher
+		"""
+		semaphore = asyncio.Semaphore(max_concurrency)
+		async def create(data:dict):
+			async with semaphore: return await self.create(data)
+
+		users = []
+		transactions_list = []
+		for user, tran in await asyncio.gather(*[create(data) for data in datas]):
+			users.append(user)
+			transactions_list.extend(tran)
+		return users, transactions_list
+
+	async def get_existing_emails(self, emails:list):
+		return await self._repository.find_existing_emails(emails)
+
 	async def get(self, unique_data:dict):
 		#unique_data.keys() = ['id'] or ['email']	
 		if 'id' in unique_data: unique_data = {'id':unique_data['id']}
 		else: unique_data = {'email':unique_data['email']}
 		return await super().get(unique_data)
 
-	def update(self, unique_data:dict, new_data:dict):
+	async def update(self, unique_data:dict, new_data:dict):
 		#unique_data.keys() = ['id']
 		#new_data.keys() = ['username'] or ['email'] or ['password']
 		new_data2 = new_data.copy()
 		if 'password' in new_data:
 			salt = self._generate_password_salt()
 			new_data2['salt'] = salt
-			new_data2['password'] = self._hash_password(new_data['password']+salt)
+			new_data2['password'] = await self._hash_password(new_data['password']+salt)
 		return super().update(unique_data, new_data2)
 
 
@@ -267,13 +296,65 @@ class SessionManager(BaseLoggedRelationalManager):
 	validator_create_class = CreateSessionValidator
 
 	#session_id user_id
-	def __init__(self, log_manager: LogManager, repository: RelationalRepositoryInterface):
+	def __init__(self, log_manager: LogManager, repository: RelationalRepositoryInterface,
+		cache: SessionCacheRepositoryInterface = None):
 		super().__init__(log_manager,repository)
-	
-	def create(self, data:dict):
+		#when the cache is None, the sessions are only read from the repository
+		self._cache = cache
+
+	#_______CACHE___________#
+	def _to_cache(self, session:Session):
+		return {'user_id':str(session.user_id), 'session_id':str(session.session_id),
+			'expirated':session.expirated.isoformat(), 'created':session.created.isoformat(),
+			'updated':session.updated.isoformat()}
+
+	def _from_cache(self, data:dict):
+		return Session(user_id=uuid.UUID(data['user_id']), session_id=uuid.UUID(data['session_id']),
+			expirated=datetime.fromisoformat(data['expirated']), 
+			created=datetime.fromisoformat(data['created']),
+			updated=datetime.fromisoformat(data['updated']))
+
+	async def _set_cache(self, session:Session):
+		#the session is cached until expire (expirated is utc)
+		expire = (session.expirated - datetime.utcnow()).total_seconds()/60
+		if expire > 0: await self._cache.set(str(session.session_id), self._to_cache(session), expire)
+	#_________#
+
+	async def create(self, data:dict):
 		#data.keys() = ['user_id', 'expirated']
 		data['session_id'] = uuid.uuid4()
-		return super().create(data)
+		session, transactions_list = super().create(data)
+		if self._cache is not None: await self._set_cache(session)
+		return session, transactions_list
+
+	async def get(self, unique_data:dict):
+		#unique_data.keys() = ['user_id', 'session_id']
+		if self._cache is None: return await super().get(unique_data)
+
+		cached = await self._cache.get(str(unique_data['session_id']))
+		if cached is not None:
+			if cached.get('revoked', False) or cached['user_id'] != str(unique_data['user_id']): return None
+			return self._from_cache(cached)
+
+		session = await super().get(unique_data)
+		if session is None: return None
+		#the database delete of a revoked session may be not applied yet
+		revoked_since = await self._cache.get_revoked_since(str(unique_data['user_id']))
+		if revoked_since is not None and session.created<=datetime.fromisoformat(revoked_since): return None
+		await self._set_cache(session)
+		return session
+
+	async def delete(self, unique_data:dict):
+		#unique_data.keys() = ['user_id', 'session_id']
+		transactions_list = super().delete(unique_data)
+		if self._cache is not None: 
+			await self._cache.revoke(str(unique_data['session_id']), str(unique_data['user_id']))
+		return transactions_list
+
+	async def delete_many_by(self, repeated_data:dict):
+		transactions_list = super().delete_many_by(repeated_data)
+		if self._cache is not None: await self._cache.revoke_many_by(self._get_dict_by(repeated_data))
+		return transactions_list
 
 	def _get_dict_by(self, repeated_data:dict):
 		#repeated_data.keys() = ['session_id'] or ['user_id']
@@ -283,12 +364,12 @@ class SessionManager(BaseLoggedRelationalManager):
 
 #_________________________USER_PERMISSION_MANAGER___________________________________#
 
-class UserPermissionManager(BaseLoggedRelationalManager):
+class UserPermissionManager(BaseLoggedRelationalManager, UserPermissionManagerInterface):
 	entity_class = UserPermission
 	validator_create_class = CreateUserPermissionValidator
 
 	#user_id permission_id
-	def __init__(self,log_manager: LogManager, repository: RelationalRepositoryInterface):
+	def __init__(self,log_manager: LogManager, repository: UserPermissionRepositoryInterface):
 		super().__init__(log_manager,repository)
 
 	def _get_dict_by(self, repeated_data:dict):
@@ -296,6 +377,10 @@ class UserPermissionManager(BaseLoggedRelationalManager):
 		if 'user_id' in repeated_data: return {'user_id':repeated_data['user_id']}
 		else: return {'permission_id':repeated_data['permission_id']}
 
+	async def get_permissions_and_groups(self, user_id):
+		#return (permission_names, group_names), the permissions include the groups permissions
+		return await self._repository.find_permissions_and_groups(user_id)
+
 
 #_________________________USER_GROUP_MANAGER___________________________________#
 
@@ -315,13 +400,15 @@ class UserGroupManager(BaseLoggedRelationalManager):
 
 #_________________________GROUP_ROLE_MANAGER___________________________________#
 
-class GroupPermissionManager(BaseLoggedRelationalManager):
+class GroupPermissionManager(BaseLoggedRelationalManager, GroupPermissionManagerInterface):
 	entity_class = GroupPermission
 	validator_create_class = CreateGroupPermissionValidator
 
 	#'group_id', 'permission_id'
-	def __init__(self, log_manager: LogManager, repository: RelationalRepositoryInterface):
+	def __init__(self, log_manager: LogManager, repository: GroupPermissionRepositoryInterface,
+		cache: GroupPermissionsCacheInterface = None):
 		super().__init__(log_manager, repository)
+		self._cache = cache
 	
 	def create(self, data:dict):
 		data2 = data.copy()
@@ -331,4 +418,23 @@ class GroupPermissionManager(BaseLoggedRelationalManager):
 	def _get_dict_by(self, repeated_data:dict):
 		#repeated_data.keys() = ['group_id'] or ['permission_id']
 		if 'group_id' in repeated_data: return {'group_id':repeated_data['group_id']}
-		else: return {'permission_id':repeated_data['permission_id']}
\ No newline at end of file
+		else: return {'permission_id':repeated_data['permission_id']}
+
+	async def get_permissions_of_groups(self, group_ids:list):
+		#return {group_id: frozenset(permission_id)}, only the missing groups are searched on database
+		if self._cache is None:
+			group_permissions = await self._repository.find_permissions_by_groups(group_ids)
+			return {group_id:frozenset(names) for group_id, names in group_permissions.items()}
+
+		version = self._cache.get_version()
+		found, missing = self._cache.get_many(group_ids)
+		if len(missing)==0: return found
+
+		group_permissions = await self._repository.find_permissions_by_groups(missing)
+		self._cache.set_many(group_permissions, version)
+		for group_id, names in group_permissions.items(): found[group_id] = frozenset(names)
+		return found
+
+	async def invalidate_cache(self, group_ids:list=None):
+		#group_ids None, invalidate all groups
+		if self._cache is not None: await self._cache.invalidate(group_ids)
\ No newline at end of file
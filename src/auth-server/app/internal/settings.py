@@ -29,14 +29,67 @@ if not TEST_MODE:
 	elif not DatabaseUriValidator.is_valid(DATABASE_URI): raise _invalid_exception('DATABASE_URI')
 else: DATABASE_URI='a'
 
+DATABASE_POOL={
+	#connections kept open
+	'SIZE': os.environ.get('DATABASE_POOL_SIZE', '5'),
+	#extra connections opened when all are in use (closed when returned)
+	'MAX_OVERFLOW': os.environ.get('DATABASE_POOL_MAX_OVERFLOW', '10'),
+	#seconds waiting for a free connection, then the QueuePool limit error is raised
+	'TIMEOUT': os.environ.get('DATABASE_POOL_TIMEOUT', '30'),
+	#seconds, older connections are replaced (0 disable)
+	'RECYCLE': os.environ.get('DATABASE_POOL_RECYCLE', '0'),
+	#YES, the connections are tested before use
+	'PRE_PING': os.environ.get('DATABASE_POOL_PRE_PING', 'NO'),
+	#prepared statements cached per connection by asyncpg (0 disable)
+	'STATEMENT_CACHE_SIZE': os.environ.get('DATABASE_STATEMENT_CACHE_SIZE', '100')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(DATABASE_POOL['SIZE']): raise _invalid_exception('DATABASE_POOL_SIZE')
+if not ExpValidator.is_valid(DATABASE_POOL['MAX_OVERFLOW']): raise _invalid_exception('DATABASE_POOL_MAX_OVERFLOW')
+if not ExpValidator.is_valid(DATABASE_POOL['TIMEOUT']): raise _invalid_exception('DATABASE_POOL_TIMEOUT')
+if not ExpValidator.is_valid(DATABASE_POOL['RECYCLE']): raise _invalid_exception('DATABASE_POOL_RECYCLE')
+if not ExpValidator.is_valid(DATABASE_POOL['STATEMENT_CACHE_SIZE']): raise _invalid_exception('DATABASE_STATEMENT_CACHE_SIZE')
+if DATABASE_POOL['PRE_PING'] not in ['YES', 'NO']: raise _invalid_exception('DATABASE_POOL_PRE_PING')
+DATABASE_POOL['SIZE'] = int(DATABASE_POOL['SIZE'])
+DATABASE_POOL['MAX_OVERFLOW'] = int(DATABASE_POOL['MAX_OVERFLOW'])
+DATABASE_POOL['TIMEOUT'] = int(DATABASE_POOL['TIMEOUT'])
+DATABASE_POOL['RECYCLE'] = int(DATABASE_POOL['RECYCLE'])
+DATABASE_POOL['PRE_PING'] = DATABASE_POOL['PRE_PING']=='YES'
+DATABASE_POOL['STATEMENT_CACHE_SIZE'] = int(DATABASE_POOL['STATEMENT_CACHE_SIZE'])
+if DATABASE_POOL['SIZE']<1: raise _invalid_exception('DATABASE_POOL_SIZE')
+
 #_______________CACHE_SETTINGS________________#
 
 CACHE={
 	#redis://<hostname>
 	'CACHE_URI': os.environ.get('CACHE_URI'),
-	'PREFIX':'auth'
+	'PREFIX':'auth',
+	#shared connection pool
+	'MAX_CONNECTIONS': os.environ.get('CACHE_MAX_CONNECTIONS', '50'),
+	#seconds waiting for a free connection
+	'POOL_TIMEOUT': os.environ.get('CACHE_POOL_TIMEOUT', '5'),
+	#seconds, idle connections are checked before use
+	'HEALTH_CHECK_INTERVAL': os.environ.get('CACHE_HEALTH_CHECK_INTERVAL', '30'),
+	#seconds, the group permissions are kept in memory (0 disable)
+	'GROUP_PERMISSIONS_EXP': os.environ.get('GROUP_PERMISSIONS_CACHE_EXP', '60'),
+	#seconds after an invalidation the group is not cached, the db-worker can still be applying the change
+	'GROUP_PERMISSIONS_SETTLE': os.environ.get('GROUP_PERMISSIONS_CACHE_SETTLE', '10')
 }
 
+#__ENV_TEST____#
+if not ExpValidator.is_valid(CACHE['MAX_CONNECTIONS']): raise _invalid_exception('CACHE_MAX_CONNECTIONS')
+if not ExpValidator.is_valid(CACHE['POOL_TIMEOUT']): raise _invalid_exception('CACHE_POOL_TIMEOUT')
+if not ExpValidator.is_valid(CACHE['HEALTH_CHECK_INTERVAL']): raise _invalid_exception('CACHE_HEALTH_CHECK_INTERVAL')
+if not ExpValidator.is_valid(CACHE['GROUP_PERMISSIONS_EXP']): raise _invalid_exception('GROUP_PERMISSIONS_CACHE_EXP')
+if not ExpValidator.is_valid(CACHE['GROUP_PERMISSIONS_SETTLE']): raise _invalid_exception('GROUP_PERMISSIONS_CACHE_SETTLE')
+CACHE['MAX_CONNECTIONS'] = int(CACHE['MAX_CONNECTIONS'])
+CACHE['POOL_TIMEOUT'] = int(CACHE['POOL_TIMEOUT'])
+CACHE['HEALTH_CHECK_INTERVAL'] = int(CACHE['HEALTH_CHECK_INTERVAL'])
+CACHE['GROUP_PERMISSIONS_EXP'] = int(CACHE['GROUP_PERMISSIONS_EXP'])
+CACHE['GROUP_PERMISSIONS_SETTLE'] = int(CACHE['GROUP_PERMISSIONS_SETTLE'])
+if CACHE['MAX_CONNECTIONS']<1: raise _invalid_exception('CACHE_MAX_CONNECTIONS')
+
 
 #________________AUTH_SETTINGS________________#
 
@@ -44,24 +97,57 @@ AUTH={
 	#Can be RS256 or HS256
 	#IF HS256, set only private_key else, set private_key and public_key 
 	'JWT_ALGORITHM': os.environ.get('JWT_ALGORITHM', 'HS256'),
+	#Can be jose (python-jose) or pyjwt (PyJWT)
+	'JWT_BACKEND': os.environ.get('JWT_BACKEND', 'jose'),
 	'PRIVATE_KEY': os.environ.get('PRIVATE_KEY'),
 	'PUBLIC_KEY':  os.environ.get('PUBLIC_KEY', os.environ.get('PRIVATE_KEY')),
 
 	'SECRET_KEY': os.environ.get('SECRET_KEY'),
+	#Can be gcm or cbc, the AES mode used to encrypt the new tokens (both are decrypted)
+	'TOKEN_ENVELOPE': os.environ.get('TOKEN_ENVELOPE', 'gcm'),
 
 	'ACCESS_TOKEN_EXP': os.environ.get('ACCESS_TOKEN_EXP', '20'),
-	'REFRESH_TOKEN_EXP': os.environ.get('REFRESH_TOKEN_EXP', '50')
+	'REFRESH_TOKEN_EXP': os.environ.get('REFRESH_TOKEN_EXP', '50'),
+
+	#Max decoded access tokens kept in memory (0 disable the cache)
+	'TOKEN_CACHE_SIZE': os.environ.get('TOKEN_CACHE_SIZE', '10000')
 }
 
 #__ENV_TEST____#
 if AUTH['SECRET_KEY'] is None: raise _not_setted_exception('SECRET_KEY')
 elif len(AUTH['SECRET_KEY'])!=32: raise _invalid_exception('SECRET_KEY')
+if AUTH['TOKEN_ENVELOPE'] not in ['gcm', 'cbc']: raise _invalid_exception('TOKEN_ENVELOPE')
+
+if AUTH['JWT_ALGORITHM'] not in ['HS256', 'RS256']: raise _invalid_exception('JWT_ALGORITHM')
+if AUTH['JWT_BACKEND'] not in ['jose', 'pyjwt']: raise _invalid_exception('JWT_BACKEND')
 
 if AUTH['PRIVATE_KEY'] is None: raise _not_setted_exception('PRIVATE_KEY')
 if AUTH['JWT_ALGORITHM'] == 'RS256' and AUTH['PUBLIC_KEY']==AUTH['PRIVATE_KEY']: raise _not_setted_exception('PUBLIC_KEY')
 
 if not ExpValidator.is_valid(AUTH['ACCESS_TOKEN_EXP']): raise _invalid_exception('ACCESS_TOKEN_EXP')
 if not ExpValidator.is_valid(AUTH['REFRESH_TOKEN_EXP']): raise _invalid_exception('REFRESH_TOKEN_EXP')
+if not ExpValidator.is_valid(AUTH['TOKEN_CACHE_SIZE']): raise _invalid_exception('TOKEN_CACHE_SIZE')
+
+
+#____________PASSWORD_HASHER_SETTINGS___________#
+
+PASSWORD_HASHER={
+	#Can be thread or process
+	'POOL_TYPE': os.environ.get('HASHER_POOL_TYPE', 'thread'),
+	#Number of workers (threads or processes) that run bcrypt
+	'MAX_WORKERS': os.environ.get('HASHER_MAX_WORKERS', str(os.cpu_count() or 1)),
+	#Max bcrypt operations running at the same time, the others wait on queue
+	'MAX_CONCURRENCY': os.environ.get('HASHER_MAX_CONCURRENCY', str(os.cpu_count() or 1))
+}
+
+#__ENV_TEST____#
+if PASSWORD_HASHER['POOL_TYPE'] not in ['thread', 'process']: raise _invalid_exception('HASHER_POOL_TYPE')
+if not ExpValidator.is_valid(PASSWORD_HASHER['MAX_WORKERS']): raise _invalid_exception('HASHER_MAX_WORKERS')
+if not ExpValidator.is_valid(PASSWORD_HASHER['MAX_CONCURRENCY']): raise _invalid_exception('HASHER_MAX_CONCURRENCY')
+PASSWORD_HASHER['MAX_WORKERS'] = int(PASSWORD_HASHER['MAX_WORKERS'])
+PASSWORD_HASHER['MAX_CONCURRENCY'] = int(PASSWORD_HASHER['MAX_CONCURRENCY'])
+if PASSWORD_HASHER['MAX_WORKERS']<1: raise _invalid_exception('HASHER_MAX_WORKERS')
+if PASSWORD_HASHER['MAX_CONCURRENCY']<1: raise _invalid_exception('HASHER_MAX_CONCURRENCY')
 
 
 #_____RANDOM_SETTINGS___________________________#
@@ -80,7 +166,8 @@ RABBITMQ_URI = os.environ.get('RABBITMQ_URI')
 
 RABBITMQ_QUEUES={
 	'EMAILS': os.environ.get('EMAILS_QUEUE','auth_emails'),
-	'DB_TRANSACTIONS': os.environ.get('DB_TRANSACTIONS_QUEUE','auth_db_transactions')
+	'DB_TRANSACTIONS': os.environ.get('DB_TRANSACTIONS_QUEUE','auth_db_transactions'),
+	'AUDIT_LOGS': os.environ.get('AUDIT_LOGS_QUEUE','auth_audit_logs')
 }
 
 #__ENV_TEST____#
@@ -90,4 +177,38 @@ if not TEST_MODE:
 
 	if not RabbitmqQueueValidator.is_valid(RABBITMQ_QUEUES['EMAILS']): raise _invalid_exception('EMAILS_QUEUE')
 	if not RabbitmqQueueValidator.is_valid(RABBITMQ_QUEUES['DB_TRANSACTIONS']): raise _invalid_exception('DB_TRANSACTIONS_QUEUE')
-else: RABBITMQ_URI='n'
\ No newline at end of file
+	if not RabbitmqQueueValidator.is_valid(RABBITMQ_QUEUES['AUDIT_LOGS']): raise _invalid_exception('AUDIT_LOGS_QUEUE')
+else: RABBITMQ_URI='n'
+
+
+#____________DB_TRANSACTIONS_BATCH_SETTINGS_____________#
+
+DB_TRANSACTIONS_BATCH={
+	#Max transactions lists (one per request) published on the same message
+	'MAX_SIZE': os.environ.get('DB_TRANSACTIONS_BATCH_SIZE', '50'),
+	#Max milliseconds a transactions list waits to be published (0 disable the batching)
+	'MAX_DELAY': os.environ.get('DB_TRANSACTIONS_BATCH_DELAY', '5')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(DB_TRANSACTIONS_BATCH['MAX_SIZE']): raise _invalid_exception('DB_TRANSACTIONS_BATCH_SIZE')
+if not ExpValidator.is_valid(DB_TRANSACTIONS_BATCH['MAX_DELAY']): raise _invalid_exception('DB_TRANSACTIONS_BATCH_DELAY')
+DB_TRANSACTIONS_BATCH['MAX_SIZE'] = int(DB_TRANSACTIONS_BATCH['MAX_SIZE'])
+DB_TRANSACTIONS_BATCH['MAX_DELAY'] = int(DB_TRANSACTIONS_BATCH['MAX_DELAY'])
+if DB_TRANSACTIONS_BATCH['MAX_SIZE']<1: raise _invalid_exception('DB_TRANSACTIONS_BATCH_SIZE')
+
+#____________AUDIT_LOGS_BATCH_SETTINGS_____________#
+
+AUDIT_LOGS_BATCH={
+	#Max audit logs published on the same message (the logs are not sent with the business transactions)
+	'MAX_SIZE': os.environ.get('AUDIT_LOGS_BATCH_SIZE', '500'),
+	#Max milliseconds an audit log waits to be published (0 publish each log alone)
+	'MAX_DELAY': os.environ.get('AUDIT_LOGS_BATCH_DELAY', '200')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(AUDIT_LOGS_BATCH['MAX_SIZE']): raise _invalid_exception('AUDIT_LOGS_BATCH_SIZE')
+if not ExpValidator.is_valid(AUDIT_LOGS_BATCH['MAX_DELAY']): raise _invalid_exception('AUDIT_LOGS_BATCH_DELAY')
+AUDIT_LOGS_BATCH['MAX_SIZE'] = int(AUDIT_LOGS_BATCH['MAX_SIZE'])
+AUDIT_LOGS_BATCH['MAX_DELAY'] = int(AUDIT_LOGS_BATCH['MAX_DELAY'])
+if AUDIT_LOGS_BATCH['MAX_SIZE']<1: raise _invalid_exception('AUDIT_LOGS_BATCH_SIZE')
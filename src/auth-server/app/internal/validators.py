@@ -2,7 +2,7 @@ import re
 from datetime import datetime
 from uuid import UUID
 from typing import Optional, List
-from pydantic import BaseModel, validator, ValidationError
+from pydantic import BaseModel, validator, ValidationError, conlist
 
 #___________________STR VALIDATORS________________________________#
 class BaseStrValidator():
@@ -296,6 +296,12 @@ class CheckAuthorizationValidator(BaseDictValidator):
 	groups:Optional[List[str]]
 	access_token:str
 
+#Max items checked by one batch authorization call
+AUTHORIZATION_BATCH_MAX_ITEMS=100
+
+class CheckAuthorizationBatchValidator(BaseDictValidator):
+	items:conlist(CheckAuthorizationValidator, min_items=1, max_items=AUTHORIZATION_BATCH_MAX_ITEMS)
+
 
 #_____________ADMIN_CRUD_SERVICES_VALIDATORS__________________________________#
 
@@ -312,6 +318,11 @@ class CreateUserAdminValidator(BaseDictValidator):
 	_validator2 = validator('username', allow_reuse=True)(validate_username)
 	_validator3 = validator('password', allow_reuse=True)(validate_password)
 
+USERS_BULK_MAX_ITEMS=10000
+
+class CreateUsersBulkAdminValidator(BaseDictValidator):
+	users:conlist(CreateUserAdminValidator, min_items=1, max_items=USERS_BULK_MAX_ITEMS)
+
 class SetUserAdminValidator(BaseDictValidator):
 	id:UUID
 	username:Optional[str]
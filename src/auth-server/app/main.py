@@ -1,6 +1,10 @@
 from fastapi import FastAPI
 #Routers
 from .routers import auth_routers, admin_routers, intra_routers
+#Adapters
+from .internal.adapter.auth import shutdown_password_hasher
+from .internal.adapter.database import flush_transaction_publisher, flush_audit_log_publisher
+from .internal.adapter.cache import open_cache_pool, close_cache_pool, start_cache_listeners, stop_cache_listeners
 
 
 async def async_main():
@@ -23,10 +27,26 @@ app.include_router(admin_routers.router_group_crud, prefix='/admin')
 app.include_router(admin_routers.router_grant_permission, prefix='/admin')
 app.include_router(admin_routers.router_grant_group, prefix='/admin')
 app.include_router(admin_routers.router_session_mng, prefix='/admin')
+app.include_router(admin_routers.router_export, prefix='/admin')
 
 # Intra routers
 app.include_router(intra_routers.router, prefix='/intra')
 
+
+@app.on_event("startup")
+def startup_pools():
+	open_cache_pool()
+	start_cache_listeners()
+
+@app.on_event("shutdown")
+async def shutdown_pools():
+	#publish the buffered transactions
+	flush_transaction_publisher()
+	flush_audit_log_publisher()
+	shutdown_password_hasher()
+	await stop_cache_listeners()
+	await close_cache_pool()
+
 """
 @app.on_event("startup")
 async def startup():
@@ -1,17 +1,20 @@
 import uuid
+from datetime import datetime
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from app import schemas
-from typing import List
+from typing import List, Union
 #dependencies
 from app.dependencies import (get_create_user_service, get_read_user_service,
 	get_update_user_service, get_delete_user_service, get_create_permission_service,
 	get_read_permission_service, get_delete_permission_service, get_create_group_service,
 	get_read_group_service, get_delete_group_service, get_grant_permission_service,
 	get_remove_permission_service, get_add_user_to_group_service, get_remove_user_from_group_service,
-	get_delete_session_service)
+	get_delete_session_service, get_export_users_service, get_export_sessions_service, get_export_logs_service)
 #interfaces
-from app.internal.application.interfaces import (AdminCRUDServiceInterface, AdminPermissionServiceInterface,
-	AdminGroupServiceInterface, AdminSessionServiceInterface)
+from app.internal.application.interfaces import (AdminCRUDServiceInterface, AdminUserCRUDServiceInterface, 
+	AdminPermissionServiceInterface,
+	AdminGroupServiceInterface, AdminSessionServiceInterface, AdminExportServiceInterface)
 
 
 
@@ -22,6 +25,7 @@ router_group_crud = APIRouter(tags=['Admin: group CRUD'])
 router_grant_permission = APIRouter(tags=['Admin: permission grant'])
 router_grant_group = APIRouter(tags=['Admin: group grant'])
 router_session_mng = APIRouter(tags=['Admin: session management'])
+router_export = APIRouter(tags=['Admin: export'])
 
 
 #_________________________________CRUD_ROUTERS_______________________________#
@@ -43,16 +47,30 @@ async def create_user(data: schemas.CreateUserSchema, service: AdminCRUDServiceI
 	"""
 	return await service.create(data.dict())
 
+@router_user_crud.post("/users/bulk", response_model=schemas.CreateUsersBulkResponseSchema, status_code=201)
+async def create_users(data: schemas.CreateUsersBulkSchema, 
+	service: AdminUserCRUDServiceInterface = Depends(get_create_user_service)):
+	"""
+		## Create Users (bulk)
+		This route will create many users (max 10000) at the same time, like the route *POST /users*.
+		<p><b>Note</b>: If one email exist or is repeated, no user is created.</p>
+		<p><b>Note2</b>: To use this route the user must have the permission 'create_user' or 'admin'.</p>
+		<p><b>Return</b>: the users ids, on the same order of the received users</p>
+	"""
+	return await service.create_many(data.dict())
+
 #_____GET_____#
 
-@router_user_crud.get("/users", response_model=List[schemas.UserSchema])
-async def get_users(skip:int=0, limit:int=100, service: AdminCRUDServiceInterface = Depends(get_read_user_service)):
+@router_user_crud.get("/users", response_model=Union[List[schemas.UserSchema], schemas.UserPageSchema])
+async def get_users(skip:int=0, limit:int=100, cursor:str=None, service: AdminCRUDServiceInterface = Depends(get_read_user_service)):
 	"""
 		## Get Users
 		This route will return a list of users.
 		<p><b>Note</b>: To use this route the user must have the permission 'read_user' or 'admin'.</p>
+		<p><b>Note2</b>: Send *cursor* (empty on the first page) to use the cursor pagination, faster than *skip* on the deep pages.
+		The response is the page *items* and the *next_cursor* (null on the last page).</p>
 	"""
-	return await service.get_many(skip,limit)
+	return await service.get_many(skip,limit,cursor)
 
 @router_user_crud.get("/users/{id}", response_model=schemas.UserSpecificSchema)
 async def get_user(id: uuid.UUID, service: AdminCRUDServiceInterface = Depends(get_read_user_service)):
@@ -107,14 +125,16 @@ async def create_permission(data: schemas.CreatePermissionSchema, service: Admin
 
 #_____GET_____#
 
-@router_permission_crud.get("/permissions", response_model=List[schemas.PermissionSchema])
-async def get_permissions(skip:int=0, limit:int=100, service: AdminCRUDServiceInterface = Depends(get_read_permission_service)):
+@router_permission_crud.get("/permissions", response_model=Union[List[schemas.PermissionSchema], schemas.PermissionPageSchema])
+async def get_permissions(skip:int=0, limit:int=100, cursor:str=None, service: AdminCRUDServiceInterface = Depends(get_read_permission_service)):
 	"""
 		## Get Permissions
 		This route will return a list of permissions.
 		<p><b>Note</b>: To use this route the user must have the permission 'read_permission' or 'admin'.</p>
+		<p><b>Note2</b>: Send *cursor* (empty on the first page) to use the cursor pagination, faster than *skip* on the deep pages.
+		The response is the page *items* and the *next_cursor* (null on the last page).</p>
 	"""
-	return await service.get_many(skip,limit)
+	return await service.get_many(skip,limit,cursor)
 
 @router_permission_crud.get("/permissions/{id}", response_model=schemas.PermissionSpecificSchema)
 async def get_permission(id: str, service: AdminCRUDServiceInterface = Depends(get_read_permission_service)):
@@ -155,14 +175,16 @@ async def create_group(data: schemas.CreateGroupSchema, service: AdminCRUDServic
 
 #_____GET_____#
 
-@router_group_crud.get("/groups", response_model=List[schemas.GroupSchema])
-async def get_groups(skip:int=0, limit:int=100, service: AdminCRUDServiceInterface = Depends(get_read_group_service)):
+@router_group_crud.get("/groups", response_model=Union[List[schemas.GroupSchema], schemas.GroupPageSchema])
+async def get_groups(skip:int=0, limit:int=100, cursor:str=None, service: AdminCRUDServiceInterface = Depends(get_read_group_service)):
 	"""
 		## Get Groups
 		This route will return a list of groups.
 		<p><b>Note</b>: To use this route the user must have the permission 'read_group' or 'admin'.</p>
+		<p><b>Note2</b>: Send *cursor* (empty on the first page) to use the cursor pagination, faster than *skip* on the deep pages.
+		The response is the page *items* and the *next_cursor* (null on the last page).</p>
 	"""
-	return await service.get_many(skip,limit)
+	return await service.get_many(skip,limit,cursor)
 
 @router_group_crud.get("/groups/{id}", response_model=schemas.GroupSpecificSchema)
 async def get_group(id: str, service: AdminCRUDServiceInterface = Depends(get_read_group_service)):
@@ -276,4 +298,37 @@ async def remove_session(data: schemas.RemoveSessionSchema,
 		<p><b>Note2</b>: The *session_id* is optional, when not setted all user sessions will be deleted.</p>
 		<p><b>Note3</b>: When a session was deleted the session refresh token wan't work anymore, but the access token will work until expire.</p>
 	"""
-	return await service.remove_session(data.dict())
\ No newline at end of file
+	return await service.remove_session(data.dict())
+
+
+#_________________EXPORT__________________#
+
+_NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+@router_export.get("/export/users")
+async def export_users(since:datetime=None, service: AdminExportServiceInterface = Depends(get_export_users_service)):
+	"""
+		## Export Users
+		This route will return all users (without passwords) created since *since* (optional), as NDJSON (one json per line).
+		<p><b>Note</b>: To use this route the user must have the permission 'read_user' or 'admin'.</p>
+		<p><b>Note2</b>: The users are streamed from the database, so the export of big tables don't use more memory.</p>
+	"""
+	return StreamingResponse(service.export(since), media_type=_NDJSON_MEDIA_TYPE)
+
+@router_export.get("/export/sessions")
+async def export_sessions(since:datetime=None, service: AdminExportServiceInterface = Depends(get_export_sessions_service)):
+	"""
+		## Export Sessions
+		This route will return all sessions created since *since* (optional), as NDJSON (one json per line).
+		<p><b>Note</b>: To use this route the user must have the permission 'admin'.</p>
+	"""
+	return StreamingResponse(service.export(since), media_type=_NDJSON_MEDIA_TYPE)
+
+@router_export.get("/export/logs")
+async def export_logs(since:datetime=None, service: AdminExportServiceInterface = Depends(get_export_logs_service)):
+	"""
+		## Export Logs
+		This route will return all audit logs created since *since* (optional), as NDJSON (one json per line).
+		<p><b>Note</b>: To use this route the user must have the permission 'admin'.</p>
+	"""
+	return StreamingResponse(service.export(since), media_type=_NDJSON_MEDIA_TYPE)
@@ -1,7 +1,8 @@
 #import uuid
 from fastapi import APIRouter, Depends
 from app import schemas
-from app.dependencies import get_check_authorization_service
+from app.dependencies import (get_check_authorization_service, get_check_authorization_batch_service,
+	get_metrics)
 from app.internal.application.interfaces import IntraServiceInterface
 
 router = APIRouter(tags=['Intra: authorization and status'])
@@ -18,10 +19,32 @@ def check_authorization(data: schemas.CheckAuthorizationSchema,
 	"""
 	return service.start_service(data.dict())
 
+@router.post("/authorization/batch", response_model=schemas.CheckAuthorizationBatchResponseSchema)
+def check_authorization_batch(data: schemas.CheckAuthorizationBatchSchema,
+	service: IntraServiceInterface = Depends(get_check_authorization_batch_service)):
+	"""
+		## Check Authorization Batch
+		This route will check many items (access_token, permissions and groups) on one call and return a result for each item, on the same order.
+		<p><b>Note</b>: If the item is authorized, the result have *authorized* true, user_id and session_id. If not, the result have *authorized* false and the error *status_code* and *detail* (the same of the <b>/authorization</b> route).</p>
+		<p><b>Note2</b>: The repeated access tokens are decoded only once. The max number of items is 100.</p>
+		<p><b>Note3</b>: On production, you must limit access to this route, only your services can access.</p>
+	"""
+	return service.start_service(data.dict())
+
 @router.get("/status")
 def get_status():
 	"""
 		## Get Status
 		This route is used to check if the auth-server is working. Load balancers can use to check the server healthy.
 	"""
-	return {'status':'running'}
\ No newline at end of file
+	return {'status':'running'}
+
+@router.get("/metrics")
+def get_server_metrics(metrics: dict = Depends(get_metrics)):
+	"""
+		## Get Metrics
+		This route will return the auth-server internal metrics, like the password hasher pool queue.
+		<p><b>Note</b>: *waiting* is the number of bcrypt operations waiting on queue and *running* is the number of operations running on the pool.</p>
+		<p><b>Note2</b>: On production, you must limit access to this route, only your services can access.</p>
+	"""
+	return metrics
\ No newline at end of file
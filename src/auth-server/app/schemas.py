@@ -1,10 +1,10 @@
 #from typing import , Optional
 from typing import Optional, List
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, validator, conlist
 from datetime import datetime
 import uuid
 from app.internal.validators import (validate_email, validate_password, 
-    validate_username, validate_name)
+    validate_username, validate_name, AUTHORIZATION_BATCH_MAX_ITEMS, USERS_BULK_MAX_ITEMS)
 
 
 #______________________SERVICES_SCHEMAS_______________________________#
@@ -184,6 +184,14 @@ class CreateGroupSchema(CreatePermissionSchema):
 class CreateUserResponseSchema(BaseModel):
     id:uuid.UUID
 
+class CreateUsersBulkSchema(BaseModel):
+    users:conlist(CreateUserSchema, min_items=1, max_items=USERS_BULK_MAX_ITEMS)
+
+#RESPONSE
+class CreateUsersBulkResponseSchema(BaseModel):
+    #same order of the received users
+    ids:List[uuid.UUID]
+
 #RESPONSE
 class CreatePermissionResponseSchema(BaseModel):
     id:str
@@ -218,6 +226,21 @@ class PermissionSchema(BaseModel):
 class GroupSchema(PermissionSchema):
     pass
 
+#RESPONSE
+class UserPageSchema(BaseModel):
+    items:List[UserSchema]
+    next_cursor:Optional[str]
+
+#RESPONSE
+class PermissionPageSchema(BaseModel):
+    items:List[PermissionSchema]
+    next_cursor:Optional[str]
+
+#RESPONSE
+class GroupPageSchema(BaseModel):
+    items:List[GroupSchema]
+    next_cursor:Optional[str]
+
 
 #RESPONSE
 class SessionSchema(BaseModel):
@@ -333,4 +356,20 @@ class CheckAuthorizationSchema(BaseModel):
 
 class CheckAuthorizationResponseSchema(BaseModel):
     session_id:str
-    user_id:str
\ No newline at end of file
+    user_id:str
+
+
+#_____BATCH_____#
+class CheckAuthorizationBatchSchema(BaseModel):
+    items:conlist(CheckAuthorizationSchema, min_items=1, max_items=AUTHORIZATION_BATCH_MAX_ITEMS)
+
+class CheckAuthorizationBatchResultSchema(BaseModel):
+    authorized:bool
+    session_id:Optional[str]
+    user_id:Optional[str]
+    #if not authorized
+    status_code:Optional[int]
+    detail:Optional[List[dict]]
+
+class CheckAuthorizationBatchResponseSchema(BaseModel):
+    results:List[CheckAuthorizationBatchResultSchema]
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the authorization check (CheckAuthorizationService permissions
+and groups checks) against the size of the token permissions list.
+Compares the old linear scan over the decoded lists with the precompiled frozensets.
+
+Run from src/auth-server:
+	python -m benchmarks.bench_authorization
+"""
+import os
+import timeit
+
+#the settings need this envs, the benchmark not use database or cache
+os.environ.setdefault('TEST_MODE', 'YES')
+os.environ.setdefault('PRIVATE_KEY', 'benchmark_private_key')
+os.environ.setdefault('SECRET_KEY', 'a'*32)
+
+from app.internal.adapter.auth import _compile_claims
+from app.internal.application.authorization import CheckAuthorizationService
+
+
+_SIZES = [1, 10, 100, 1000]
+_REQUESTED = 5
+_NUMBER = 20000
+
+
+#_____OLD_LINEAR_SCAN_____#
+
+def _linear_have_permission(decoded_access:dict, permission_name:str):
+	for name in decoded_access['permissions']:
+		if name == permission_name or name == 'admin': return True
+	return False
+
+def _linear_check(decoded_access:dict, permission_names:list):
+	for name in permission_names:
+		if not _linear_have_permission(decoded_access, name): return False
+	return True
+
+
+def _decoded(size:int):
+	permissions = ['permission_'+str(i) for i in range(size)]
+	return {'user_id':'u', 'sub':'s', 'permissions':permissions, 'groups':['group']}
+
+
+def main():
+	service = CheckAuthorizationService(None)
+	print('%-12s %-16s %-16s %s' % ('permissions', 'linear (us)', 'frozenset (us)', 'speedup'))
+
+	for size in _SIZES:
+		decoded = _decoded(size)
+		#the worst case, the requested permissions are the last ones
+		requested = decoded['permissions'][-_REQUESTED:]
+		compiled = _compile_claims(dict(decoded))
+		assert _linear_check(decoded, requested) and service._have_permissions(compiled, requested)
+
+		linear = timeit.timeit(lambda: _linear_check(decoded, requested), number=_NUMBER)
+		frozen = timeit.timeit(lambda: service._have_permissions(compiled, requested), number=_NUMBER)
+		linear_us = linear/_NUMBER*1e6
+		frozen_us = frozen/_NUMBER*1e6
+		print('%-12d %-16.3f %-16.3f %.1fx' % (size, linear_us, frozen_us, linear_us/frozen_us))
+
+	#admin fast path
+	compiled = _compile_claims(dict(_decoded(1000), permissions=['admin']+_decoded(1000)['permissions']))
+	admin = timeit.timeit(lambda: service._have_permissions(compiled, ['x']*_REQUESTED), number=_NUMBER)
+	print('admin fast path: %.3f us' % (admin/_NUMBER*1e6))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the JWT backends (JWT_BACKEND setting), reporting encode and decode
+ops/sec and p99 latency for each backend and algorithm (HS256 and RS256).
+It also checks that the backends produce the same claims.
+
+Run from src/auth-server:
+	python -m benchmarks.bench_jwt_backends
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+#the settings need this envs, the benchmark not use database or cache
+os.environ.setdefault('TEST_MODE', 'YES')
+os.environ.setdefault('PRIVATE_KEY', 'benchmark_private_key')
+os.environ.setdefault('SECRET_KEY', 'a'*32)
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from app.internal.adapter.auth import _JWT_BACKENDS
+
+
+_ITERATIONS = 5000
+
+
+def _rsa_keys():
+	private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	private_pem = private_key.private_bytes(serialization.Encoding.PEM,
+		serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+	public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+		serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+	return private_pem, public_pem
+
+
+def _claims():
+	return {'sub':'3fa85f64-5717-4562-b3fc-2c963f66afa6', 'user_id':'3fa85f64-5717-4562-b3fc-2c963f66afa7',
+		'permissions':['logout', 'set_own_email', 'set_own_password'], 'groups':['normal'],
+		'token_type':'access', 'exp':datetime.utcnow()+timedelta(minutes=20)}
+
+
+def _measure(function):
+	#return (ops/sec, p99 in microseconds)
+	latencies = []
+	for _ in range(_ITERATIONS):
+		start = time.perf_counter()
+		function()
+		latencies.append(time.perf_counter()-start)
+	latencies.sort()
+	p99 = latencies[int(len(latencies)*0.99)-1]
+	return len(latencies)/sum(latencies), p99*1e6
+
+
+def _check_compatible(backends:dict):
+	#the same claims are produced and the tokens are accepted by all backends
+	claims = _claims()
+	tokens = {name:backend.encode(dict(claims)) for name, backend in backends.items()}
+	for name, token in tokens.items():
+		decoded = [backend.decode(token) for backend in backends.values()]
+		assert all(item==decoded[0] for item in decoded), name
+	return len(set(tokens.values()))==1
+
+
+def main():
+	private_pem, public_pem = _rsa_keys()
+	keys = {'HS256':(os.environ['PRIVATE_KEY'], os.environ['PRIVATE_KEY']), 'RS256':(private_pem, public_pem)}
+
+	print('%-8s %-8s %-8s %-12s %-12s' % ('backend', 'alg', 'op', 'ops/sec', 'p99 (us)'))
+	for algorithm, (private_key, public_key) in keys.items():
+		backends = {name:backend_class(algorithm, private_key, public_key)
+			for name, backend_class in _JWT_BACKENDS.items()}
+		identical = _check_compatible(backends)
+
+		for name, backend in backends.items():
+			claims = _claims()
+			token = backend.encode(dict(claims))
+			for op, function in [('encode', lambda: backend.encode(dict(claims))), 
+				('decode', lambda: backend.decode(token))]:
+				ops, p99 = _measure(function)
+				print('%-8s %-8s %-8s %-12.0f %-12.1f' % (name, algorithm, op, ops, p99))
+		print('%s tokens byte-identical across backends: %s' % (algorithm, identical))
+
+
+if __name__ == '__main__':
+	main()
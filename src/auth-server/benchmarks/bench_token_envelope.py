@@ -0,0 +1,52 @@
+"""
+Benchmark of the token envelope (TOKEN_ENVELOPE setting), comparing the encrypt and
+decrypt ops/sec of the old AES-CBC path with the AES-GCM envelope.
+
+Run from src/auth-server:
+	python -m benchmarks.bench_token_envelope
+"""
+import os
+import time
+
+#the settings need this envs, the benchmark not use database or cache
+os.environ.setdefault('TEST_MODE', 'YES')
+os.environ.setdefault('PRIVATE_KEY', 'benchmark_private_key')
+os.environ.setdefault('SECRET_KEY', 'a'*32)
+
+from app.internal.adapter.auth import (_encrypt_AES_CBC, _decrypt_AES_CBC, _encrypt_AES_GCM, 
+	_decrypt_AES_GCM, _jwt_backend)
+
+
+_DURATION = 2.0
+#same size of a real access token
+_JWT = _jwt_backend.encode({'sub':'3fa85f64-5717-4562-b3fc-2c963f66afa6', 
+	'user_id':'3fa85f64-5717-4562-b3fc-2c963f66afa7', 'token_type':'access', 'exp':4102444800,
+	'permissions':['logout', 'set_own_email', 'set_own_password', 'set_own_username', 'read_own_user_data'],
+	'groups':['normal']})
+
+
+def _ops_per_second(function):
+	count = 0
+	end = time.perf_counter() + _DURATION
+	while time.perf_counter() < end:
+		function()
+		count+=1
+	return count/_DURATION
+
+
+def main():
+	cbc_token = _encrypt_AES_CBC(_JWT)
+	gcm_token = _encrypt_AES_GCM(_JWT)
+	assert _decrypt_AES_CBC(cbc_token)==_JWT and _decrypt_AES_GCM(gcm_token)==_JWT
+
+	print('jwt size: %d, cbc token size: %d, gcm token size: %d' % (len(_JWT), len(cbc_token), len(gcm_token)))
+	print('%-10s %-14s %-14s %s' % ('op', 'cbc (op/s)', 'gcm (op/s)', 'gcm/cbc'))
+	for op, cbc, gcm in [('encrypt', lambda: _encrypt_AES_CBC(_JWT), lambda: _encrypt_AES_GCM(_JWT)),
+		('decrypt', lambda: _decrypt_AES_CBC(cbc_token), lambda: _decrypt_AES_GCM(gcm_token))]:
+		cbc_ops = _ops_per_second(cbc)
+		gcm_ops = _ops_per_second(gcm)
+		print('%-10s %-14.0f %-14.0f %.2fx' % (op, cbc_ops, gcm_ops, gcm_ops/cbc_ops))
+
+
+if __name__ == '__main__':
+	main()
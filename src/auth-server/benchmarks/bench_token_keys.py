@@ -0,0 +1,72 @@
+"""
+Benchmark of the JWT sign and verify throughput (python-jose), passing the raw key
+string on every call (before) against the key parsed once (after), for HS256 and RS256.
+
+Run from src/auth-server:
+	python -m benchmarks.bench_token_keys
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+#the settings need this envs, the benchmark not use database or cache
+os.environ.setdefault('TEST_MODE', 'YES')
+os.environ.setdefault('PRIVATE_KEY', 'benchmark_private_key')
+os.environ.setdefault('SECRET_KEY', 'a'*32)
+
+from jose import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from app.internal.adapter.auth import _JWT_BACKENDS
+
+
+_DURATION = 2.0
+
+
+def _rsa_keys():
+	private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	private_pem = private_key.private_bytes(serialization.Encoding.PEM,
+		serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+	public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+		serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+	return private_pem, public_pem
+
+
+def _ops_per_second(function):
+	count = 0
+	end = time.perf_counter() + _DURATION
+	while time.perf_counter() < end:
+		function()
+		count+=1
+	return count/_DURATION
+
+
+def _bench(algorithm:str, private_key:str, public_key:str):
+	claims = {'sub':'session_id', 'user_id':'user_id', 'permissions':['logout', 'set_own_email'],
+		'groups':['normal'], 'token_type':'access', 'exp':datetime.utcnow()+timedelta(minutes=20)}
+	#the jose backend parses the keys once
+	backend = _JWT_BACKENDS['jose'](algorithm, private_key, public_key)
+	token = jwt.encode(claims, private_key, algorithm=algorithm)
+	assert backend.decode(token)['user_id']=='user_id'
+
+	results = [
+		('sign', lambda: jwt.encode(claims, private_key, algorithm=algorithm),
+			lambda: backend.encode(claims)),
+		('verify', lambda: jwt.decode(token, public_key, algorithms=[algorithm]),
+			lambda: backend.decode(token))]
+
+	for name, before, after in results:
+		before_ops = _ops_per_second(before)
+		after_ops = _ops_per_second(after)
+		print('%-8s %-8s %-16.0f %-16.0f %.2fx' % (algorithm, name, before_ops, after_ops, after_ops/before_ops))
+
+
+def main():
+	print('%-8s %-8s %-16s %-16s %s' % ('alg', 'op', 'raw key (op/s)', 'parsed (op/s)', 'speedup'))
+	_bench('HS256', os.environ['PRIVATE_KEY'], os.environ['PRIVATE_KEY'])
+	private_pem, public_pem = _rsa_keys()
+	_bench('RS256', private_pem, public_pem)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
 from typing import List
 import uuid
+import json
 import time
+import asyncio
 
 import sys
 import os.path
@@ -10,6 +12,8 @@ from app.main import app
 
 #Test components
 from tests.test_auth_routers import AuthRouter, _random, ErrorValidator, ErrorCheck
+from app.internal.adapter.cache import _group_permissions_cache, _GroupPermissionsLocalCache, SessionCache
+from app.internal.adapter import test_database
 
 
 client = TestClient(app)
@@ -39,6 +43,10 @@ class AdminRouter():
         return self._client.post('/admin/users', json={'email':email, 'username':username,
             'password':password, 'is_complete':is_complete}, headers = {'Authorization':'Bearer '+self.access_token})
     
+    def create_users(self, users:list):
+        return self._client.post('/admin/users/bulk', json={'users':users}, 
+            headers = {'Authorization':'Bearer '+self.access_token})
+    
     def get_users(self):
         return self._client.get('/admin/users', headers = {'Authorization':'Bearer '+self.access_token})
     
@@ -61,6 +69,13 @@ class AdminRouter():
     def get_permissions(self):
         return self._client.get('/admin/permissions', headers = {'Authorization':'Bearer '+self.access_token})
     
+    def get_permissions_page(self, cursor:str, limit:int):
+        return self._client.get('/admin/permissions', params={'cursor':cursor, 'limit':limit},
+            headers = {'Authorization':'Bearer '+self.access_token})
+    
+    def export(self, name:str):
+        return self._client.get('/admin/export/'+name, headers = {'Authorization':'Bearer '+self.access_token})
+    
     def get_permission(self, id:str):
         return self._client.get('/admin/permissions/'+id, headers = {'Authorization':'Bearer '+self.access_token})
     
@@ -293,6 +308,48 @@ def test_set_user():
     assert response.status_code==200
 
 
+def test_create_users_bulk():
+    #login admin
+    response = login()
+
+    users = [{'email':'bulk'+str(i)+'@gmail.com', 'username':'bulk_user'+str(i), 'password':_user_password,
+        'is_complete':i%2==0} for i in range(4)]
+
+    #try to create users with repeated email
+    response = admin_router.create_users(users+[dict(users[0], username='bulk_user9')])
+    print(response.json())
+    assert response.status_code==400
+    assert ErrorCheck.check_locs(['users', 4, 'email'], response.json())
+
+    #create users
+    response = admin_router.create_users(users)
+    print(response.json())
+    assert response.status_code==201
+    user_ids = response.json()['ids']
+    assert len(user_ids)==4
+
+    #the completed user can authenticate, the other must complete the signup
+    response = router.authenticate(users[0]['email'], _user_password)
+    assert response.status_code==200
+    response = router.complete_signup(users[1]['email'], _user_password, _random)
+    print(response.json())
+    assert response.status_code==200
+
+    #try to create existed users
+    response = admin_router.create_users(users[2:])
+    print(response.json())
+    assert response.status_code==400
+    assert ErrorCheck.check_locs(['users', 0, 'email'], response.json())
+
+    #delete created users
+    for user_id in user_ids:
+        response = admin_router.delete_user(user_id)
+        assert response.status_code==200
+
+    #logout admin
+    logout()
+
+
 #______________________PERMISSION_CRUD_TEST_________________________#
 
 def _test_get_permission(id:str):
@@ -346,6 +403,58 @@ def test_create_permission():
     logout()
 
 
+def test_get_permissions_pages():
+    #login admin
+    response = login()
+
+    #the permissions with the same created are ordered by id
+    all_ids = [permission['id'] for permission in admin_router.get_permissions().json()]
+    ids = []
+    cursor = ''
+    while cursor is not None:
+        response = admin_router.get_permissions_page(cursor, 3)
+        print(response.json())
+        assert response.status_code==200
+        assert len(response.json()['items'])<=3
+        ids.extend([permission['id'] for permission in response.json()['items']])
+        cursor = response.json()['next_cursor']
+    assert sorted(ids)==sorted(all_ids)
+    assert len(set(ids))==len(ids)
+
+    #invalid cursor
+    response = admin_router.get_permissions_page('invalid', 3)
+    print(response.json())
+    assert response.status_code==400
+    assert ErrorCheck.check_locs(['cursor'], response.json())
+
+    #logout admin
+    logout()
+
+
+def test_export():
+    #login admin
+    response = login()
+
+    #export users, one json per line, without passwords
+    response = admin_router.export('users')
+    assert response.status_code==200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    users = [json.loads(line) for line in response.text.splitlines()]
+    print(users)
+    assert len(users)>0
+    assert all('password' not in user and 'salt' not in user for user in users)
+
+    #export sessions and logs (the admin login created a session)
+    response = admin_router.export('sessions')
+    assert response.status_code==200
+    assert len(response.text.splitlines())>0
+    response = admin_router.export('logs')
+    assert response.status_code==200
+
+    #logout admin
+    logout()
+
+
 #______________________GROUP_CRUD_TEST_________________________#
 
 def _test_get_group(id:str):
@@ -637,6 +746,69 @@ def test_group_permission_grant():
     logout()
 
 
+def _check_authorization(access_token:str, permissions:list):
+    response = client.post('/intra/authorization', json={'access_token':access_token, 'permissions':permissions})
+    print(response.json())
+    return response.status_code
+
+def test_group_permission_change_authorization():
+    group_id = 'cache_group'
+    #login admin
+    response = login()
+
+    #create group with create_permission permission
+    response = admin_router.create_group(group_id)
+    assert response.status_code==201
+    response = admin_router.grant_permission_to_group(group_id, 'create_permission')
+    assert response.status_code==200
+
+    #create user on the group
+    response = admin_router.create_user(_user_email, _user_username, _user_password, True)
+    assert response.status_code==201
+    user_id = response.json()['id']
+    _test_add_user_to_group(user_id, group_id)
+
+    #the group permissions are loaded (and cached) on authentication
+    access_token=__authenticate_user()
+    assert _check_authorization(access_token, ['create_permission'])==200
+
+    #remove the permission, the next authentication must not have it
+    response = admin_router.remove_permission_from_group(group_id, 'create_permission')
+    assert response.status_code==200
+    access_token=__authenticate_user()
+    assert _check_authorization(access_token, ['create_permission'])==401
+
+    #old permissions read before the db-worker commit are not cached after the invalidation
+    version = _group_permissions_cache.get_version()
+    _group_permissions_cache.set_many({group_id:['create_permission']}, version)
+    found, missing = _group_permissions_cache.get_many([group_id])
+    assert missing==[group_id]
+
+    #the db-worker commit invalidates the group again, inside the settle window is not late
+    stats = _group_permissions_cache.get_stats()
+    _group_permissions_cache.invalidate([group_id], committed=True)
+    assert _group_permissions_cache.get_stats()['committed_invalidations']==stats['committed_invalidations']+1
+    assert _group_permissions_cache.get_stats()['late_commits']==stats['late_commits']
+
+    #a commit after the settle window removes the old permissions cached meanwhile, and it is counted
+    local_cache = _GroupPermissionsLocalCache(60, 0)
+    local_cache.invalidate([group_id])
+    local_cache.set_many({group_id:['create_permission']}, local_cache.get_version())
+    local_cache.invalidate([group_id], committed=True)
+    found, missing = local_cache.get_many([group_id])
+    assert missing==[group_id]
+    assert local_cache.get_stats()['late_commits']==1
+
+    #delete created user and group
+    response = admin_router.delete_user(user_id)
+    assert response.status_code==200
+    response = admin_router.delete_group(group_id)
+    assert response.status_code==200
+
+    #logout admin
+    logout()
+
+
 #________________SESSION_MANAGEMENT_TESTS_________________________________________#
 
 def __authenticate_user_tokens():
@@ -703,4 +875,45 @@ def test_remove_session():
     #Delete created user
     response = admin_router.delete_user(user_id)
     print(response.json())
-    assert response.status_code==200
\ No newline at end of file
+    assert response.status_code==200
+
+
+def test_remove_session_before_database_delete():
+    #the db-worker applies the sessions deletes later, the revoked sessions must not be read back
+    response = login()
+    response = admin_router.create_user(_user_email, _user_username, _user_password, True)
+    assert response.status_code==201
+    user_id = response.json()['id']
+    tokens1 = __authenticate_user_tokens()
+    tokens2 = __authenticate_user_tokens()
+
+    #remove session 1, the database delete is not applied yet
+    sessions = list(test_database._database['sessions'])
+    _test_remove_session(tokens1['access_token'],True)
+    test_database._database['sessions'] = list(sessions)
+    response = router.refresh_token(tokens1['refresh_token'])
+    print(response.json())
+    assert response.status_code==404
+
+    #remove all the user sessions (the cached sessions are deleted), the database delete is not applied yet
+    _test_remove_session(tokens2['access_token'],False)
+    test_database._database['sessions'] = list(sessions)
+    for tokens in [tokens1, tokens2]:
+        response = router.refresh_token(tokens['refresh_token'])
+        print(response.json())
+        assert response.status_code==404
+
+    #a session created after the revoke is valid, also when it is not cached
+    tokens3 = __authenticate_user_tokens()
+    response = client.post('/intra/authorization',json={'access_token':tokens3['access_token']})
+    asyncio.run(SessionCache(None).delete(response.json()['session_id']))
+    response = router.refresh_token(tokens3['refresh_token'])
+    print(response.json())
+    assert response.status_code==200
+
+    #Delete created user
+    response = admin_router.delete_user(user_id)
+    assert response.status_code==200
+
+    #logout admin
+    logout()
\ No newline at end of file
@@ -2,11 +2,16 @@ from fastapi.testclient import TestClient
 from typing import List
 import uuid
 import time
+import asyncio
+import pytest
 
 import sys
 import os.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 from app.main import app
+from app import dependencies
+from app.internal.adapter.auth import _decrypt_AES, _encrypt_AES_CBC, _get_jwt_backend, TokenGenerator
+from app.internal.adapter.database import _TransactionPublisher, _PublisherFullError
 
 #Test components
 from tests.test_auth_routers import AuthRouter, _random, ErrorValidator, ErrorCheck
@@ -28,10 +33,16 @@ class IntraRouter():
     def get_status(self):
         return self._client.get('/intra/status')
 
+    def get_metrics(self):
+        return self._client.get('/intra/metrics')
+
     def check_authorization(self, access_token:str, permissions:list, groups:list):
         return self._client.post('/intra/authorization',
             json={'access_token':access_token, 'permissions':permissions, 'groups':groups})
 
+    def check_authorization_batch(self, items:list):
+        return self._client.post('/intra/authorization/batch', json={'items':items})
+
 
 #_________________TESTS_INTRA_ROUTERS________________________________________#
 
@@ -66,6 +77,54 @@ def test_get_status():
     print(response.json())
     assert response.status_code==200
 
+def test_get_metrics():
+    response = intra_router.get_metrics()
+    print(response.json())
+    assert response.status_code==200
+    password_hasher = response.json()['password_hasher']
+    assert password_hasher['waiting']==0
+    assert password_hasher['running']==0
+    assert 'cache_pool' in response.json()
+    assert 'group_permissions_cache' in response.json()
+    database_pool = response.json()['database_pool']
+    assert database_pool['timeouts']==0
+    assert 'wait_time_histogram' in database_pool
+    audit_log_publisher = response.json()['audit_log_publisher']
+    assert audit_log_publisher['max_size']==500
+    assert audit_log_publisher['pending']==0
+
+class _BrokerTask():
+    def __init__(self):
+        self.messages = []
+        self.fail = False
+
+    def delay(self, batch:list):
+        if self.fail: raise ConnectionError('broker not available')
+        self.messages.append(batch)
+
+def test_transaction_publisher_broker_errors():
+    async def publish():
+        #the requests wait the message of their lists, the broker errors are raised to them
+        task = _BrokerTask()
+        publisher = _TransactionPublisher(3, 0.001, task=task, single_task=None)
+        await asyncio.gather(*[publisher.publish([i]) for i in range(4)])
+        assert task.messages==[[[0],[1],[2]], [[3]]]
+        task.fail = True
+        with pytest.raises(ConnectionError): await publisher.publish([4])
+        assert publisher.get_stats()['pending']==0
+
+        #without wait the failed lists are kept (none dropped), when full the new lists are refused
+        task = _BrokerTask()
+        task.fail = True
+        publisher = _TransactionPublisher(2, 0.001, task=task, single_task=None, wait=False)
+        for i in range(40): await publisher.publish([i])
+        with pytest.raises(_PublisherFullError): await publisher.publish([40])
+        task.fail = False
+        publisher.flush()
+        assert task.messages==[[[i] for i in range(40)]]
+        assert publisher.get_stats()['refused']==1
+    asyncio.run(publish())
+
 def test_check_authorization():
     access_token, refresh_token = _user_signup_flow()
 
@@ -95,4 +154,95 @@ def test_check_authorization():
     response = intra_router.check_authorization(refresh_token, ['set_own_email','admin'],['normal'])
     print(response.json())
     assert response.status_code==403
-    assert ErrorCheck.check_locs(['access_token'], response.json())
\ No newline at end of file
+    assert ErrorCheck.check_locs(['access_token'], response.json())
+
+def test_check_authorization_token_cache():
+    response = router.authenticate(_email, _password)
+    print(response.json())
+    assert response.status_code==200
+    access_token = response.json()['access_token']
+
+    #first check, decode and cache the access token
+    response = intra_router.check_authorization(access_token, ['set_own_email'],[])
+    assert response.status_code==200
+    hits = intra_router.get_metrics().json()['token_cache']['hits']
+
+    #second check, use the cached token
+    response = intra_router.check_authorization(access_token, ['set_own_email'],['normal'])
+    print(response.json())
+    assert response.status_code==200
+    assert intra_router.get_metrics().json()['token_cache']['hits']==hits+1
+
+    #the cached token must check the permissions too
+    response = intra_router.check_authorization(access_token, ['admin'],[])
+    assert response.status_code==401
+
+def test_check_authorization_batch():
+    response = router.authenticate(_email, _password)
+    assert response.status_code==200
+    access_token = response.json()['access_token']
+    refresh_token = response.json()['refresh_token']
+
+    response = intra_router.check_authorization_batch([
+        {'access_token':access_token, 'permissions':['set_own_email'], 'groups':['normal']},
+        {'access_token':'Bearer '+access_token, 'permissions':['admin'], 'groups':[]},
+        {'access_token':refresh_token, 'permissions':[], 'groups':[]},
+        {'access_token':access_token}])
+    print(response.json())
+    assert response.status_code==200
+    results = response.json()['results']
+    assert len(results)==4
+
+    assert results[0]['authorized'] and results[0]['user_id'] is not None
+    #wrong permissions
+    assert not results[1]['authorized'] and results[1]['status_code']==401
+    #wrong access_token
+    assert not results[2]['authorized'] and results[2]['status_code']==403
+    assert ErrorCheck.check_locs(['access_token'], {'detail':results[2]['detail']})
+    #only user_id and session_id
+    assert results[3]['authorized'] and results[3]['session_id']==results[0]['session_id']
+
+    #try to check without items
+    response = intra_router.check_authorization_batch([])
+    print(response.json())
+    assert response.status_code==422
+
+def test_check_authorization_token_envelopes():
+    response = router.authenticate(_email, _password)
+    assert response.status_code==200
+    access_token = response.json()['access_token']
+
+    #the tokens created before the gcm envelope (cbc) are accepted
+    cbc_access_token = _encrypt_AES_CBC(_decrypt_AES(access_token, True))
+    response = intra_router.check_authorization(cbc_access_token, ['set_own_email'],['normal'])
+    print(response.json())
+    assert response.status_code==200
+
+    #try to check a modified access_token
+    middle = len(access_token)//2
+    changed = 'A' if access_token[middle]!='A' else 'B'
+    response = intra_router.check_authorization(access_token[:middle]+changed+access_token[middle+1:], [],[])
+    print(response.json())
+    assert response.status_code==403
+    assert ErrorCheck.check_locs(['access_token'], response.json())
+
+def test_check_authorization_pyjwt_backend(monkeypatch):
+    #the app runs with JWT_BACKEND=pyjwt
+    pyjwt_backend = _get_jwt_backend('pyjwt')
+    monkeypatch.setattr(dependencies, '_token_generator', TokenGenerator(pyjwt_backend))
+
+    response = router.authenticate(_email, _password)
+    print(response.json())
+    assert response.status_code==200
+    access_token = response.json()['access_token']
+    assert pyjwt_backend.decode(_decrypt_AES(access_token, True))['token_type']=='access'
+
+    #the pyjwt token is verified by the authorization path
+    response = intra_router.check_authorization(access_token, ['set_own_email'],['normal'])
+    print(response.json())
+    assert response.status_code==200
+    response = intra_router.check_authorization(access_token, ['admin'],[])
+    assert response.status_code==401
+
+    #the tokens are compatible with the jose backend
+    assert _get_jwt_backend('jose').decode(_decrypt_AES(access_token, True))['token_type']=='access'
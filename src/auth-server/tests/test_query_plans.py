@@ -0,0 +1,114 @@
+"""
+Query plans of the relational lookups (find_many_by and delete_many_by), needs a local Postgres:
+    TEST_DATABASE_URI=<username>:<password>@localhost/<db_name> pytest tests/test_query_plans.py
+The auth-server tables are created on a temporary schema, inside a transaction that is rolled back.
+The tables of the database schema (created and migrated by the db-worker) are only inspected.
+"""
+import os
+import re
+import sys
+import uuid
+import asyncio
+import pytest
+from sqlalchemy import delete, text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import os.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from app.internal.adapter.database import Base
+from app.internal.adapter.cruds import (RandomCRUD, SessionCRUD, UserPermissionCRUD,
+    UserGroupCRUD, GroupPermissionCRUD)
+
+
+_DATABASE_URI = os.environ.get('TEST_DATABASE_URI')
+_SCHEMA = 'query_plans_test'
+
+pytestmark = pytest.mark.skipif(_DATABASE_URI is None, reason='TEST_DATABASE_URI not setted (local Postgres)')
+
+#(crud_class, repeated_data, index), one lookup by each column of the composite primary keys
+#the primary key only serves the lookups by its first column
+_LOOKUPS = [
+    (RandomCRUD, {'id':uuid.uuid4()}, 'randoms_pkey'),
+    (RandomCRUD, {'flow':'signup'}, 'ix_randoms_flow'),
+    (SessionCRUD, {'user_id':uuid.uuid4()}, 'ix_sessions_user_id'),
+    (SessionCRUD, {'session_id':uuid.uuid4()}, 'sessions_pkey'),
+    (UserPermissionCRUD, {'user_id':uuid.uuid4()}, 'user_permissions_pkey'),
+    (UserPermissionCRUD, {'permission_id':'read_user'}, 'ix_user_permissions_permission_id'),
+    (UserGroupCRUD, {'user_id':uuid.uuid4()}, 'user_groups_pkey'),
+    (UserGroupCRUD, {'group_id':'normal'}, 'ix_user_groups_group_id'),
+    (GroupPermissionCRUD, {'group_id':'normal'}, 'group_permissions_pkey'),
+    (GroupPermissionCRUD, {'permission_id':'read_user'}, 'ix_group_permissions_permission_id')
+]
+#indexes removed from the models, dropped by the db-worker migration
+_DROPPED_INDEXES = ['ix_sessions_session_id']
+
+
+def _get_statements(crud_class, repeated_data:dict):
+    crud = crud_class(None)
+    query = crud._get_query_by(repeated_data)
+    return [select(crud.model_class).where(query), delete(crud.model_class).where(query)]
+
+
+async def _explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = await connection.exec_driver_sql('EXPLAIN '+str(compiled), params)
+    return '\n'.join(row[0] for row in result)
+
+
+async def _get_first_column(connection, index:str):
+    #first column of a valid index of the current schema, None if not exists
+    result = await connection.execute(text('SELECT a.attname FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_attribute a ON a.attrelid = i.indrelid '
+        'AND a.attnum = i.indkey[0] WHERE c.oid = to_regclass(:index) AND i.indisvalid'), {'index':index})
+    return result.scalar()
+
+
+async def _get_plans():
+    #{(tablename, column): (index, [plans])}
+    engine = create_async_engine('postgresql+asyncpg://'+_DATABASE_URI)
+    plans = {}
+    try:
+        async with engine.connect() as connection:
+            transaction = await connection.begin()
+            await connection.execute(text('CREATE SCHEMA '+_SCHEMA))
+            await connection.execute(text('SET LOCAL search_path TO '+_SCHEMA))
+            await connection.run_sync(Base.metadata.create_all)
+            #a lookup without index can only be a sequential scan
+            await connection.execute(text('SET LOCAL enable_seqscan TO off'))
+            for crud_class, repeated_data, index in _LOOKUPS:
+                key = (crud_class.tablename, list(repeated_data.keys())[0])
+                plans[key] = (index, [await _explain(connection, statement)
+                    for statement in _get_statements(crud_class, repeated_data)])
+            await transaction.rollback()
+    finally: await engine.dispose()
+    return plans
+
+
+async def _get_database_indexes():
+    #{index: first column} of the database schema, None if the db-worker has not created the tables
+    engine = create_async_engine('postgresql+asyncpg://'+_DATABASE_URI)
+    try:
+        async with engine.connect() as connection:
+            if (await connection.execute(text("SELECT to_regclass('sessions')"))).scalar() is None: return None
+            return {index: await _get_first_column(connection, index)
+                for index in [index for crud_class, repeated_data, index in _LOOKUPS]+_DROPPED_INDEXES}
+    finally: await engine.dispose()
+
+
+def test_relational_lookups_use_indexes():
+    #with the seq scans disabled a full scan of the primary key is still an "Index" plan,
+    #so the plan must use the index that starts with the filtered column
+    for (tablename, column), (index, plans) in asyncio.run(_get_plans()).items():
+        for plan in plans:
+            assert re.search(r'(using|on) '+index+r'\b', plan), tablename+'.'+column+' ('+index+'):\n'+plan
+
+
+def test_database_indexes():
+    indexes = asyncio.run(_get_database_indexes())
+    if indexes is None: pytest.skip('the database tables are not created (db-worker not started)')
+    for crud_class, repeated_data, index in _LOOKUPS:
+        column = list(repeated_data.keys())[0]
+        assert indexes[index]==column, crud_class.tablename+'.'+column+': '+index+' starts with '+str(indexes[index])
+    for index in _DROPPED_INDEXES: assert indexes[index] is None, index+' not dropped'
@@ -0,0 +1,40 @@
+import json
+import logging
+import redis
+from .settings import BACKEND
+from .database import GroupPermissionTable
+
+
+#the auth-servers listen this channel and invalidate their group permissions local cache
+_GROUP_PERMISSIONS_COMMITTED_CHANNEL = BACKEND['PREFIX']+':group_permissions:committed'
+
+_logger = logging.getLogger(__name__)
+
+_client = None
+if BACKEND['CACHE_URI'] is not None: _client = redis.Redis.from_url(BACKEND['CACHE_URI'],
+	#a slow redis must not hold the worker, the settle window still applies
+	socket_timeout=1, socket_connect_timeout=1)
+
+
+def get_changed_groups(transactions_lists:list):
+	#return the group_ids of the group permissions changed by the transactions ([] none, None all)
+	group_ids = set()
+	for transactions_list in transactions_lists:
+		for transaction in transactions_list:
+			if transaction.get('tablename')!=GroupPermissionTable.__tablename__: continue
+			data = transaction.get('data') if transaction.get('type')=='create' else transaction.get('id')
+			if not isinstance(data, dict) or data.get('group_id') is None: return None
+			group_ids.add(data['group_id'])
+	return sorted(group_ids)
+
+
+def publish_group_permissions_committed(transactions_lists:list):
+	"""
+	Called after the commit. The auth-servers invalidated the groups when the change was
+	published, but they can read the old permissions again until the db-worker commits it.
+	"""
+	if _client is None: return
+	group_ids = get_changed_groups(transactions_lists)
+	if group_ids is not None and len(group_ids)==0: return
+	try: _client.publish(_GROUP_PERMISSIONS_COMMITTED_CHANNEL, json.dumps(group_ids))
+	except redis.RedisError as ex: _logger.error('group permissions invalidation not published: %s', ex)
@@ -1,31 +1,70 @@
 from celery import Celery
+from kombu import Queue
 from celery.signals import worker_init
 from time import sleep
-from .settings import RABBITMQ_URI, DEFAULT_QUEUE, ADMIN_USER_EMAIL
+import logging
+from sqlalchemy.exc import OperationalError
+from .settings import (RABBITMQ_URI, DEFAULT_QUEUE, AUDIT_LOGS_QUEUE, ADMIN_USER_EMAIL, WORKER_BATCH, 
+	WORKER_ASYNC, LOG_PARTITIONS, REAPER)
 #database
 from .database import engine, Base, SessionLocal
+from .partitions import migrate_legacy_logs, maintain_log_partitions
+from .migrations import migrate_indexes
 from .signals import create_group, create_permission, create_group_permission, create_admin_user
 
 
+_logger = logging.getLogger(__name__)
+
+
 broker=RABBITMQ_URI
 app = Celery('users_db_celery', broker=broker, include=['app.tasks'])
 app.conf.task_default_queue=DEFAULT_QUEUE
+#by default the workers consume both queues
+app.conf.task_queues=(Queue(DEFAULT_QUEUE), Queue(AUDIT_LOGS_QUEUE))
+#periodic tasks (celery -A app.celery beat, only one instance)
+app.conf.beat_schedule={
+	'maintain_log_partitions': {'task':'maintain_log_partitions', 'schedule':float(LOG_PARTITIONS['MAINTENANCE_INTERVAL'])},
+	#a run is skipped if the previous one has not finished (expires)
+	'reap_expired': {'task':'reap_expired', 'schedule':float(REAPER['INTERVAL']), 
+		'options':{'expires':float(REAPER['INTERVAL'])}}
+}
+#the batch consumer acks after the commit, so each process must prefetch a full batch
+if WORKER_BATCH['MAX_SIZE']>1: app.conf.worker_prefetch_multiplier=WORKER_BATCH['MAX_SIZE']
+#async mode, one process with a thread per in flight task (the threads only wait the event loop)
+if WORKER_ASYNC['ENABLED']:
+	app.conf.worker_pool='threads'
+	app.conf.worker_concurrency=WORKER_ASYNC['MAX_IN_FLIGHT']
+	#the prefetch is per thread, keep about two batches buffered by process
+	if WORKER_BATCH['MAX_SIZE']>1:
+		app.conf.worker_prefetch_multiplier=max(1, -(-2*WORKER_BATCH['MAX_SIZE']//WORKER_ASYNC['MAX_IN_FLIGHT']))
 
 
 #___________SIGNALS_____________#
 def create_tables():
+	#only the connection errors are retried, a migration error would fail again on each try
 	for i in range(1,101):
 		try: 
-			Base.metadata.create_all(bind=engine)
+			with engine.begin() as connection:
+				migrate_legacy_logs(connection)
+				Base.metadata.create_all(bind=connection)
+			migrate_indexes()
+			maintain_log_partitions()
 			break
-		except:
+		except OperationalError:
+			if i==100: raise
 			print('Error connecting to database. Try again in 6 seconds. ('+str(i)+'/100)')
 			sleep(6)
 
 
 @worker_init.connect
 def define_database(**kwargs):
-	create_tables()
+	try: create_tables()
+	except Exception as exception:
+		#the exceptions of the signals handlers are only logged, the worker must not start without the schema
+		_logger.exception('Error migrating the database')
+		raise SystemExit(1) from exception
+
+
 	db = SessionLocal()
 	setted=False
 
@@ -30,6 +30,7 @@ class RandomEDIT(BaseRelationalEDIT):
     model_class=RandomTable
     validator_create_class=CreateRandomValidator
     validator_update_class=UpdateRandomValidator
+    unique_fields=('id', 'flow')
 
     def _get_query(self, unique_data_dict:dict):
         return and_(self.model_class.id==unique_data_dict['id'], 
@@ -57,6 +58,7 @@ class PermissionEDIT(BaseEDIT):
 class SessionEDIT(BaseRelationalEDIT):
     model_class=SessionTable
     validator_create_class=CreateSessionValidator
+    unique_fields=('user_id', 'session_id')
 
     def _get_query(self, unique_data_dict:dict):
         return and_(self.model_class.user_id==unique_data_dict['user_id'], 
@@ -71,6 +73,7 @@ class SessionEDIT(BaseRelationalEDIT):
 class UserPermissionEDIT(BaseRelationalEDIT):
     model_class=UserPermissionTable
     validator_create_class=CreateUserPermissionValidator
+    unique_fields=('user_id', 'permission_id')
 
     def _get_query(self, unique_data_dict:dict):
         return and_(self.model_class.user_id==unique_data_dict['user_id'], 
@@ -85,6 +88,7 @@ class UserPermissionEDIT(BaseRelationalEDIT):
 class UserGroupEDIT(BaseRelationalEDIT):
     model_class=UserGroupTable
     validator_create_class=CreateUserGroupValidator
+    unique_fields=('user_id', 'group_id')
 
     def _get_query(self, unique_data_dict:dict):
         return and_(self.model_class.user_id==unique_data_dict['user_id'], 
@@ -99,6 +103,7 @@ class UserGroupEDIT(BaseRelationalEDIT):
 class GroupPermissionEDIT(BaseRelationalEDIT):
     model_class=GroupPermissionTable
     validator_create_class=CreateGroupPermissionValidator
+    unique_fields=('group_id', 'permission_id')
 
     def _get_query(self, unique_data_dict:dict):
         return and_(self.model_class.group_id==unique_data_dict['group_id'], 
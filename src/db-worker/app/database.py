@@ -1,13 +1,14 @@
 import abc
+import io
 import uuid
 from datetime import datetime
-from sqlalchemy import (create_engine, delete, inspect,
-    Boolean, Column, ForeignKey, Integer, String, DateTime)
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (create_engine, delete, insert, inspect, tuple_,
+    Boolean, Column, ForeignKey, Index, Integer, String, DateTime)
+from sqlalchemy.dialects.postgresql import UUID, insert as postgres_insert
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base, as_declarative
 #others
-from app.settings import DATABASE_URI
+from app.settings import DATABASE_URI, WORKER_ASYNC
 from pydantic import ValidationError
 
 
@@ -19,6 +20,17 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, expire_on_commit=True, autoflush=True, bind=engine)
 #Base = declarative_base()#Used to create database models
 
+#async mode, the tables and the initial data are still created with the sync engine
+async_engine = None
+AsyncSessionLocal = None
+if WORKER_ASYNC['ENABLED']:
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    #the in flight lists over the pool size wait for a free connection
+    async_engine = create_async_engine('postgresql+asyncpg://'+DATABASE_URI,
+        pool_size=WORKER_ASYNC['POOL_SIZE'], max_overflow=0)
+    AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, autocommit=False,
+        expire_on_commit=False, autoflush=True)
+
 
 #____________________________MODELS______________________________#
 
@@ -40,6 +52,8 @@ class StatusTable(Base):
 
 class UserTable(Base):
     __tablename__ = 'users'
+    #keyset pagination
+    __table_args__ = (Index('ix_users_created_id', 'created', 'id'),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True)
     salt = Column(String, default=str(uuid.uuid4))
@@ -50,6 +64,8 @@ class UserTable(Base):
 
 class RandomTable(Base):
     __tablename__ = 'randoms'
+    #the reaper deletes the expired randoms, the primary key does not index flow alone
+    __table_args__ = (Index('ix_randoms_updated', 'updated'), Index('ix_randoms_flow', 'flow'))
     id = Column(UUID(as_uuid=True), primary_key=True)
     flow = Column(String, primary_key=True)
     key = Column(String)
@@ -58,30 +74,40 @@ class RandomTable(Base):
 
 class PermissionTable(Base):
     __tablename__ = 'permissions'
+    #keyset pagination
+    __table_args__ = (Index('ix_permissions_created_id', 'created', 'id'),)
     id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
 
 
 class GroupTable(Base):
     __tablename__ = 'groups'
+    #keyset pagination
+    __table_args__ = (Index('ix_groups_created_id', 'created', 'id'),)
     id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
 
 
 class UserPermissionTable(Base):
     __tablename__ = 'user_permissions'
+    #delete_many_by permission_id (the primary key starts with user_id)
+    __table_args__ = (Index('ix_user_permissions_permission_id', 'permission_id'),)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     permission_id = Column(String, primary_key=True)
 
 
 class UserGroupTable(Base):
     __tablename__ = 'user_groups'
+    #delete_many_by group_id (the primary key starts with user_id)
+    __table_args__ = (Index('ix_user_groups_group_id', 'group_id'),)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     group_id = Column(String, primary_key=True)
 
 
 class GroupPermissionTable(Base):
     __tablename__ = 'group_permissions'
+    #delete_many_by permission_id (the primary key starts with group_id)
+    __table_args__ = (Index('ix_group_permissions_permission_id', 'permission_id'),)
     group_id = Column(String, primary_key=True)
     permission_id = Column(String, primary_key=True)
     is_original= Column(Boolean, default=False)
@@ -89,6 +115,9 @@ class GroupPermissionTable(Base):
 
 class SessionTable(Base):
     __tablename__ = 'sessions'
+    #the reaper deletes the expired sessions, find_many_by and delete_many_by user_id
+    #(the primary key starts with session_id)
+    __table_args__ = (Index('ix_sessions_expirated', 'expirated'), Index('ix_sessions_user_id', 'user_id'))
     session_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), primary_key=True)
     expirated = Column(DateTime)
@@ -96,7 +125,15 @@ class SessionTable(Base):
 
 class LogTable(Base):
     __tablename__ = 'logs'
+    #monthly range partitions (app/partitions.py), the indexes are created on each partition
+    __table_args__ = (
+        Index('ix_logs_created', 'created'),
+        Index('ix_logs_user_id_created', 'user_id', 'created'),
+        Index('ix_logs_object_type_created', 'object_type', 'created'),
+        {'postgresql_partition_by': 'RANGE (created)'})
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    #the partition key must be part of the primary key
+    created = Column(DateTime, primary_key=True, default=datetime.now)
     user_id = Column(UUID(as_uuid=True))
     object_type = Column(String)
     object_id = Column(String)
@@ -111,6 +148,8 @@ class BaseEDIT():
     model_class=None
     validator_create_class=None
     validator_update_class=None
+    #fields used by _get_query
+    unique_fields=('id',)
     _errors=None
 
     def __init__(self, db:Session):
@@ -130,6 +169,38 @@ class BaseEDIT():
         query = delete(self.model_class).where(self._get_query(unique_data_dict))
         self.db.execute(query)
 
+    #_____BULK_____#
+    def create_objects(self, objects_schemas:list, ignore_conflicts:bool=False):
+        #the objects must have the same keys, psycopg2 sends a multi-row INSERT
+        query = insert(self.model_class)
+        if ignore_conflicts: query = postgres_insert(self.model_class).on_conflict_do_nothing()
+        self.db.execute(query, objects_schemas)
+
+    def copy_objects(self, objects_schemas:list):
+        #one COPY ... FROM STDIN (csv), the values are always quoted and None is sent as the
+        #unquoted \N, so '' is kept as '' (like the INSERT fallback) and only None is NULL
+        columns = [column.name for column in self.model_class.__table__.columns]
+        buffer = io.StringIO()
+        for data in objects_schemas:
+            buffer.write(','.join('\\N' if data.get(column) is None
+                else '"'+str(data[column]).replace('"', '""')+'"' for column in columns)+'\n')
+        buffer.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert('COPY '+self.model_class.__tablename__+' ('+', '.join(columns)+
+                ") FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        finally: cursor.close()
+
+    def delete_objects(self, unique_data_dicts:list):
+        #one DELETE ... WHERE (unique_fields) IN (...)
+        columns = [getattr(self.model_class, field) for field in self.unique_fields]
+        if len(columns)==1:
+            query = columns[0].in_([data[self.unique_fields[0]] for data in unique_data_dicts])
+        else:
+            query = tuple_(*columns).in_([tuple(data[field] for field in self.unique_fields) 
+                for data in unique_data_dicts])
+        self.db.execute(delete(self.model_class).where(query))
+
     def validate_create(self, data_dict:dict):
         if self.validator_create_class is None: return False
         try: self.validator_create_class.validate(data_dict)
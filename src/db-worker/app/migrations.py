@@ -0,0 +1,55 @@
+import logging
+from sqlalchemy import inspect, text
+from .database import engine, Base
+
+
+#serializes the migration of the workers replicas (any constant number)
+_LOCK_ID = 250417
+#indexes removed from the models (duplicated by a primary key)
+_DROPPED_INDEXES = ['ix_sessions_session_id']
+
+_logger = logging.getLogger(__name__)
+
+
+def _get_invalid_indexes(connection):
+	#the indexes left by a failed CREATE INDEX CONCURRENTLY
+	return set(connection.execute(text('SELECT c.relname FROM pg_index i JOIN pg_class c '
+		'ON c.oid = i.indexrelid WHERE NOT i.indisvalid')).scalars())
+
+
+def migrate_indexes():
+	"""
+	create_all does not add the new indexes of the models to the existing tables, they
+	are created here with CREATE INDEX CONCURRENTLY (the writes are not blocked), and
+	the removed ones are dropped. The partitioned tables get their indexes when they are created.
+	"""
+	created = []
+	dropped = []
+	with engine.connect() as connection:
+		connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+		connection.execute(text('SELECT pg_advisory_lock(:lock_id)'), {'lock_id':_LOCK_ID})
+		try:
+			inspector = inspect(connection)
+			invalid_indexes = _get_invalid_indexes(connection)
+			existing_indexes = set(connection.execute(text('SELECT indexname FROM pg_indexes '
+				'WHERE schemaname = current_schema()')).scalars())
+			for name in _DROPPED_INDEXES:
+				if name not in existing_indexes: continue
+				connection.execute(text('DROP INDEX CONCURRENTLY IF EXISTS '+name))
+				dropped.append(name)
+			for table in Base.metadata.sorted_tables:
+				if table.dialect_options['postgresql']['partition_by'] is not None: continue
+				existing = {index['name'] for index in inspector.get_indexes(table.name)}
+				for index in table.indexes:
+					if index.name in invalid_indexes:
+						connection.execute(text('DROP INDEX CONCURRENTLY IF EXISTS '+index.name))
+					elif index.name in existing: continue
+					columns = ', '.join(column.name for column in index.columns)
+					connection.execute(text('CREATE '+('UNIQUE ' if index.unique else '')+'INDEX CONCURRENTLY '
+						'IF NOT EXISTS '+index.name+' ON '+table.name+' ('+columns+')'))
+					created.append(index.name)
+		finally:
+			connection.execute(text('SELECT pg_advisory_unlock(:lock_id)'), {'lock_id':_LOCK_ID})
+
+	if len(created)>0: _logger.info('indexes created: %s', created)
+	if len(dropped)>0: _logger.info('indexes dropped: %s', dropped)
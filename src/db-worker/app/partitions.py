@@ -0,0 +1,152 @@
+import re
+import logging
+from datetime import datetime
+from sqlalchemy import text
+from pydantic.datetime_parse import parse_datetime
+from .settings import LOG_PARTITIONS
+from .database import engine, LogTable
+
+
+_TABLE = LogTable.__tablename__
+_LEGACY_TABLE = _TABLE+'_legacy'
+#serializes the maintenance of the workers replicas (any constant number)
+_LOCK_ID = 230417
+_BOUNDS = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+_logger = logging.getLogger(__name__)
+
+
+def _month_start(date:datetime, months:int=0):
+	month = date.year*12 + date.month-1 + months
+	return datetime(month//12, month%12+1, 1)
+
+def _partition_name(month:datetime):
+	return _TABLE+'_y'+str(month.year)+'m'+str(month.month).zfill(2)
+
+def _get_relkind(connection, name:str):
+	#'r' table, 'p' partitioned table, None not exists
+	return connection.execute(text('SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)'),
+		{'name':name}).scalar()
+
+def _parse_bound(bound:str):
+	return datetime.fromisoformat(bound) if bound is not None else None
+
+def _is_covered(ranges:list, date:datetime):
+	return any((lower is None or lower<=date) and (upper is None or date<upper) for lower, upper in ranges)
+
+def _create_partition(connection, month:datetime):
+	name = _partition_name(month)
+	connection.execute(text('CREATE TABLE IF NOT EXISTS '+name+' PARTITION OF '+_TABLE+
+		" FOR VALUES FROM ('"+str(month)+"') TO ('"+str(_month_start(month, 1))+"')"))
+	return name
+
+def _get_partitions(connection):
+	#[(name, lower bound, upper bound)], the bounds are datetimes (None MINVALUE/MAXVALUE)
+	rows = connection.execute(text('SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+		'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:name)'), {'name':_TABLE})
+	partitions = []
+	for name, bound in rows:
+		match = _BOUNDS.search(bound or '')
+		if match is None: continue
+		partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+	return partitions
+
+
+#________________________MIGRATION___________________________#
+
+def migrate_legacy_logs(connection):
+	"""
+	A logs table created before the partitions is renamed and attached as the first
+	partition (until the month after its last log), so the old logs are kept and
+	removed by the retention like the others.
+	"""
+	connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id':_LOCK_ID})
+	if _get_relkind(connection, _TABLE)!='r': return
+	_logger.warning('partitioning the logs table, the current logs are kept on %s', _LEGACY_TABLE)
+	connection.execute(text('ALTER TABLE '+_TABLE+' RENAME TO '+_LEGACY_TABLE))
+	connection.execute(text('ALTER TABLE '+_LEGACY_TABLE+' RENAME CONSTRAINT '+_TABLE+'_pkey TO '+_LEGACY_TABLE+'_pkey'))
+	#the partition key can not be null
+	connection.execute(text('UPDATE '+_LEGACY_TABLE+' SET created = COALESCE(updated, now()) WHERE created IS NULL'))
+	connection.execute(text('ALTER TABLE '+_LEGACY_TABLE+' ALTER COLUMN created SET NOT NULL'))
+	last_created = connection.execute(text('SELECT max(created) FROM '+_LEGACY_TABLE)).scalar()
+
+	LogTable.__table__.create(bind=connection)
+	upper_bound = _month_start(last_created or datetime.now(), 1)
+	connection.execute(text('ALTER TABLE '+_TABLE+' ATTACH PARTITION '+_LEGACY_TABLE+
+		" FOR VALUES FROM (MINVALUE) TO ('"+str(upper_bound)+"')"))
+
+
+#________________________APPEND___________________________#
+
+def split_logs_by_partition(connection, logs:list):
+	"""
+	Return (logs, out of range logs). A log without partition for its created date would
+	fail the whole COPY, and the redelivered batch would fail again.
+	"""
+	if _get_relkind(connection, _TABLE)!='p': return logs, []
+	ranges = [(lower, upper) for name, lower, upper in _get_partitions(connection)]
+	in_range = []
+	out_of_range = []
+	for log in logs:
+		if _is_covered(ranges, parse_datetime(log['created'])): in_range.append(log)
+		else: out_of_range.append(log)
+	return in_range, out_of_range
+
+
+def create_missing_log_partitions(logs:list, now:datetime=None, months_ahead:int=LOG_PARTITIONS['MONTHS_AHEAD'],
+	retention_months:int=LOG_PARTITIONS['RETENTION_MONTHS']):
+	"""
+	Creates the partitions of the logs months without partition (the maintenance has not
+	run), from the retention cutoff until the months_ahead month. Return the partitions created.
+	"""
+	if now is None: now = datetime.now()
+	first = _month_start(now, -retention_months) if retention_months>0 else None
+	last = _month_start(now, months_ahead+1)
+	months = {_month_start(parse_datetime(log['created'])) for log in logs}
+	months = sorted(month for month in months if (first is None or month>=first) and month<last)
+	created = []
+	if len(months)==0: return created
+	with engine.begin() as connection:
+		connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id':_LOCK_ID})
+		if _get_relkind(connection, _TABLE)!='p': return created
+		ranges = [(lower, upper) for name, lower, upper in _get_partitions(connection)]
+		for month in months:
+			if not _is_covered(ranges, month): created.append(_create_partition(connection, month))
+	if len(created)>0: _logger.warning('logs partitions created by the appender (is the beat running?): %s', created)
+	return created
+
+
+#________________________MAINTENANCE___________________________#
+
+def maintain_log_partitions(now:datetime=None, months_ahead:int=LOG_PARTITIONS['MONTHS_AHEAD'],
+	retention_months:int=LOG_PARTITIONS['RETENTION_MONTHS'], drop:bool=LOG_PARTITIONS['DROP']):
+	"""
+	Creates the partitions of the current month and the months_ahead next months, and
+	detaches (and drops) the partitions older than retention_months.
+	"""
+	if now is None: now = datetime.now()
+	created = []
+	removed = []
+	with engine.begin() as connection:
+		connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id':_LOCK_ID})
+		if _get_relkind(connection, _TABLE)!='p':
+			_logger.warning('the logs table is not partitioned, maintenance skipped')
+			return
+		partitions = _get_partitions(connection)
+
+		#the months already covered (by a partition or the legacy one) are skipped
+		ranges = [(lower, upper) for name, lower, upper in partitions]
+		for months in range(months_ahead+1):
+			start = _month_start(now, months)
+			if not _is_covered(ranges, start): created.append(_create_partition(connection, start))
+
+		if retention_months>0:
+			cutoff = _month_start(now, -retention_months)
+			for name, lower, upper in partitions:
+				if upper is None or upper>cutoff: continue
+				connection.execute(text('ALTER TABLE '+_TABLE+' DETACH PARTITION '+name))
+				if drop: connection.execute(text('DROP TABLE '+name))
+				removed.append(name)
+
+	if len(created)>0 or len(removed)>0:
+		_logger.info('logs partitions created: %s, %s: %s', created, 'dropped' if drop else 'detached', removed)
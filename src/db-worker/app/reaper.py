@@ -0,0 +1,44 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, tuple_
+from .settings import REAPER
+from .database import engine, SessionTable, RandomTable
+
+
+_logger = logging.getLogger(__name__)
+
+
+def _delete_expired(model_class, condition, batch_size:int, pause:float, max_batches:int):
+	"""
+	Deletes the rows that match condition, batch_size rows by transaction (the rows are
+	found with the condition index), so the locks and the WAL of each delete are bounded.
+	Return the rows deleted.
+	"""
+	primary_key = tuple_(*model_class.__table__.primary_key.columns)
+	expired = select(*model_class.__table__.primary_key.columns).where(condition).limit(batch_size)
+	deleted = 0
+	for batch in range(max_batches):
+		with engine.begin() as connection:
+			rows = connection.execute(delete(model_class).where(primary_key.in_(expired))).rowcount
+		deleted+=rows
+		if rows<batch_size: break
+		time.sleep(pause)
+	return deleted
+
+
+def reap_expired(now:datetime=None, utc_now:datetime=None, batch_size:int=REAPER['BATCH_SIZE'],
+	pause:float=REAPER['BATCH_PAUSE']/1000, max_batches:int=REAPER['MAX_BATCHES']):
+	#return {tablename: rows deleted}
+	#the sessions expirated is written on utc, the randoms updated on local time
+	if now is None: now = datetime.now()
+	if utc_now is None: utc_now = datetime.utcnow()
+	start = time.perf_counter()
+	report = {
+		SessionTable.__tablename__: _delete_expired(SessionTable, SessionTable.expirated<utc_now,
+			batch_size, pause, max_batches),
+		RandomTable.__tablename__: _delete_expired(RandomTable,
+			RandomTable.updated<now-timedelta(minutes=REAPER['RANDOM_EXP']), batch_size, pause, max_batches)
+	}
+	_logger.info('expired rows deleted in %.2fs: %s', time.perf_counter()-start, report)
+	return report
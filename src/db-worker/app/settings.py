@@ -1,6 +1,6 @@
 import os
 from .validators import (DatabaseUriValidator, RabbitmqUriValidator, 
-	RabbitmqQueueValidator, EmailValidator)
+	RabbitmqQueueValidator, EmailValidator, ExpValidator)
 
 
 def _not_setted_exception(env_name:str):
@@ -15,11 +15,14 @@ def _invalid_exception(env_name:str):
 #amqp://<username>:<password>@<hostname>/<vhost_name>
 RABBITMQ_URI = os.environ.get('RABBITMQ_URI')
 DEFAULT_QUEUE = os.environ.get('WORKER_DEFAULT_QUEUE','auth_db_transactions')
+#the audit logs are written behind the business transactions (run workers with -Q <AUDIT_LOGS_QUEUE> to scale them alone)
+AUDIT_LOGS_QUEUE = os.environ.get('AUDIT_LOGS_QUEUE','auth_audit_logs')
 
 #__ENV_TEST____#
 if RABBITMQ_URI is None: raise _not_setted_exception('RABBITMQ_URI')
 elif not RabbitmqUriValidator.is_valid(RABBITMQ_URI): raise _invalid_exception('RABBITMQ_URI')
 if not RabbitmqQueueValidator.is_valid(DEFAULT_QUEUE): raise _invalid_exception('WORKER_DEFAULT_QUEUE')
+if not RabbitmqQueueValidator.is_valid(AUDIT_LOGS_QUEUE): raise _invalid_exception('AUDIT_LOGS_QUEUE')
 
 
 #______________AUTH_SETTINGS_________________#
@@ -47,4 +50,118 @@ DATABASE_URI = os.environ.get('DATABASE_URI')
 
 #__ENV_TEST____#
 if DATABASE_URI is None: raise _not_setted_exception('DATABASE_URI')
-elif not DatabaseUriValidator.is_valid(DATABASE_URI): raise _invalid_exception('DATABASE_URI')
\ No newline at end of file
+elif not DatabaseUriValidator.is_valid(DATABASE_URI): raise _invalid_exception('DATABASE_URI')
+
+
+#_____________WORKER_BATCH_SETTINGS______________#
+
+WORKER_BATCH={
+	#Max messages applied on the same database transaction (1 disable the batch consumer)
+	'MAX_SIZE': os.environ.get('WORKER_BATCH_SIZE', '100'),
+	#Max milliseconds a message waits to be applied with others
+	'MAX_DELAY': os.environ.get('WORKER_BATCH_DELAY', '100')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(WORKER_BATCH['MAX_SIZE']): raise _invalid_exception('WORKER_BATCH_SIZE')
+if not ExpValidator.is_valid(WORKER_BATCH['MAX_DELAY']): raise _invalid_exception('WORKER_BATCH_DELAY')
+WORKER_BATCH['MAX_SIZE'] = int(WORKER_BATCH['MAX_SIZE'])
+WORKER_BATCH['MAX_DELAY'] = int(WORKER_BATCH['MAX_DELAY'])
+if WORKER_BATCH['MAX_SIZE']<1: raise _invalid_exception('WORKER_BATCH_SIZE')
+if WORKER_BATCH['MAX_DELAY']<1: raise _invalid_exception('WORKER_BATCH_DELAY')
+
+
+#_____________AUDIT_LOGS_SETTINGS______________#
+
+AUDIT_LOGS_BUFFER={
+	#Max audit logs messages written with the same COPY
+	'MAX_SIZE': os.environ.get('AUDIT_LOGS_BUFFER_SIZE', '20'),
+	#Max milliseconds an audit logs message waits to be written with others
+	'MAX_DELAY': os.environ.get('AUDIT_LOGS_BUFFER_DELAY', '1000')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(AUDIT_LOGS_BUFFER['MAX_SIZE']): raise _invalid_exception('AUDIT_LOGS_BUFFER_SIZE')
+if not ExpValidator.is_valid(AUDIT_LOGS_BUFFER['MAX_DELAY']): raise _invalid_exception('AUDIT_LOGS_BUFFER_DELAY')
+AUDIT_LOGS_BUFFER['MAX_SIZE'] = int(AUDIT_LOGS_BUFFER['MAX_SIZE'])
+AUDIT_LOGS_BUFFER['MAX_DELAY'] = int(AUDIT_LOGS_BUFFER['MAX_DELAY'])
+if AUDIT_LOGS_BUFFER['MAX_SIZE']<1: raise _invalid_exception('AUDIT_LOGS_BUFFER_SIZE')
+if AUDIT_LOGS_BUFFER['MAX_DELAY']<1: raise _invalid_exception('AUDIT_LOGS_BUFFER_DELAY')
+
+
+#_____________LOG_PARTITIONS_SETTINGS______________#
+
+LOG_PARTITIONS={
+	#Monthly partitions of the logs table created ahead of the current month
+	'MONTHS_AHEAD': os.environ.get('LOG_PARTITIONS_AHEAD', '3'),
+	#Months of logs kept, the older partitions are removed (0 keep all the logs)
+	'RETENTION_MONTHS': os.environ.get('LOG_RETENTION_MONTHS', '12'),
+	#NO, the old partitions are only detached (to archive them)
+	'DROP': os.environ.get('LOG_PARTITIONS_DROP', 'YES'),
+	#Seconds between the partitions maintenances (celery beat)
+	'MAINTENANCE_INTERVAL': os.environ.get('LOG_PARTITIONS_MAINTENANCE_INTERVAL', '21600')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(LOG_PARTITIONS['MONTHS_AHEAD']): raise _invalid_exception('LOG_PARTITIONS_AHEAD')
+if not ExpValidator.is_valid(LOG_PARTITIONS['RETENTION_MONTHS']): raise _invalid_exception('LOG_RETENTION_MONTHS')
+if LOG_PARTITIONS['DROP'] not in ['YES', 'NO']: raise _invalid_exception('LOG_PARTITIONS_DROP')
+if not ExpValidator.is_valid(LOG_PARTITIONS['MAINTENANCE_INTERVAL']): raise _invalid_exception('LOG_PARTITIONS_MAINTENANCE_INTERVAL')
+LOG_PARTITIONS['MONTHS_AHEAD'] = int(LOG_PARTITIONS['MONTHS_AHEAD'])
+LOG_PARTITIONS['RETENTION_MONTHS'] = int(LOG_PARTITIONS['RETENTION_MONTHS'])
+LOG_PARTITIONS['DROP'] = LOG_PARTITIONS['DROP']=='YES'
+LOG_PARTITIONS['MAINTENANCE_INTERVAL'] = int(LOG_PARTITIONS['MAINTENANCE_INTERVAL'])
+if LOG_PARTITIONS['MAINTENANCE_INTERVAL']<1: raise _invalid_exception('LOG_PARTITIONS_MAINTENANCE_INTERVAL')
+
+
+#_____________REAPER_SETTINGS______________#
+
+REAPER={
+	#Seconds between the deletes of the expired sessions and randoms (celery beat)
+	'INTERVAL': os.environ.get('REAPER_INTERVAL', '300'),
+	#Max rows deleted by each database transaction
+	'BATCH_SIZE': os.environ.get('REAPER_BATCH_SIZE', '1000'),
+	#Milliseconds between two batches, so the reaper does not compete with the transactions
+	'BATCH_PAUSE': os.environ.get('REAPER_BATCH_PAUSE', '100'),
+	#Max batches by table on each run (the rest waits the next run)
+	'MAX_BATCHES': os.environ.get('REAPER_MAX_BATCHES', '100'),
+	#The auth-server RANDOM_EXP (minutes)
+	'RANDOM_EXP': os.environ.get('RANDOM_EXP', '10')
+}
+
+#__ENV_TEST____#
+if not ExpValidator.is_valid(REAPER['INTERVAL']): raise _invalid_exception('REAPER_INTERVAL')
+if not ExpValidator.is_valid(REAPER['BATCH_SIZE']): raise _invalid_exception('REAPER_BATCH_SIZE')
+if not ExpValidator.is_valid(REAPER['BATCH_PAUSE']): raise _invalid_exception('REAPER_BATCH_PAUSE')
+if not ExpValidator.is_valid(REAPER['MAX_BATCHES']): raise _invalid_exception('REAPER_MAX_BATCHES')
+if not ExpValidator.is_valid(REAPER['RANDOM_EXP']): raise _invalid_exception('RANDOM_EXP')
+REAPER['INTERVAL'] = int(REAPER['INTERVAL'])
+REAPER['BATCH_SIZE'] = int(REAPER['BATCH_SIZE'])
+REAPER['BATCH_PAUSE'] = int(REAPER['BATCH_PAUSE'])
+REAPER['MAX_BATCHES'] = int(REAPER['MAX_BATCHES'])
+REAPER['RANDOM_EXP'] = int(REAPER['RANDOM_EXP'])
+if REAPER['INTERVAL']<1: raise _invalid_exception('REAPER_INTERVAL')
+if REAPER['BATCH_SIZE']<1: raise _invalid_exception('REAPER_BATCH_SIZE')
+if REAPER['MAX_BATCHES']<1: raise _invalid_exception('REAPER_MAX_BATCHES')
+
+
+#_____________WORKER_ASYNC_SETTINGS______________#
+
+WORKER_ASYNC={
+	#YES, the transactions are applied on an asyncio loop with an asyncpg engine (one process, many lists at once)
+	'ENABLED': os.environ.get('WORKER_ASYNC_MODE', 'NO'),
+	#Max transactions lists applied at the same time by each worker process
+	'MAX_IN_FLIGHT': os.environ.get('WORKER_ASYNC_MAX_IN_FLIGHT', '20'),
+	#Connections of the asyncpg pool of each worker process
+	'POOL_SIZE': os.environ.get('WORKER_ASYNC_POOL_SIZE', '10')
+}
+
+#__ENV_TEST____#
+if WORKER_ASYNC['ENABLED'] not in ['YES', 'NO']: raise _invalid_exception('WORKER_ASYNC_MODE')
+if not ExpValidator.is_valid(WORKER_ASYNC['MAX_IN_FLIGHT']): raise _invalid_exception('WORKER_ASYNC_MAX_IN_FLIGHT')
+if not ExpValidator.is_valid(WORKER_ASYNC['POOL_SIZE']): raise _invalid_exception('WORKER_ASYNC_POOL_SIZE')
+WORKER_ASYNC['ENABLED'] = WORKER_ASYNC['ENABLED']=='YES'
+WORKER_ASYNC['MAX_IN_FLIGHT'] = int(WORKER_ASYNC['MAX_IN_FLIGHT'])
+WORKER_ASYNC['POOL_SIZE'] = int(WORKER_ASYNC['POOL_SIZE'])
+if WORKER_ASYNC['MAX_IN_FLIGHT']<1: raise _invalid_exception('WORKER_ASYNC_MAX_IN_FLIGHT')
+if WORKER_ASYNC['POOL_SIZE']<1: raise _invalid_exception('WORKER_ASYNC_POOL_SIZE')
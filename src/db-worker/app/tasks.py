@@ -1,10 +1,24 @@
+import time
+import asyncio
+import threading
+from celery.utils.log import get_task_logger
+from celery_batches import Batches
+from sqlalchemy.exc import DBAPIError
 from .celery import app
-from .database import SessionLocal
+from .settings import WORKER_BATCH, WORKER_ASYNC, AUDIT_LOGS_BUFFER
+from .database import SessionLocal, AsyncSessionLocal
+from .partitions import (maintain_log_partitions as _maintain_log_partitions, split_logs_by_partition,
+	create_missing_log_partitions)
+from .reaper import reap_expired as _reap_expired
+from .cache import publish_group_permissions_committed
 from .cruds import (UserEDIT, RandomEDIT, GroupEDIT, PermissionEDIT, UserPermissionEDIT, 
 	UserGroupEDIT, GroupPermissionEDIT, LogEDIT, SessionEDIT)
 import uuid
 
 
+logger = get_task_logger(__name__)
+
+
 def _create_db_session():
 	db = SessionLocal()
 	try:
@@ -46,65 +60,318 @@ def process_errors(type_error:str, errors:list):
 		msg=msg+'\n'+error
 	print(msg)
 
-#________________CRUD_OPERATIONS____________________________#
-
-def create_object(crud, data:dict):
-	value = crud.validate_create(data)
-	if value: crud.create_object(data)
-	else: process_errors('CREATE_ERROR', crud.get_errors())
-	return value
-		
-def update_object(crud, unique_data:dict, new_data:dict):
-	value = crud.validate_update(new_data) 
-	if value: crud.update_object(unique_data, new_data)
-	else: process_errors('UPDATE_ERROR', crud.get_errors())
-	return value
-
-def delete_object(crud, unique_data):
-	crud.delete_object(unique_data)
-	return True
+#____________________BULK_APPLY_______________________#
+
+class _BulkApplier():
+	"""
+	Groups the transactions by table, the creates on one multi-row INSERT and
+	the deletes on one DELETE ... IN. The tables have not foreign keys, so only
+	the order inside each table is kept.
+	"""
+	def __init__(self, session):
+		self._session = session
+		self._cruds = {}
+		self._groups = []
+		#tablename -> last group of the table
+		self._last_groups = {}
+		self.rows = 0
+
+	def _get_crud(self, tablename):
+		crud = self._cruds.get(tablename)
+		if crud is None:
+			crud_class = select_crud(tablename)
+			if crud_class is None: return None
+			crud = crud_class(self._session)
+			self._cruds[tablename] = crud
+		return crud
+
+	def _add(self, tablename, crud, transaction_type, signature, item):
+		last_group = self._last_groups.get(tablename)
+		if last_group is not None and last_group['type']==transaction_type and last_group['signature']==signature:
+			last_group['items'].append(item)
+			return
+		group = {'crud':crud, 'type':transaction_type, 'signature':signature, 'items':[item]}
+		self._groups.append(group)
+		self._last_groups[tablename] = group
+
+	def add_transactions(self, transactions_list:list):
+		#return False if a transaction is invalid (nothing is applied)
+		for transaction in transactions_list:
+			tablename = transaction['tablename']
+			transaction_type = transaction.get('type')
+			crud = self._get_crud(tablename)
+			if crud is None or transaction_type is None: return False
+
+			# CREATE
+			if transaction_type == 'create':
+				data = transaction['data']
+				if not crud.validate_create(data):
+					process_errors('CREATE_ERROR', crud.get_errors())
+					return False
+				self._add(tablename, crud, 'create', tuple(sorted(data.keys())), data)
 
-def delete_many_objects_by(crud, repeated_data:dict):
-	crud.delete_many_objects_by(repeated_data)
+			# UPDATE
+			elif transaction_type == 'update':
+				if not crud.validate_update(transaction['data']):
+					process_errors('UPDATE_ERROR', crud.get_errors())
+					return False
+				self._add(tablename, crud, 'update', None, (transaction['id'], transaction['data']))
+				self._last_groups[tablename] = None
+
+			# DELETE
+			elif transaction_type == 'delete':
+				self._add(tablename, crud, 'delete', None, transaction['id'])
+
+			# DELETE_MANY_BY
+			elif transaction_type == 'delete_many_by':
+				self._add(tablename, crud, 'delete_many_by', None, transaction['id'])
+				self._last_groups[tablename] = None
+
+			else: return False
+		return True
+
+	def execute(self):
+		for group in self._groups:
+			crud = group['crud']
+			items = group['items']
+			if group['type']=='create': crud.create_objects(items)
+			elif group['type']=='delete': crud.delete_objects(items)
+			elif group['type']=='update':
+				for unique_data, new_data in items: crud.update_object(unique_data, new_data)
+			else:
+				for repeated_data in items: crud.delete_many_objects_by(repeated_data)
+			self.rows+=len(items)
+		self._groups = []
+		self._last_groups = {}
+
+
+def _bulk_apply(session, transactions_lists:list):
+	#return True if all the transactions were applied (the caller commits)
+	applier = _BulkApplier(session)
+	for transactions_list in transactions_lists:
+		if not applier.add_transactions(transactions_list): return False
+	start = time.perf_counter()
+	applier.execute()
+	elapsed = time.perf_counter() - start
+	if applier.rows>0 and elapsed>0:
+		logger.info('applied %d rows in %.4fs (%.0f rows/s)', applier.rows, elapsed, applier.rows/elapsed)
 	return True
 
+
+#____________________AUDIT_LOGS_APPENDER_______________________#
+
+def _append_logs(logs:list):
+	#the valid logs are written with one COPY, apart from the business transactions
+	session = get_db_session()
+	try:
+		crud = LogEDIT(session)
+		columns = [column.name for column in LogEDIT.model_class.__table__.columns]
+		valid_logs = []
+		for log in logs:
+			if crud.validate_create(log): valid_logs.append({column: log.get(column) for column in columns})
+			else: process_errors('CREATE_ERROR', crud.get_errors())
+		valid_logs, out_of_range = split_logs_by_partition(session.connection(), valid_logs)
+		#without the beat the partitions are not created ahead, the missing ones are created here
+		if len(out_of_range)>0 and len(create_missing_log_partitions(out_of_range))>0:
+			in_range, out_of_range = split_logs_by_partition(session.connection(), out_of_range)
+			valid_logs+=in_range
+		if len(out_of_range)>0:
+			logger.warning('%d logs dropped, no partition for their created dates (out of the retention or too far ahead): %s', len(out_of_range),
+				sorted({str(log['created']) for log in out_of_range}))
+		if len(valid_logs)==0: return
+
+		start = time.perf_counter()
+		try:
+			crud.copy_objects(valid_logs)
+			session.commit()
+		except Exception as ex:
+			#a redelivered message breaks the COPY (duplicated ids), the existing logs are skipped
+			logger.warning('COPY of %d logs failed, inserting them: %s', len(valid_logs), ex)
+			session.rollback()
+			crud.create_objects(valid_logs, ignore_conflicts=True)
+			session.commit()
+		elapsed = time.perf_counter() - start
+		if elapsed>0: logger.info('appended %d logs in %.4fs (%.0f rows/s)', len(valid_logs), elapsed, len(valid_logs)/elapsed)
+	except Exception:
+		session.rollback()
+		raise
+	finally: session.close()
+
+
 #____________________TASKS_________________________#
 
-@app.task(name='process_transactions')
-def process_transactions(transactions_list):
+def _run(function, *args):
+	#function(session, *args) on a new session (on the async applier in async mode), 
+	#the errors are raised to the task, so the late acked messages are redelivered
+	if _async_applier is not None: return _async_applier.apply(function, *args)
 	session = get_db_session()
-	crud_class=None
-	crud=None
-	transaction_type=None
-	setted=False
-
-	for transaction in transactions_list:
-		crud_class = select_crud(transaction['tablename'])
-		transaction_type = transaction.get('type')
-
-		if crud_class is None: break
-		if transaction_type is None: break
-		crud = crud_class(session)
-
-		# CREATE
-		if transaction_type == 'create':
-			setted = create_object(crud, transaction['data'])
-			if not setted: break
-		
-		# UPDATE
-		elif transaction_type == 'update':
-			setted = update_object(crud, transaction['id'], transaction['data'])
-			if not setted: break
-		
-		# DELETE
-		elif transaction_type == 'delete':
-			setted = delete_object(crud, transaction['id'])
-			if not setted: break
-		
-		# DELETE_MANY_BY
-		elif transaction_type == 'delete_many_by':
-			setted = delete_many_objects_by(crud, transaction['id'])
-			if not setted: break
-
-	if setted: session.commit()
-	session.close()
\ No newline at end of file
+	try:
+		#connected before the savepoints, they discard the messages that fail
+		session.connection()
+		function(session, *args)
+	except Exception:
+		session.rollback()
+		raise
+	finally: session.close()
+
+
+def _is_connection_error(ex:Exception):
+	#a lost connection fails all the transactions, the messages are redelivered (not discarded)
+	return isinstance(ex, DBAPIError) and ex.connection_invalidated
+
+
+def _apply_transactions_list(session, transactions_list):
+	if _bulk_apply(session, [transactions_list]): session.commit()
+	else: session.rollback()
+
+
+def _apply_transactions_lists(session, transactions_lists):
+	#the auth-server coalesces the transactions lists of many requests on one message,
+	#all the lists are applied together, if one fails each list is committed (or discarded) alone
+	try:
+		if _bulk_apply(session, transactions_lists):
+			session.commit()
+			return
+	except Exception as ex:
+		if _is_connection_error(ex): raise
+		logger.warning('batch failed, applying the lists one by one: %s', ex)
+	session.rollback()
+
+	for transactions_list in transactions_lists:
+		try: _apply_transactions_list(session, transactions_list)
+		except Exception as ex:
+			if _is_connection_error(ex): raise
+			logger.error('transactions list discarded: %s', ex)
+			session.rollback()
+
+
+def _process_transactions(transactions_list):
+	_run(_apply_transactions_list, transactions_list)
+	publish_group_permissions_committed([transactions_list])
+
+
+def _process_transactions_batch(transactions_lists):
+	_run(_apply_transactions_lists, transactions_lists)
+	publish_group_permissions_committed(transactions_lists)
+
+
+#____________________BATCH_CONSUMER_________________________#
+
+def _apply_savepoint(session, transactions_lists:list):
+	#return True if the transactions were applied, else the savepoint is rolled back
+	savepoint = session.begin_nested()
+	try:
+		if _bulk_apply(session, transactions_lists):
+			savepoint.commit()
+			return True
+	except Exception as ex:
+		if _is_connection_error(ex): raise
+		logger.error('transactions discarded: %s', ex)
+	savepoint.rollback()
+	return False
+
+
+def _apply_messages(session, messages:list):
+	#messages = [transactions_lists], applied in arrival order, one savepoint per message 
+	#(and per list if the message fails), so a bad message does not discard the others
+	for transactions_lists in messages:
+		if _apply_savepoint(session, transactions_lists) or len(transactions_lists)==1: continue
+		for transactions_list in transactions_lists: _apply_savepoint(session, [transactions_list])
+	session.commit()
+
+
+def _process_messages(messages:list):
+	#all the messages of the batch are committed together
+	_run(_apply_messages, messages)
+	publish_group_permissions_committed([transactions_list for transactions_lists in messages
+		for transactions_list in transactions_lists])
+
+
+#____________________ASYNC_MODE_________________________#
+
+class _AsyncApplier():
+	"""
+	Event loop on a background thread of the worker process. The tasks (celery threads pool)
+	submit their work and wait, the loop runs the tasks at the same time on the asyncpg pool.
+	Each task runs the same sync function as the sync mode (session.run_sync), so the
+	messages of a batch are still applied in arrival order on one transaction; only the
+	independent tasks run concurrently. The semaphore bounds the tasks in flight.
+	"""
+	def __init__(self, max_in_flight:int):
+		self._max_in_flight = max_in_flight
+		self._loop = None
+		self._semaphore = None
+		self._lock = threading.Lock()
+
+	def _get_loop(self):
+		#started by the first task, after the worker process is created
+		with self._lock:
+			if self._loop is None:
+				self._loop = asyncio.new_event_loop()
+				threading.Thread(target=self._loop.run_forever, name='async_applier', daemon=True).start()
+			return self._loop
+
+	async def _apply(self, function, args:tuple):
+		#the sync cruds run on the async session, asyncpg executes the statements
+		if self._semaphore is None: self._semaphore = asyncio.Semaphore(self._max_in_flight)
+		async with self._semaphore:
+			async with AsyncSessionLocal() as session:
+				try: 
+					await session.connection()
+					await session.run_sync(function, *args)
+				except Exception:
+					await session.rollback()
+					raise
+
+	def apply(self, function, *args):
+		#blocks the task thread until function(session, *args) is applied, the errors are raised
+		future = asyncio.run_coroutine_threadsafe(self._apply(function, args), self._get_loop())
+		future.result()
+
+
+_async_applier = None
+if WORKER_ASYNC['ENABLED']: _async_applier = _AsyncApplier(WORKER_ASYNC['MAX_IN_FLIGHT'])
+
+
+#____________________REGISTER_TASKS_________________________#
+
+if WORKER_BATCH['MAX_SIZE']>1:
+	#the messages are buffered and acked after the commit
+	_batch_options={'base':Batches, 'flush_every':WORKER_BATCH['MAX_SIZE'], 
+		'flush_interval':WORKER_BATCH['MAX_DELAY']/1000, 'acks_late':True}
+
+	@app.task(name='process_transactions', **_batch_options)
+	def process_transactions(requests):
+		_process_messages([[request.args[0]] for request in requests])
+
+	@app.task(name='process_transactions_batch', **_batch_options)
+	def process_transactions_batch(requests):
+		_process_messages([request.args[0] for request in requests])
+
+else:
+	@app.task(name='process_transactions')
+	def process_transactions(transactions_list):
+		_process_transactions(transactions_list)
+
+	@app.task(name='process_transactions_batch')
+	def process_transactions_batch(transactions_lists):
+		_process_transactions_batch(transactions_lists)
+
+
+#the audit logs messages are buffered and acked after the commit (also in async mode, with the sync engine)
+@app.task(name='append_logs', base=Batches, flush_every=AUDIT_LOGS_BUFFER['MAX_SIZE'],
+	flush_interval=AUDIT_LOGS_BUFFER['MAX_DELAY']/1000, acks_late=True)
+def append_logs(requests):
+	_append_logs([log for request in requests for log in request.args[0]])
+
+
+#____________________PERIODIC_TASKS_________________________#
+
+@app.task(name='maintain_log_partitions')
+def maintain_log_partitions():
+	_maintain_log_partitions()
+
+@app.task(name='reap_expired')
+def reap_expired():
+	#{tablename: rows deleted}
+	return _reap_expired()
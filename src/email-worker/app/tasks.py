@@ -4,33 +4,62 @@ import time
 import smtplib
 
 
-def _send_email(to:str, subject:str, message:str):
+def _connect():
+	#smtp connection logged on outlook
+	server = smtplib.SMTP('imap-mail.outlook.com', 587)
+	try:
+		server.ehlo()
+		server.starttls()
+		server.ehlo()    
+		server.login(EMAIL['email'],EMAIL['password'])
+	except Exception:
+		server.close()
+		raise
+	return server
 
-	# Outlook
+
+def _send_emails(emails:list):
+	#emails = [(to, subject, message), ...], all sended on the same smtp connection
+	#an email error does not stop the others, a lost connection is opened again
 	email_user = EMAIL['email']
-	email_password = EMAIL['password']
+	server = None
+	try:
+		for index, (to, subject, message) in enumerate(emails):
+			email_text = "From: "+email_user+"\n"
+			email_text+="To: "+to+"\n"
+			email_text+= "Subject: "+subject+"\n"
+			email_text+= "\n"+message
 
-	email_text = "From: "+email_user+"\n"
-	email_text+="To: "+to+"\n"
-	email_text+= "Subject: "+subject+"\n"
-	email_text+= "\n"+message
+			#second attempt only if the connection was lost
+			for attempt in range(2):
+				if server is None:
+					try: server = _connect()
+					except OSError:
+						print('Email connection error! ('+str(len(emails)-index)+' emails not sended)')
+						return
+				try: 
+					server.sendmail(email_user,to,email_text)
+					break
+				except smtplib.SMTPServerDisconnected: pass
+				except smtplib.SMTPRecipientsRefused: 
+					print('Email refused: '+to)
+					break
+				except smtplib.SMTPException as ex:
+					print('Email error: '+to+' ('+str(ex)+')')
+					break
+				#network error (smtplib.SMTPException is an OSError)
+				except OSError: pass
+				server.close()
+				server = None
+			else: print('Email connection lost: '+to)
+	finally:
+		if server is not None:
+			try: server.quit()
+			except OSError: server.close()
 
-	#send email by outlook smtp
-	try:
-		server = smtplib.SMTP('imap-mail.outlook.com', 587)
-		try:
-			server.ehlo()
-			server.starttls()
-			server.ehlo()    
-			server.login(email_user,email_password)
-        
-			server.sendmail(email_user,to,email_text)
-		except smtplib.SMTPException:
-			print('Email connection error!')
-		finally:
-			server.quit()
-	except Exception:
-		print('Network error!')
+
+def _send_email(to:str, subject:str, message:str):
+	_send_emails([(to, subject, message)])
 
 
 #_______________TASKS_________________________________#
@@ -47,6 +76,12 @@ def send_signup_email(to, random_code, data_dict):
 	_send_email(to,'Signup CODE',message)
 
 
+@app.task(name='send_signup_emails')
+def send_signup_emails(emails):
+	#emails = [[to, random_code], ...]
+	_send_emails([(to,'Signup CODE',"Your signup code is: "+random_code) for to, random_code in emails])
+
+
 @app.task(name='send_password_forget_email')
 def send_password_forget_email(to, random_code, data_dict):
 	message = "Your restaure password CODE is: "+random_code